@@ -1,10 +1,15 @@
 import typing as t
 from math import isclose
 import logging
-import time
 import csv
 from pathlib import Path
+import pandas as pd
 from .utils import convert_date
+from .amortissement import tableau_amortissements
+from .cloture import ecritures_ouverture
+from .partage import journal_partage
+from .schema import COLONNES, lire_journal, records_journal
+from .stockage import Stockage
 
 
 logging.basicConfig(level=logging.INFO)
@@ -40,9 +45,18 @@ class Immobilisation(t.TypedDict):
     montant: float
     durée: float
     date: str
+    mode: t.NotRequired[str]
+    cession: t.NotRequired[str]
     amortissement: t.NotRequired[dict[int, float]]
 
 
+class Subvention(t.TypedDict):
+    compte: str
+    intitulé: str
+    montant: float
+    immobilisation: str
+
+
 def load_operations(operations: list[Path]) -> list[Operation]:
     """
     Charge les opérations depuis les fichiers CSV
@@ -94,37 +108,47 @@ def load_immobilisations(immobilisations: list[Path]) -> list[Immobilisation]:
                 "durée": float(row["durée"]),
                 "date": str(row["date"]),
             }
-            immo["amortissement"] = build_amortissement(immo)
+            # Colonnes facultatives
+            if row.get("mode"):
+                immo["mode"] = str(row["mode"])
+            if row.get("cession"):
+                immo["cession"] = str(row["cession"])
             rows.append(immo)
 
     return rows
 
 
-def build_amortissement(immobilisation: Immobilisation) -> dict[int, float]:
+def load_subventions(subventions: list[Path]) -> list[Subvention]:
     """
-    Construit le tableau d'amortissement d'une immobilisation.
-    Retourn un dictionnaire avec les années en clé et les dotations en valeur.
+    Charge les subventions d'investissement depuis les fichiers CSV.
+    La colonne immobilisation donne le compte de l'immobilisation financée.
     """
-    amortissement = {}
-    montant = immobilisation["montant"]
-    durée = int(immobilisation["durée"])
-    taux = 1 / durée
-    annuité = montant * taux
+    rows: list[Subvention] = []
+    for subvention in subventions:
+        for row in load_csv(subvention):
+            rows.append(
+                {
+                    "compte": str(row["compte"]),
+                    "intitulé": str(row["intitulé"]),
+                    "montant": float(row["montant"]),
+                    "immobilisation": str(row["immobilisation"]),
+                }
+            )
+    return rows
 
-    # Pour l'année 1, on amortit au pro rata temporis
-    date = time.strptime(immobilisation["date"], "%d/%m/%Y")
-    year = date.tm_year
-    days_in_year = time.strptime(f"{year}-12-31", "%Y-%m-%d").tm_yday
-    days = date.tm_yday
-    amortissement[year] = annuité * (days / days_in_year)
 
-    while montant > 0:
-        dot = min(annuité, montant)
-        montant -= dot
-        year += 1
-        amortissement[year] = dot
+def build_amortissement(immobilisation: Immobilisation) -> dict[int, float]:
+    """
+    Construit le tableau d'amortissement d'une immobilisation.
+    Retourn un dictionnaire avec les années en clé et les dotations en valeur.
 
-    return amortissement
+    Pour plusieurs immobilisations, utiliser tableau_amortissements.
+    """
+    tableau = tableau_amortissements([immobilisation])
+    dotations = tableau.iloc[0]
+    return {
+        int(year): float(dot) for year, dot in dotations.items() if dot > 0
+    }
 
 
 def load_accounts(accounts: list[Path]) -> list[Account]:
@@ -145,10 +169,11 @@ def load_accounts(accounts: list[Path]) -> list[Account]:
 
 
 def update_accounts(
-    accounts: list[Account], records: list[Record]
+    accounts: list[Account], records: t.Union[list[Record], Stockage]
 ) -> list[Account]:
     """
-    Met à jour les comptes avec les opérations
+    Met à jour les comptes avec les opérations (ou les soldes calculés par
+    la base)
     """
     updated_accounts: dict[str, Account] = {}
 
@@ -159,8 +184,12 @@ def update_accounts(
             "solde": 0.0,
         }
 
-    for record in records:
-        compte = record["compte"]
+    if isinstance(records, Stockage):
+        mouvements = list(records.soldes().items())
+    else:
+        mouvements = [(r["compte"], r["débit"] - r["crédit"]) for r in records]
+
+    for compte, mouvement in mouvements:
         if compte not in updated_accounts:
             logger.warning(f"Compte {compte} non trouvé")
             updated_accounts[compte] = {
@@ -168,41 +197,20 @@ def update_accounts(
                 "intitulé": f"Compte {compte}",
                 "solde": 0.0,
             }
-        updated_accounts[compte]["solde"] += record["débit"] - record["crédit"]
+        updated_accounts[compte]["solde"] += mouvement
 
     return list(updated_accounts.values())
 
 
-def ouverture_comptes(accounts: list[Account], year: int) -> list[Record]:
+def ouverture_comptes(
+    accounts: list[Account], year: int, date: t.Optional[str] = None
+) -> list[Record]:
     """
-    Ecrire les opérations d'ouverture des comptes
+    Ecrire les opérations d'ouverture des comptes, au 01/01 ou à la date de
+    début de l'exercice: chaque compte reprend son solde en contrepartie du
+    compte 890
     """
-    records: list[Record] = []
-
-    for account in accounts:
-        # On débite le compte 890
-        records.append(
-            {
-                "date": f"01/01/{year}",
-                "compte": "890",
-                "libellé": "Ouverture des comptes",
-                "débit": account["solde"],
-                "crédit": 0.0,
-            }
-        )
-
-        # On crédite le compte correspondant
-        records.append(
-            {
-                "date": f"01/01/{year}",
-                "compte": account["compte"],
-                "libellé": account["intitulé"],
-                "débit": 0.0,
-                "crédit": account["solde"],
-            }
-        )
-
-    return records
+    return ecritures_ouverture(accounts, date or f"01/01/{year}")
 
 
 def is_immo_corporelle(immobilisation: Immobilisation) -> bool:
@@ -235,34 +243,49 @@ def update_immobilisations(
 
 
 def filter_records_by_account(
-    records: list[Record], account: str
+    records: t.Union[list[Record], Stockage], account: str
 ) -> list[Record]:
     """
     Retourne les opérations du compte
     """
+    if isinstance(records, Stockage):
+        return records.ecritures(account)
     return [r for r in records if r["compte"].startswith(account)]
 
 
 def load_journals(journals: list[Path]) -> list[Record]:
     """
-    Load the journals
+    Load the journals (from the shared journal when the process is attached
+    to one, see partage.py)
     """
+    partage = journal_partage(journals)
+    if partage is not None:
+        return partage.records()
+
     records: list[Record] = []
     for journal in journals:
-        for row in load_csv(journal):
-            records.append(
-                {
-                    "date": convert_date(row["date"]),
-                    "compte": str(row["compte"]),
-                    "libellé": str(row["libellé"]),
-                    "débit": float(row["débit"]),
-                    "crédit": float(row["crédit"]),
-                }
-            )
+        records += records_journal(lire_journal(journal))
 
     return records
 
 
+def load_journals_frame(journals: list[Path]) -> pd.DataFrame:
+    """
+    Ecritures des journaux en colonnes (date, compte, libellé, débit,
+    crédit), sans passer par une liste d'écritures. Dans un processus
+    attaché à un journal partagé, les montants sont lus sans copie.
+    """
+    partage = journal_partage(journals)
+    if partage is not None:
+        return partage.frame()
+    if not journals:
+        return pd.DataFrame(columns=COLONNES)
+    return pd.concat(
+        [lire_journal(journal)[COLONNES] for journal in journals],
+        ignore_index=True,
+    )
+
+
 def filter_accounts_by_class(accounts: list[Account], classe: int):
     """
     Filter the accounts by classe
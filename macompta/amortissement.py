@@ -0,0 +1,549 @@
+"""
+Moteur de calcul des plans d'amortissement.
+
+Les plans de toutes les immobilisations sont calculés en une seule fois,
+sous la forme d'une matrice immobilisation x année des dotations.
+"""
+import typing as t
+import hashlib
+import json
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+if t.TYPE_CHECKING:
+    from . import Immobilisation
+
+
+logger = logging.getLogger(__name__)
+
+LINEAIRE = "linéaire"
+DEGRESSIF = "dégressif"
+
+# Champs dont dépend le plan d'amortissement d'une immobilisation
+CHAMPS_PLAN = ("montant", "durée", "date", "mode", "cession")
+
+
+def coefficients_degressifs(durée: np.ndarray) -> np.ndarray:
+    """
+    Coefficients fiscaux de l'amortissement dégressif selon la durée.
+    Les durées inférieures à 3 ans ne sont pas éligibles (coefficient 0).
+    """
+    return np.select(
+        [durée >= 7, durée >= 5, durée >= 3], [2.25, 1.75, 1.25], 0.0
+    )
+
+
+def tableau_amortissements(
+    immobilisations: list["Immobilisation"],
+) -> pd.DataFrame:
+    """
+    Construit les plans d'amortissement de toutes les immobilisations.
+
+    Le mode linéaire est calculé au prorata temporis en jours, le mode
+    dégressif au prorata en mois. L'année de cession, la dotation est
+    calculée jusqu'à la date de cession, et nulle ensuite.
+
+    Retourne un DataFrame avec les comptes d'immobilisation en index, les
+    années en colonnes et les dotations en valeur.
+    """
+    if not immobilisations:
+        return pd.DataFrame(index=pd.Index([], name="compte"), dtype=float)
+
+    immos = pd.DataFrame(immobilisations)
+    montant = immos["montant"].to_numpy(dtype=float)
+    durée = immos["durée"].to_numpy(dtype=float).astype(int)
+    mode = immos.get("mode", pd.Series(LINEAIRE, index=immos.index))
+    mode = mode.fillna(LINEAIRE).replace("", LINEAIRE).to_numpy()
+    debut = pd.to_datetime(immos["date"], format="%d/%m/%Y")
+    cession = pd.to_datetime(
+        immos.get("cession", pd.Series(None, index=immos.index)).replace(
+            "", None
+        ),
+        format="%d/%m/%Y",
+    )
+
+    coefficient = coefficients_degressifs(durée)
+    degressif = (mode == DEGRESSIF) & (coefficient > 0)
+    if ((mode != LINEAIRE) & (mode != DEGRESSIF)).any():
+        raise ValueError(f"Mode d'amortissement inconnu: {set(mode)}")
+
+    # Années couvertes par les plans
+    annee_debut = debut.dt.year.to_numpy()
+    annee_cession = cession.dt.year.fillna(np.inf).to_numpy()
+    annees = np.arange(annee_debut.min(), (annee_debut + durée).max() + 1)
+    k = annees[None, :] - annee_debut[:, None]
+
+    # Fraction de chaque année pendant laquelle le bien est détenu:
+    # en jours pour le linéaire, en mois pour le dégressif
+    jours_annee = np.where(debut.dt.is_leap_year, 366.0, 365.0)
+    jours_cession = np.where(cession.dt.is_leap_year, 366.0, 365.0)
+    entree = np.where(
+        degressif,
+        (13 - debut.dt.month.to_numpy()) / 12,
+        (jours_annee - debut.dt.dayofyear.to_numpy() + 1) / jours_annee,
+    )
+    sortie = np.where(
+        degressif,
+        cession.dt.month.to_numpy() / 12,
+        cession.dt.dayofyear.to_numpy() / jours_cession,
+    )
+    meme_annee = annee_cession == annee_debut
+    sortie = np.where(meme_annee, sortie - (1 - entree), sortie)
+    entree = np.where(meme_annee, sortie, entree)
+
+    k_cession = (annee_cession - annee_debut)[:, None]
+    detention = np.where(k == 0, entree[:, None], 1.0)
+    detention = np.where(k == k_cession, sortie[:, None], detention)
+    detention[(k < 0) | (k > k_cession)] = 0.0
+
+    # Linéaire: le cumul progresse de l'annuité au prorata, plafonné
+    annuite = montant / durée
+    cumul = np.minimum(
+        montant[:, None], annuite[:, None] * detention.cumsum(axis=1)
+    )
+    lineaire = np.diff(cumul, axis=1, prepend=0.0)
+
+    # Dégressif: la valeur nette décroît géométriquement jusqu'à ce que le
+    # linéaire sur la durée restante dépasse le taux dégressif
+    taux = np.divide(
+        coefficient, durée, out=np.zeros(len(durée)), where=degressif
+    )
+    inverse = np.divide(
+        durée, coefficient, out=np.zeros(len(durée)), where=degressif
+    )
+    bascule = np.maximum(1, np.ceil(durée - inverse)).astype(int)[:, None]
+    premiere = 1 - taux * entree
+    exposant = np.clip(k, 1, bascule) - 1
+    vnc = np.where(
+        k <= 0,
+        montant[:, None],
+        (montant * premiere)[:, None] * (1 - taux[:, None]) ** exposant,
+    )
+    reste = np.maximum(durée[:, None] - bascule, 1)
+    base = np.where(k < bascule, vnc * taux[:, None], vnc / reste)
+    base[k >= durée[:, None]] = 0.0
+    degressive = base * detention
+
+    dotations = np.where(degressif[:, None], degressive, lineaire)
+
+    return pd.DataFrame(
+        dotations,
+        index=pd.Index(immos["compte"].to_numpy(), name="compte"),
+        columns=annees,
+    )
+
+
+def cle_plan(immobilisation: "Immobilisation") -> str:
+    """
+    Empreinte des champs dont dépend le plan d'amortissement
+    """
+    champs = {
+        champ: immobilisation.get(champ) or None for champ in CHAMPS_PLAN
+    }
+    champs["montant"] = float(immobilisation["montant"])
+    champs["durée"] = float(immobilisation["durée"])
+    if champs["mode"] == LINEAIRE:
+        champs["mode"] = None
+    contenu = json.dumps(champs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenu.encode("utf-8")).hexdigest()
+
+
+def load_cache(cache: Path) -> pd.DataFrame:
+    """
+    Charge le cache des plans d'amortissement (une ligne par empreinte)
+    """
+    if not cache.exists():
+        return pd.DataFrame(index=pd.Index([], name="cle"), dtype=float)
+    plans = pd.read_csv(cache, index_col="cle")
+    plans.columns = plans.columns.astype(int)
+    return plans
+
+
+def tableau_amortissements_cache(
+    immobilisations: list["Immobilisation"], cache: Path | None
+) -> pd.DataFrame:
+    """
+    Comme tableau_amortissements, mais les plans sont conservés sur disque,
+    indexés par l'empreinte de chaque immobilisation. Seules les
+    immobilisations nouvelles ou modifiées sont recalculées, et les plans
+    des empreintes absentes du registre sont retirés du cache.
+    """
+    if cache is None:
+        return tableau_amortissements(immobilisations)
+
+    cles = [cle_plan(immo) for immo in immobilisations]
+    plans = load_cache(cache)
+    manquantes = {
+        cle: immo
+        for cle, immo in zip(cles, immobilisations)
+        if cle not in plans.index
+    }
+    logger.info(
+        f"Plans d'amortissement en cache: {len(cles) - len(manquantes)}, "
+        f"à calculer: {len(manquantes)}"
+    )
+
+    obsoletes = plans.index.difference(cles)
+    if manquantes:
+        nouveaux = tableau_amortissements(list(manquantes.values()))
+        nouveaux.index = pd.Index(list(manquantes), name="cle")
+        plans = pd.concat([plans, nouveaux]).fillna(0.0)
+        plans = plans.reindex(columns=sorted(plans.columns))
+    if manquantes or len(obsoletes):
+        plans.drop(obsoletes).to_csv(cache, index_label="cle")
+
+    tableau = plans.reindex(cles)
+    tableau = tableau.loc[:, (tableau != 0).any(axis=0)]
+    tableau.index = pd.Index(
+        [immo["compte"] for immo in immobilisations], name="compte"
+    )
+    return tableau
+
+
+def annees_sortie(
+    immobilisations: list["Immobilisation"], tableau: pd.DataFrame
+) -> pd.Series:
+    """
+    Année à laquelle chaque immobilisation sort du bilan: l'année de cession,
+    ou à défaut l'année d'acquisition plus la durée d'amortissement (même si
+    la dernière dotation tombe l'année d'avant, pour une acquisition au 1er
+    janvier).
+    """
+    acquisition = pd.to_datetime(
+        pd.Series([i["date"] for i in immobilisations]), format="%d/%m/%Y"
+    ).dt.year
+    durees = pd.Series([int(i["durée"]) for i in immobilisations])
+    cession = pd.to_datetime(
+        pd.Series([i.get("cession") or None for i in immobilisations]),
+        format="%d/%m/%Y",
+    ).dt.year
+    sortie = cession.fillna(acquisition + durees).astype(int)
+    return pd.Series(sortie.to_numpy(), index=tableau.index, name="sortie")
+
+
+def dates_sortie(
+    immobilisations: list["Immobilisation"], tableau: pd.DataFrame
+) -> pd.Series:
+    """
+    Date à laquelle chaque immobilisation sort du bilan: la date de cession,
+    ou à défaut le 31/12 de l'année de sortie (voir annees_sortie)
+    """
+    fins = pd.to_datetime(
+        annees_sortie(immobilisations, tableau).astype(str) + "-12-31"
+    )
+    cession = pd.to_datetime(
+        pd.Series(
+            [i.get("cession") or None for i in immobilisations],
+            index=tableau.index,
+        ),
+        format="%d/%m/%Y",
+    )
+    return cession.fillna(fins).rename("sortie")
+
+
+def repartir_periode(
+    immobilisations: list["Immobilisation"],
+    plans: pd.DataFrame,
+    du: pd.Timestamp,
+    au: pd.Timestamp,
+) -> pd.Series:
+    """
+    Part des plans annuels (dotations, ou quote-parts de subventions, une
+    ligne par immobilisation) qui tombe entre du et au inclus. Le montant
+    d'une année est réparti sur les jours de cette année où l'immobilisation
+    est amortie: de l'acquisition à la cession ou à la fin du plan. Les
+    montants sont arrondis au centime.
+    """
+    if not immobilisations:
+        return pd.Series(0.0, index=plans.index)
+
+    annees = plans.columns.to_numpy(dtype=int)
+    janviers = pd.to_datetime(annees.astype(str), format="%Y")
+    decembres = janviers + pd.offsets.YearEnd(0)
+    dates = pd.to_datetime(
+        pd.Series([i["date"] for i in immobilisations]), format="%d/%m/%Y"
+    )
+    durees = [int(i["durée"]) for i in immobilisations]
+    fins_plan = pd.Series(
+        [d + pd.DateOffset(years=n, days=-1) for d, n in zip(dates, durees)]
+    )
+    cessions = pd.to_datetime(
+        pd.Series([i.get("cession") or None for i in immobilisations]),
+        format="%d/%m/%Y",
+    )
+    fins = cessions.fillna(fins_plan).clip(upper=fins_plan)
+
+    # Jours amortis de chaque année, et ceux qui tombent dans la période
+    un_jour = np.timedelta64(1, "D")
+    debut = np.maximum(janviers.to_numpy()[None, :], dates.to_numpy()[:, None])
+    fin = np.minimum(decembres.to_numpy()[None, :], fins.to_numpy()[:, None])
+    jours = np.maximum((fin - debut) / un_jour + 1, 0)
+    debut = np.maximum(debut, du.to_datetime64())
+    fin = np.minimum(fin, au.to_datetime64())
+    dans = np.maximum((fin - debut) / un_jour + 1, 0)
+    part = np.divide(dans, jours, out=np.zeros_like(jours), where=jours > 0)
+
+    # Au centime, comme les soldes de clôture (voir cloturer)
+    montants = np.round((plans.to_numpy() * part).sum(axis=1), 2)
+    return pd.Series(montants, index=plans.index)
+
+
+def compte_amortissement(compte: str) -> str:
+    """
+    Compte d'amortissement d'une immobilisation (on insert un 8 en 2ème
+    position)
+    """
+    return f"28{compte[2:]}"
+
+
+def prevision_dotations(
+    immobilisations: list["Immobilisation"],
+    annee: int,
+    horizon: int,
+    cache: Path | None = None,
+) -> pd.DataFrame:
+    """
+    Plan de dotations prévisionnel: dotations et valeurs nettes comptables
+    de chaque immobilisation pour les années annee à annee + horizon - 1.
+
+    Les acquisitions prévues sont simplement ajoutées aux immobilisations.
+
+    Retourne un DataFrame indexé par (compte, compte d'amortissement) avec
+    des colonnes (dotation|vnc, année).
+    """
+    annees = np.arange(annee, annee + horizon)
+    tableau = tableau_amortissements_cache(immobilisations, cache)
+    sorties = annees_sortie(immobilisations, tableau).to_numpy()
+
+    # Cumul des dotations jusqu'à la fin de chaque année
+    toutes = np.union1d(tableau.columns.to_numpy(), annees)
+    tableau = tableau.reindex(columns=toutes, fill_value=0.0)
+    cumul = tableau.cumsum(axis=1)[annees].to_numpy()
+    montants = np.array([immo["montant"] for immo in immobilisations])
+
+    # La valeur nette n'est au bilan qu'entre l'acquisition et la sortie
+    acquisitions = np.array(
+        [int(immo["date"][-4:]) for immo in immobilisations]
+    )
+    vnc = montants[:, None] - cumul
+    vnc[annees[None, :] >= sorties[:, None]] = 0.0
+    vnc[annees[None, :] < acquisitions[:, None]] = 0.0
+
+    comptes = [immo["compte"] for immo in immobilisations]
+    index = pd.MultiIndex.from_arrays(
+        [comptes, [compte_amortissement(c) for c in comptes]],
+        names=["compte", "compte_amortissement"],
+    )
+    return pd.concat(
+        {
+            "dotation": pd.DataFrame(
+                tableau[annees].to_numpy(), index=index, columns=annees
+            ),
+            "vnc": pd.DataFrame(vnc, index=index, columns=annees),
+        },
+        axis=1,
+    )
+
+
+class TestTableauAmortissements(unittest.TestCase):
+    def test_lineaire(self):
+        tableau = tableau_amortissements(
+            [
+                {
+                    "compte": "218301",
+                    "intitulé": "PC",
+                    "montant": 3650.0,
+                    "durée": 3,
+                    "date": "01/07/2021",
+                }
+            ]
+        )
+        # 184 jours sur 365 la première année, le solde la dernière
+        dotations = tableau.loc["218301"]
+        self.assertAlmostEqual(dotations[2021], 1216.67 * 184 / 365, 1)
+        self.assertAlmostEqual(dotations[2022], 1216.67, 1)
+        self.assertAlmostEqual(dotations.sum(), 3650.0)
+        self.assertEqual(list(tableau.columns), [2021, 2022, 2023, 2024])
+
+    def test_degressif(self):
+        tableau = tableau_amortissements(
+            [
+                {
+                    "compte": "215501",
+                    "intitulé": "Machine",
+                    "montant": 10000.0,
+                    "durée": 5,
+                    "date": "01/01/2021",
+                    "mode": DEGRESSIF,
+                }
+            ]
+        )
+        # Taux de 35%, bascule en linéaire sur les deux dernières années
+        dotations = tableau.loc["215501"].tolist()
+        expected = [3500.0, 2275.0, 1478.75, 1373.125, 1373.125, 0.0]
+        for dotation, attendu in zip(dotations, expected):
+            self.assertAlmostEqual(dotation, attendu)
+
+    def test_cession(self):
+        immo = {
+            "compte": "205001",
+            "intitulé": "Logiciel",
+            "montant": 1000.0,
+            "durée": 2,
+            "date": "01/01/2021",
+            "cession": "30/06/2022",
+        }
+        tableau = tableau_amortissements([immo])
+        dotations = tableau.loc["205001"]
+        self.assertAlmostEqual(dotations[2022], 500.0 * 181 / 365)
+        self.assertEqual(dotations[2023], 0.0)
+        self.assertEqual(annees_sortie([immo], tableau).iloc[0], 2022)
+
+    def test_annees_sortie(self):
+        immos = [
+            {
+                "compte": "218301",
+                "intitulé": "PC",
+                "montant": 3000.0,
+                "durée": 3,
+                "date": "01/01/2020",
+            },
+            {
+                "compte": "218302",
+                "intitulé": "Ecran",
+                "montant": 365.0,
+                "durée": 2,
+                "date": "01/07/2020",
+            },
+        ]
+        tableau = tableau_amortissements(immos)
+        # Le PC est amorti en 2022 mais ne sort du bilan qu'en 2023
+        self.assertEqual(tableau.loc["218301", 2023], 0.0)
+        self.assertEqual(annees_sortie(immos, tableau).tolist(), [2023, 2022])
+
+    def test_repartir_periode(self):
+        immos = [
+            {
+                "compte": "218301",
+                "intitulé": "PC",
+                "montant": 3650.0,
+                "durée": 3,
+                "date": "01/07/2021",
+            }
+        ]
+        tableau = tableau_amortissements(immos)
+
+        def dotation(du: str, au: str) -> float:
+            debut = pd.to_datetime(du, format="%d/%m/%Y")
+            fin = pd.to_datetime(au, format="%d/%m/%Y")
+            return repartir_periode(immos, tableau, debut, fin).iloc[0]
+
+        # Clôture trimestrielle: 90 jours sur 365 de la dotation 2022
+        self.assertAlmostEqual(
+            dotation("01/01/2022", "31/03/2022"),
+            round(tableau.loc["218301", 2022] * 90 / 365, 2),
+        )
+        # Pas de dotation avant l'acquisition
+        self.assertEqual(dotation("01/01/2021", "30/06/2021"), 0.0)
+        self.assertAlmostEqual(
+            dotation("01/07/2021", "31/12/2021"),
+            round(tableau.loc["218301", 2021], 2),
+        )
+        # Le solde de 2024 couvre les jours jusqu'au 30/06/2024
+        self.assertAlmostEqual(
+            dotation("01/01/2024", "30/06/2024"),
+            round(tableau.loc["218301", 2024], 2),
+        )
+        trimestres = [
+            ("01/01/2022", "31/03/2022"),
+            ("01/04/2022", "30/06/2022"),
+            ("01/07/2022", "30/09/2022"),
+            ("01/10/2022", "31/12/2022"),
+        ]
+        # Au centime près, par trimestre
+        self.assertAlmostEqual(
+            sum(dotation(du, au) for du, au in trimestres),
+            tableau.loc["218301", 2022],
+            delta=0.02,
+        )
+        self.assertAlmostEqual(
+            dotation("01/01/2021", "31/12/2030"), immos[0]["montant"]
+        )
+
+    def test_cache(self):
+        immos = [
+            {
+                "compte": "205001",
+                "intitulé": "Logiciel",
+                "montant": 1000.0,
+                "durée": 2,
+                "date": "01/01/2021",
+            },
+            {
+                "compte": "215501",
+                "intitulé": "Machine",
+                "montant": 10000.0,
+                "durée": 5,
+                "date": "01/01/2021",
+                "mode": DEGRESSIF,
+            },
+        ]
+        attendu = tableau_amortissements(immos)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = Path(tmpdir) / "plans.csv"
+            tableau_amortissements_cache(immos[:1], cache)
+            tableau = tableau_amortissements_cache(immos, cache)
+            self.assertEqual(len(load_cache(cache)), 2)
+
+            # Une modification du montant change l'empreinte, et l'ancien
+            # plan est retiré du cache
+            ancienne = cle_plan(immos[0])
+            immos[0] = {**immos[0], "montant": 2000.0}
+            modifie = tableau_amortissements_cache(immos, cache)
+            plans = load_cache(cache)
+            self.assertEqual(len(plans), 2)
+            self.assertNotIn(ancienne, plans.index)
+
+        # Les années sans aucune dotation ne sont pas reprises du cache
+        pd.testing.assert_frame_equal(tableau, attendu[tableau.columns])
+        self.assertEqual(attendu.drop(columns=tableau.columns).sum().sum(), 0)
+        self.assertAlmostEqual(modifie.loc["205001", 2021], 1000.0)
+
+    def test_prevision_dotations(self):
+        immos = [
+            {
+                "compte": "205001",
+                "intitulé": "Logiciel",
+                "montant": 1000.0,
+                "durée": 2,
+                "date": "01/01/2021",
+            },
+            # Acquisition prévue
+            {
+                "compte": "218301",
+                "intitulé": "PC",
+                "montant": 3000.0,
+                "durée": 3,
+                "date": "01/01/2023",
+            },
+        ]
+        prevision = prevision_dotations(immos, 2022, 3)
+
+        self.assertEqual(
+            prevision.loc["205001"]["dotation"].values.tolist(),
+            [[500.0, 0.0, 0.0]],
+        )
+        self.assertEqual(
+            prevision.loc["218301"]["vnc"].values.tolist(),
+            [[0.0, 2000.0, 1000.0]],
+        )
+        # Le logiciel est totalement amorti et sort du bilan en 2022
+        self.assertEqual(prevision.loc["205001"]["vnc"].values.sum(), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
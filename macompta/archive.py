@@ -0,0 +1,222 @@
+"""
+Archive Parquet des journaux, partitionnée par année et par classe de
+compte (annee=2021/classe=4/...), une archive par entité.
+
+Les lectures filtrent par période et par préfixes de comptes: les
+partitions hors de la période ou des classes demandées ne sont pas
+ouvertes, et dans les fichiers lus, les groupes de lignes sont écartés sur
+les statistiques (min/max) des colonnes date et compte. Seules les
+colonnes demandées sont lues.
+
+L'archive nécessite pyarrow (pip install pyarrow), qui n'est pas une
+dépendance du projet.
+"""
+import typing as t
+import tempfile
+import unittest
+from pathlib import Path
+import pandas as pd
+from .mapping import FIN
+from .schema import COLONNES, records_journal
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None  # type: ignore[assignment]
+
+if t.TYPE_CHECKING:
+    from . import Record
+
+PARTITIONS = ["annee", "classe"]
+
+# Lignes par groupe: les statistiques min/max sont tenues par groupe
+LIGNES_PAR_GROUPE = 64_000
+
+
+def _pyarrow():
+    if pa is None:
+        raise ImportError(
+            "L'archive Parquet nécessite pyarrow (pip install pyarrow)"
+        )
+
+
+def _schema() -> "pa.Schema":
+    return pa.schema(
+        [
+            ("date", pa.date32()),
+            ("compte", pa.string()),
+            ("libellé", pa.string()),
+            ("débit", pa.float64()),
+            ("crédit", pa.float64()),
+            ("annee", pa.int32()),
+            ("classe", pa.string()),
+        ]
+    )
+
+
+def _batch(journal: pd.DataFrame) -> "pa.RecordBatch":
+    """
+    Bloc d'écritures (colonnes du journal) avec ses colonnes de partition,
+    trié par compte et par date pour resserrer les statistiques
+    """
+    dates = pd.to_datetime(journal["date"], format="%d/%m/%Y")
+    df = pd.DataFrame(
+        {
+            "date": dates.dt.date,
+            "compte": journal["compte"].astype(str),
+            "libellé": journal["libellé"].astype(str),
+            "débit": journal["débit"].astype(float),
+            "crédit": journal["crédit"].astype(float),
+            "annee": dates.dt.year.astype("int32"),
+            "classe": journal["compte"].astype(str).str[:1],
+        }
+    )
+    df = df.sort_values(["compte", "date"], kind="stable")
+    return pa.RecordBatch.from_pandas(
+        df, schema=_schema(), preserve_index=False
+    )
+
+
+def ecrire_archive(
+    blocs: t.Iterable[pd.DataFrame], dossier: t.Union[Path, str]
+) -> None:
+    """
+    Ecrit des blocs d'écritures (colonnes du journal, voir blocs_journal)
+    dans l'archive. Les partitions (année, classe) présentes dans les blocs
+    sont remplacées, les autres sont gardées.
+    """
+    _pyarrow()
+    ds.write_dataset(
+        (_batch(bloc) for bloc in blocs),
+        str(dossier),
+        schema=_schema(),
+        format="parquet",
+        partitioning=PARTITIONS,
+        partitioning_flavor="hive",
+        existing_data_behavior="delete_matching",
+        max_rows_per_group=LIGNES_PAR_GROUPE,
+        min_rows_per_group=min(LIGNES_PAR_GROUPE, 10_000),
+    )
+
+
+def filtre(
+    du: t.Optional[pd.Timestamp] = None,
+    au: t.Optional[pd.Timestamp] = None,
+    prefixes: t.Sequence[str] = (),
+) -> t.Optional["ds.Expression"]:
+    """
+    Filtre sur les partitions (année, classe) et sur les colonnes date et
+    compte (statistiques des groupes de lignes)
+    """
+    conditions = []
+    if du is not None:
+        conditions += [
+            ds.field("annee") >= du.year,
+            ds.field("date") >= pa.scalar(du.date(), pa.date32()),
+        ]
+    if au is not None:
+        conditions += [
+            ds.field("annee") <= au.year,
+            ds.field("date") <= pa.scalar(au.date(), pa.date32()),
+        ]
+    if prefixes:
+        classes = sorted({p[:1] for p in prefixes})
+        comptes = None
+        for prefixe in prefixes:
+            intervalle = (ds.field("compte") >= prefixe) & (
+                ds.field("compte") < prefixe + FIN
+            )
+            comptes = intervalle if comptes is None else comptes | intervalle
+        conditions += [ds.field("classe").isin(classes), comptes]
+
+    expression = None
+    for condition in conditions:
+        expression = (
+            condition if expression is None else expression & condition
+        )
+    return expression
+
+
+def lire_archive(
+    dossier: t.Union[Path, str],
+    du: t.Optional[pd.Timestamp] = None,
+    au: t.Optional[pd.Timestamp] = None,
+    prefixes: t.Sequence[str] = (),
+    colonnes: t.Sequence[str] = COLONNES,
+) -> pd.DataFrame:
+    """
+    Ecritures de l'archive entre du et au, des comptes commençant par l'un
+    des préfixes, triées par date puis par compte (colonnes du journal,
+    dates JJ/MM/AAAA)
+    """
+    _pyarrow()
+    archive = ds.dataset(
+        str(dossier), format="parquet", partitioning="hive", schema=_schema()
+    )
+    table = archive.to_table(
+        columns=list(colonnes), filter=filtre(du, au, prefixes)
+    )
+    ordre = [(c, "ascending") for c in ["date", "compte"] if c in colonnes]
+    if ordre:
+        table = table.sort_by(ordre)
+    if "date" in colonnes:
+        table = table.set_column(
+            table.schema.get_field_index("date"),
+            "date",
+            pc.strftime(table["date"], format="%d/%m/%Y"),
+        )
+    df = table.to_pandas()
+    return df.reset_index(drop=True)
+
+
+def records_archive(
+    dossier: t.Union[Path, str],
+    du: t.Optional[pd.Timestamp] = None,
+    au: t.Optional[pd.Timestamp] = None,
+    prefixes: t.Sequence[str] = (),
+) -> list["Record"]:
+    """
+    Ecritures de l'archive, comme load_journals
+    """
+    return records_journal(lire_archive(dossier, du, au, prefixes))
+
+
+@unittest.skipIf(pa is None, "pyarrow n'est pas installé")
+class TestArchive(unittest.TestCase):
+    def test_archive(self):
+        journal = pd.DataFrame(
+            {
+                "date": ["01/01/2021", "01/01/2021", "15/06/2021"]
+                + ["02/01/2022", "02/01/2022"],
+                "compte": ["512", "101", "411", "411", "706"],
+                "libellé": ["Apport", "Apport", "Client", "Vente", "Vente"],
+                "débit": [1000.0, 0.0, 50.0, 200.0, 0.0],
+                "crédit": [0.0, 1000.0, 0.0, 0.0, 200.0],
+            }
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            ecrire_archive([journal.iloc[:3], journal.iloc[3:]], tmp)
+            self.assertTrue((Path(tmp) / "annee=2021" / "classe=4").is_dir())
+
+            du = pd.Timestamp("2021-01-01")
+            au = pd.Timestamp("2021-12-31")
+            clients = lire_archive(tmp, du, au, ["4"])
+            self.assertEqual(clients["compte"].tolist(), ["411"])
+            self.assertEqual(clients["date"].tolist(), ["15/06/2021"])
+
+            tout = records_archive(tmp)
+            self.assertEqual(len(tout), 5)
+            self.assertEqual(tout[0]["date"], "01/01/2021")
+
+            # Réécrire une partition la remplace et garde les autres
+            ecrire_archive([journal.iloc[3:4]], tmp)
+            self.assertEqual(len(lire_archive(tmp)), 5)
+            ventes = lire_archive(tmp, prefixes=["70"], colonnes=["compte"])
+            self.assertEqual(list(ventes.columns), ["compte"])
+            self.assertEqual(ventes["compte"].tolist(), ["706"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,438 @@
+"""
+Bilan: correspondance déclarative entre les comptes du PCG et les postes du
+bilan, calculée en une seule agrégation sur les soldes des comptes.
+"""
+import typing as t
+import logging
+import unittest
+import numpy as np
+import pandas as pd
+from .cloture import cloturer
+from .cumuls import Cumuls
+from .mapping import compile_prefixes, lookup
+from .stockage import Stockage
+
+if t.TYPE_CHECKING:
+    from . import Account, Record
+
+logger = logging.getLogger(__name__)
+
+Sens = t.Literal["débiteur", "créditeur"]
+
+
+class Ligne(t.TypedDict):
+    section: str
+    ligne: str
+    comptes: list[str]
+    amortissements: t.NotRequired[list[str]]
+    solde: t.NotRequired[Sens]
+
+
+ACTIF: list[Ligne] = [
+    {
+        "section": "ACTIF IMMOBILISE",
+        "ligne": "Immobilisations incorporelles",
+        "comptes": ["20"],
+        "amortissements": ["280", "290"],
+    },
+    {
+        "section": "ACTIF IMMOBILISE",
+        "ligne": "Terrains",
+        "comptes": ["211", "212"],
+        "amortissements": ["2811", "2812", "2911"],
+    },
+    {
+        "section": "ACTIF IMMOBILISE",
+        "ligne": "Constructions",
+        "comptes": ["213", "214"],
+        "amortissements": ["2813", "2814"],
+    },
+    {
+        "section": "ACTIF IMMOBILISE",
+        "ligne": "Autres immobilisations corporelles",
+        "comptes": ["215", "218", "22", "23"],
+        "amortissements": ["28", "2815", "2818", "282", "293"],
+    },
+    {
+        "section": "ACTIF IMMOBILISE",
+        "ligne": "Immobilisations financières",
+        "comptes": ["26", "27"],
+        "amortissements": ["296", "297"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Matières premières et autres approvisionnements",
+        "comptes": ["31", "32"],
+        "amortissements": ["391", "392"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "En cours de production",
+        "comptes": ["33", "34"],
+        "amortissements": ["393", "394"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Produits intermédiaires et finis",
+        "comptes": ["35"],
+        "amortissements": ["395"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Marchandises",
+        "comptes": ["37"],
+        "amortissements": ["397"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Avances et acomptes versés sur commandes",
+        "comptes": ["409"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Créances clients et comptes rattachés",
+        "comptes": ["41"],
+        "amortissements": ["491"],
+        "solde": "débiteur",
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Autres créances",
+        "comptes": ["40", "42", "43", "44", "45", "46", "47"],
+        "amortissements": ["495", "496"],
+        "solde": "débiteur",
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Capital souscrit - appelé, non versé",
+        "comptes": ["4562"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Actions propres",
+        "comptes": ["502"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Autres titres",
+        "comptes": ["50"],
+        "amortissements": ["59"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Instruments de trésorerie",
+        "comptes": ["52"],
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Disponibilités",
+        "comptes": ["51", "53", "54", "58"],
+        "solde": "débiteur",
+    },
+    {
+        "section": "ACTIF CIRCULANT",
+        "ligne": "Charges constatées d'avance",
+        "comptes": ["486"],
+    },
+    {
+        "section": "COMPTES DE REGULARISATION",
+        "ligne": "Charges à répartir sur plusieurs exercices",
+        "comptes": ["481"],
+    },
+    {
+        "section": "COMPTES DE REGULARISATION",
+        "ligne": "Primes de remboursement des emprunts",
+        "comptes": ["169"],
+    },
+    {
+        "section": "COMPTES DE REGULARISATION",
+        "ligne": "Ecarts de conversion Actif",
+        "comptes": ["476"],
+    },
+]
+
+PASSIF: list[Ligne] = [
+    {
+        "section": "CAPITAUX PROPRES",
+        "ligne": "Capital",
+        "comptes": ["101", "108"],
+    },
+    {
+        "section": "CAPITAUX PROPRES",
+        "ligne": "Ecart de réévaluation",
+        "comptes": ["105"],
+    },
+    {
+        "section": "CAPITAUX PROPRES",
+        "ligne": "Réserve légale",
+        "comptes": ["1061"],
+    },
+    {
+        "section": "CAPITAUX PROPRES",
+        "ligne": "Réserves réglementées",
+        "comptes": ["1064"],
+    },
+    {
+        "section": "CAPITAUX PROPRES",
+        "ligne": "Autres réserves",
+        "comptes": ["106"],
+    },
+    {
+        "section": "CAPITAUX PROPRES",
+        "ligne": "Report à nouveau",
+        "comptes": ["11"],
+    },
+    {
+        "section": "CAPITAUX PROPRES",
+        "ligne": "Résultat de l'exercice",
+        # Les comptes de gestion non soldés forment le résultat
+        "comptes": ["12", "6", "7"],
+    },
+    {
+        "section": "CAPITAUX PROPRES",
+        "ligne": "Subventions d'investissement",
+        "comptes": ["13"],
+    },
+    {
+        "section": "CAPITAUX PROPRES",
+        "ligne": "Provisions réglementées",
+        "comptes": ["14"],
+    },
+    {
+        "section": "PROVISIONS POUR RISQUES ET CHARGES",
+        "ligne": "Provisions pour risques et charges",
+        "comptes": ["15"],
+    },
+    {
+        "section": "DETTES",
+        "ligne": "Emprunts et dettes assimilées",
+        "comptes": ["16", "17", "51"],
+        "solde": "créditeur",
+    },
+    {
+        "section": "DETTES",
+        "ligne": "Avances et acomptes reçus sur commandes en cours",
+        "comptes": ["419"],
+    },
+    {
+        "section": "DETTES",
+        "ligne": "Dettes fournisseurs et comptes rattachés",
+        "comptes": ["40"],
+        "solde": "créditeur",
+    },
+    {
+        "section": "DETTES",
+        "ligne": "Autres dettes",
+        "comptes": ["41", "42", "43", "44", "45", "46", "47"],
+        "solde": "créditeur",
+    },
+    {
+        "section": "DETTES",
+        "ligne": "Produits constatés d'avance",
+        "comptes": ["487"],
+    },
+    {
+        "section": "DETTES",
+        "ligne": "Ecarts de conversion passif",
+        "comptes": ["477"],
+    },
+]
+
+COLONNES = ["brut", "amortissements"]
+
+# Libellés des écritures de clôture, exclues du bilan de l'exercice
+LIBELLES_CLOTURE = ("Fermeture: ", "Résultat de l'exercice")
+
+
+class TableBilan(t.NamedTuple):
+    lignes: pd.DataFrame
+    debiteurs: t.Any
+    crediteurs: t.Any
+
+
+def compile_bilan(
+    actif: list[Ligne] = ACTIF, passif: list[Ligne] = PASSIF
+) -> TableBilan:
+    """
+    Compile la correspondance en deux tables de préfixes, l'une pour les
+    comptes à solde débiteur, l'autre pour les comptes à solde créditeur.
+    Chaque cible est un couple (ligne, colonne) numéroté ligne * 2 + colonne.
+    """
+    lignes = [dict(ligne, cote="actif") for ligne in actif]
+    lignes += [dict(ligne, cote="passif") for ligne in passif]
+
+    tables: dict[Sens, dict[str, int]] = {"débiteur": {}, "créditeur": {}}
+    for numero, ligne in enumerate(lignes):
+        for colonne, cle in enumerate(["comptes", "amortissements"]):
+            for prefixe in ligne.get(cle, []):
+                for sens, table in tables.items():
+                    if ligne.get("solde", sens) != sens:
+                        continue
+                    if prefixe in table:
+                        raise ValueError(f"Préfixe {prefixe} en double")
+                    table[prefixe] = numero * len(COLONNES) + colonne
+
+    return TableBilan(
+        pd.DataFrame(lignes)[["cote", "section", "ligne"]],
+        compile_prefixes(tables["débiteur"]),
+        compile_prefixes(tables["créditeur"]),
+    )
+
+
+@t.overload
+def ecritures_avant_cloture(records: list["Record"]) -> list["Record"]:
+    ...
+
+
+@t.overload
+def ecritures_avant_cloture(records: Stockage) -> Stockage:
+    ...
+
+
+@t.overload
+def ecritures_avant_cloture(records: pd.DataFrame) -> pd.DataFrame:
+    ...
+
+
+def ecritures_avant_cloture(records):
+    """
+    Filtre les écritures de clôture de l'exercice
+    """
+    if isinstance(records, Stockage):
+        return records.selection(libelles_exclus=LIBELLES_CLOTURE)
+    if isinstance(records, pd.DataFrame):
+        cloture = records["libellé"].str.startswith(LIBELLES_CLOTURE)
+        return records[~cloture.to_numpy(dtype=bool)]
+    return [
+        r for r in records if not r["libellé"].startswith(LIBELLES_CLOTURE)
+    ]
+
+
+def comptes_pcg(comptes: np.ndarray) -> np.ndarray:
+    """
+    Renumérote les comptes d'amortissement 28 + compte[2:] (voir
+    compte_amortissement) au format du PCG 28 + compte[1:], en retrouvant
+    l'immobilisation amortie, pour les rattacher à la bonne ligne du bilan.
+    """
+    immobilisations = {
+        c[2:]: c
+        for c in comptes
+        if c.startswith("2") and not c.startswith(("28", "29"))
+    }
+    return np.array(
+        [
+            f"28{immobilisations[c[2:]][1:]}"
+            if c.startswith("28") and c[2:] in immobilisations
+            else c
+            for c in comptes
+        ],
+        dtype=str,
+    )
+
+
+def calculer_bilan(
+    accounts: list["Account"], table: TableBilan | None = None
+) -> pd.DataFrame:
+    """
+    Calcule tous les postes du bilan en une agrégation sur les soldes des
+    comptes (débit - crédit).
+
+    Retourne un DataFrame avec une ligne par poste (colonnes cote, section,
+    ligne) et les montants brut, amortissements et net. Les montants du
+    passif sont positifs lorsqu'ils sont créditeurs.
+    """
+    if table is None:
+        table = compile_bilan()
+
+    comptes = comptes_pcg(np.array([a["compte"] for a in accounts], dtype=str))
+    soldes = np.array([a["solde"] for a in accounts], dtype=float)
+    cibles = np.where(
+        soldes >= 0,
+        lookup(table.debiteurs, comptes),
+        lookup(table.crediteurs, comptes),
+    )
+
+    # Les comptes de classe 8 (ouverture/clôture) ne sont pas au bilan
+    hors_bilan = (
+        (cibles < 0) & (soldes != 0) & (np.char.find(comptes, "8") != 0)
+    )
+    for compte in comptes[hors_bilan]:
+        logger.warning(f"Compte {compte} sans poste au bilan")
+
+    taille = len(table.lignes) * len(COLONNES)
+    montants = np.bincount(
+        cibles[cibles >= 0], weights=soldes[cibles >= 0], minlength=taille
+    ).reshape(-1, len(COLONNES))
+
+    # Amortissements créditeurs et passif créditeur comptés positivement
+    passif = (table.lignes["cote"] == "passif").to_numpy()
+    montants[:, 1] *= -1
+    montants[passif] *= -1
+    montants += 0.0
+
+    bilan = table.lignes.copy()
+    bilan["brut"] = montants[:, 0]
+    bilan["amortissements"] = montants[:, 1]
+    bilan["net"] = bilan["brut"] - bilan["amortissements"]
+    return bilan
+
+
+class TestBilan(unittest.TestCase):
+    def test_calculer_bilan(self):
+        accounts: list["Account"] = [
+            {"compte": "205001", "intitulé": "Logiciel", "solde": 19000.0},
+            {"compte": "285001", "intitulé": "Amort.", "solde": -7600.0},
+            {"compte": "213000", "intitulé": "Constructions", "solde": 1000},
+            {"compte": "512", "intitulé": "Banque", "solde": 500.0},
+            {"compte": "512100", "intitulé": "Banque 2", "solde": -200.0},
+            {"compte": "101", "intitulé": "Capital", "solde": -10000.0},
+            {"compte": "706", "intitulé": "Ventes", "solde": -3000.0},
+            {"compte": "606", "intitulé": "Achats", "solde": 300.0},
+            {"compte": "890", "intitulé": "Bilan", "solde": 1.0},
+        ]
+        bilan = calculer_bilan(accounts).set_index("ligne")
+
+        incorporelles = bilan.loc["Immobilisations incorporelles"]
+        self.assertEqual(incorporelles["brut"], 19000.0)
+        self.assertEqual(incorporelles["amortissements"], 7600.0)
+        self.assertEqual(incorporelles["net"], 11400.0)
+        self.assertEqual(bilan.loc["Constructions", "net"], 1000.0)
+        self.assertEqual(bilan.loc["Disponibilités", "net"], 500.0)
+        self.assertEqual(
+            bilan.loc["Emprunts et dettes assimilées", "net"], 200.0
+        )
+        self.assertEqual(bilan.loc["Capital", "net"], 10000.0)
+        self.assertEqual(bilan.loc["Résultat de l'exercice", "net"], 2700.0)
+
+    def test_ecritures_avant_cloture(self):
+        records: list["Record"] = [
+            {
+                "date": "15/06/2022",
+                "compte": compte,
+                "libellé": "Vente",
+                "débit": debit,
+                "crédit": credit,
+            }
+            for compte, debit, credit in [
+                ("512", 900.0, 0.0),
+                ("706", 0.0, 900.0),
+            ]
+        ]
+        accounts: list["Account"] = [
+            {"compte": "512", "intitulé": "Banque", "solde": 900.0},
+            {"compte": "706", "intitulé": "Ventes", "solde": -900.0},
+        ]
+        journal = records + cloturer(accounts, "31/12/2022").ecritures
+
+        # Les écritures de clôture soldent la banque au 31/12
+        self.assertEqual(Cumuls(journal).solde("5", "31/12/2022"), 0.0)
+        for ecritures in [journal, pd.DataFrame(journal)]:
+            cumuls = Cumuls(ecritures_avant_cloture(ecritures))
+            self.assertEqual(
+                cumuls.soldes("5", ["30/06/2022", "31/12/2022"]).tolist(),
+                [900.0, 900.0],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,262 @@
+"""
+Ecritures de clôture et de réouverture des comptes.
+
+Les comptes sont classés par leur premier chiffre avec une table de
+correspondance, et toutes les écritures sont construites sur les tableaux
+de soldes:
+    - les comptes de gestion (6 et 7) sont soldés dans le résultat (120 en
+      cas de bénéfice, 129 en cas de perte), calculé en une seule somme;
+    - les comptes de bilan (1 à 5), résultat compris, sont soldés par le
+      bilan de clôture (891);
+    - les mêmes soldes sont repris par le bilan d'ouverture (890) au
+      premier jour de l'exercice suivant.
+"""
+import typing as t
+import unittest
+import numpy as np
+import pandas as pd
+
+if t.TYPE_CHECKING:
+    from . import Account, Record
+
+HORS_BILAN, BILAN, GESTION, SPECIAL = 0, 1, 2, 3
+
+# Type de compte selon la classe (premier chiffre)
+TYPES_CLASSE = np.array(
+    [
+        HORS_BILAN,  # 0
+        BILAN,  # 1 capitaux
+        BILAN,  # 2 immobilisations
+        BILAN,  # 3 stocks
+        BILAN,  # 4 tiers
+        BILAN,  # 5 financiers
+        GESTION,  # 6 charges
+        GESTION,  # 7 produits
+        SPECIAL,  # 8 comptes spéciaux
+        HORS_BILAN,  # 9 analytique
+    ]
+)
+
+BENEFICE = "120"
+PERTE = "129"
+BILAN_OUVERTURE = "890"
+BILAN_CLOTURE = "891"
+
+
+class Cloture(t.NamedTuple):
+    ecritures: list["Record"]
+    ouverture: list["Record"]
+    resultat: float
+
+
+def types_comptes(comptes: np.ndarray) -> np.ndarray:
+    """
+    Type (bilan, gestion, spécial) de chaque compte
+    """
+    if len(comptes) == 0:
+        return np.array([], dtype=int)
+    return TYPES_CLASSE[np.asarray(comptes, dtype="U1").astype(int)]
+
+
+def ecritures(
+    date: str,
+    comptes: np.ndarray,
+    libelles: np.ndarray,
+    debits: np.ndarray,
+    credits: np.ndarray,
+) -> list["Record"]:
+    """
+    Ecritures à partir de tableaux de même longueur
+    """
+    return [
+        {
+            "date": date,
+            "compte": str(compte),
+            "libellé": str(libelle),
+            "débit": float(debit),
+            "crédit": float(credit),
+        }
+        for compte, libelle, debit, credit in zip(
+            comptes, libelles, debits, credits
+        )
+    ]
+
+
+def contreparties(
+    date: str,
+    comptes: np.ndarray,
+    libelles: np.ndarray,
+    soldes: np.ndarray,
+    contrepartie: str,
+    libelle_contrepartie: t.Optional[str] = None,
+) -> list["Record"]:
+    """
+    Pour chaque compte, une écriture portant son solde (débit - crédit) du
+    bon côté et l'écriture inverse sur le compte de contrepartie. Les
+    deux écritures sont intercalées, compte par compte.
+    """
+    debits = np.maximum(soldes, 0.0)
+    credits = np.maximum(-soldes, 0.0)
+    n = len(comptes)
+
+    tous = np.empty(2 * n, dtype=object)
+    tous[0::2] = comptes
+    tous[1::2] = contrepartie
+    intitules = np.empty(2 * n, dtype=object)
+    intitules[0::2] = libelles
+    intitules[1::2] = (
+        libelles if libelle_contrepartie is None else libelle_contrepartie
+    )
+    montants_debit = np.empty(2 * n)
+    montants_debit[0::2], montants_debit[1::2] = debits, credits
+    montants_credit = np.empty(2 * n)
+    montants_credit[0::2], montants_credit[1::2] = credits, debits
+    return ecritures(date, tous, intitules, montants_debit, montants_credit)
+
+
+def ecritures_ouverture(
+    accounts: list["Account"], date: str
+) -> list["Record"]:
+    """
+    Bilan d'ouverture: chaque compte reprend son solde, en contrepartie du
+    compte 890
+    """
+    comptes = np.array([a["compte"] for a in accounts], dtype=str)
+    soldes = np.round([float(a["solde"]) for a in accounts], 2)
+    garder = soldes != 0.0
+    return contreparties(
+        date,
+        comptes[garder],
+        np.array([a["intitulé"] for a in accounts], dtype=object)[garder],
+        soldes[garder],
+        BILAN_OUVERTURE,
+        "Ouverture des comptes",
+    )
+
+
+def cloturer(accounts: list["Account"], date: str) -> Cloture:
+    """
+    Ecritures de clôture à la date de fin de l'exercice (JJ/MM/AAAA), et
+    écritures de réouverture au lendemain
+    """
+    comptes = np.array([a["compte"] for a in accounts], dtype=str)
+    intitules = np.array([a["intitulé"] for a in accounts], dtype=object)
+    soldes = np.round([float(a["solde"]) for a in accounts], 2)
+    types = types_comptes(comptes)
+    non_nuls = soldes != 0.0
+
+    # Comptes de gestion soldés dans le résultat, en une somme
+    gestion = (types == GESTION) & non_nuls
+    resultat = float(np.round(-soldes[gestion].sum(), 2))
+    compte_resultat = BENEFICE if resultat >= 0 else PERTE
+    fermeture = np.char.add("Fermeture: ", intitules.astype(str))
+    records = ecritures(
+        date,
+        comptes[gestion],
+        fermeture[gestion],
+        np.maximum(-soldes[gestion], 0.0),
+        np.maximum(soldes[gestion], 0.0),
+    )
+    if resultat != 0.0:
+        records += ecritures(
+            date,
+            np.array([compte_resultat]),
+            np.array(["Résultat de l'exercice"]),
+            np.array([max(-resultat, 0.0)]),
+            np.array([max(resultat, 0.0)]),
+        )
+
+    # Comptes de bilan, résultat de l'exercice compris
+    bilan = types == BILAN
+    comptes_bilan = np.append(comptes[bilan], compte_resultat)
+    uniques, positions = np.unique(comptes_bilan, return_inverse=True)
+    soldes_bilan = np.round(
+        np.bincount(
+            positions,
+            weights=np.append(soldes[bilan], -resultat),
+            minlength=len(uniques),
+        ),
+        2,
+    )
+    libelles = dict(zip(comptes[bilan], intitules[bilan]))
+    libelles.setdefault(compte_resultat, "Résultat de l'exercice")
+    intitules_bilan = np.array([libelles[c] for c in uniques], dtype=object)
+    garder = soldes_bilan != 0.0
+
+    # Bilan de clôture (891): écritures inverses des soldes
+    records += contreparties(
+        date,
+        uniques[garder],
+        np.char.add("Fermeture: ", intitules_bilan[garder].astype(str)),
+        -soldes_bilan[garder],
+        BILAN_CLOTURE,
+    )
+
+    # Bilan d'ouverture (890) de l'exercice suivant
+    lendemain = pd.to_datetime(date, format="%d/%m/%Y") + pd.Timedelta(days=1)
+    ouverture = contreparties(
+        lendemain.strftime("%d/%m/%Y"),
+        uniques[garder],
+        intitules_bilan[garder],
+        soldes_bilan[garder],
+        BILAN_OUVERTURE,
+        "Ouverture des comptes",
+    )
+
+    return Cloture(records, ouverture, resultat)
+
+
+class TestCloture(unittest.TestCase):
+    def test_cloturer(self):
+        accounts: list["Account"] = [
+            {"compte": "101", "intitulé": "Capital", "solde": -1000.0},
+            {"compte": "512", "intitulé": "Banque", "solde": 1600.0},
+            {"compte": "606", "intitulé": "Achats", "solde": 300.0},
+            {"compte": "706", "intitulé": "Ventes", "solde": -900.0},
+            {"compte": "890", "intitulé": "Ouverture", "solde": 0.0},
+        ]
+        cloture = cloturer(accounts, "31/12/2022")
+        self.assertEqual(cloture.resultat, 600.0)
+
+        def soldes(records: list["Record"]) -> dict[str, float]:
+            df = pd.DataFrame.from_records(records)
+            solde = df["débit"] - df["crédit"]
+            return solde.groupby(df["compte"]).sum().to_dict()
+
+        # Tous les comptes sont soldés, le bilan de clôture aussi
+        apres = soldes(
+            [
+                {
+                    "date": "31/12/2022",
+                    "compte": a["compte"],
+                    "libellé": "",
+                    "débit": a["solde"],
+                    "crédit": 0.0,
+                }
+                for a in accounts
+            ]
+            + cloture.ecritures
+        )
+        self.assertTrue(all(v == 0.0 for v in apres.values()))
+        self.assertIn("120", apres)
+
+        # Les débits et crédits sont positifs et équilibrés
+        for records in [cloture.ecritures, cloture.ouverture]:
+            self.assertTrue(all(r["débit"] >= 0 for r in records))
+            self.assertTrue(all(r["crédit"] >= 0 for r in records))
+            self.assertEqual(
+                sum(r["débit"] for r in records),
+                sum(r["crédit"] for r in records),
+            )
+
+        # Réouverture au lendemain avec le résultat en 120
+        ouverture = soldes(cloture.ouverture)
+        self.assertEqual(cloture.ouverture[0]["date"], "01/01/2023")
+        self.assertEqual(ouverture["120"], -600.0)
+        self.assertEqual(ouverture["512"], 1600.0)
+        self.assertEqual(ouverture["890"], 0.0)
+        self.assertNotIn("606", ouverture)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+"""
+Construction des rapports: chaque rapport est un noeud (une commande) avec
+ses entrées et ses sorties déclarées, et le graphe est déduit des fichiers
+(voir surveillance.py).
+
+L'empreinte d'un noeud est celle de sa commande (paramètres compris) et du
+contenu de ses entrées. Un noeud dont l'empreinte et les sorties n'ont pas
+changé depuis la dernière construction n'est pas relancé; un noeud relancé
+dont les sorties sont identiques ne relance pas les noeuds en aval. Les
+noeuds indépendants sont lancés en parallèle.
+
+Les empreintes sont gardées dans un manifeste JSON, avec la date de
+modification et la taille de chaque fichier: un fichier qui n'a pas bougé
+n'est pas relu, et une construction sans changement ne lit aucun fichier.
+"""
+import typing as t
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from .surveillance import amont
+
+logger = logging.getLogger(__name__)
+
+Statut = t.Literal["à jour", "construit", "échec", "ignoré"]
+
+# Taille des blocs lus pour l'empreinte d'un fichier
+BLOC = 1024 * 1024
+
+
+class Noeud(t.NamedTuple):
+    nom: str
+    commande: list[str]
+    entrees: list[Path]
+    sorties: list[Path]
+
+
+def commande(script: Path, options: dict[str, t.Any]) -> list[str]:
+    """
+    Ligne de commande d'un script Python: les listes sont dépliées, les
+    options None ou vides sont omises
+    """
+    ligne = [sys.executable, str(script)]
+    for option, valeur in options.items():
+        if valeur is None or valeur == []:
+            continue
+        valeurs = valeur if isinstance(valeur, list) else [valeur]
+        ligne += [option] + [str(v) for v in valeurs]
+    return ligne
+
+
+def empreinte_contenu(chemin: Path) -> str:
+    sha = hashlib.sha256()
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(BLOC), b""):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+class Manifeste:
+    """
+    Empreintes des fichiers et des noeuds de la dernière construction
+    """
+
+    def __init__(self, path: t.Optional[Path] = None):
+        self.path = path
+        self.fichiers: dict[str, list[t.Any]] = {}
+        self.noeuds: dict[str, dict[str, t.Any]] = {}
+        if path is not None and path.exists():
+            contenu = json.loads(path.read_text())
+            self.fichiers = contenu["fichiers"]
+            self.noeuds = contenu["noeuds"]
+
+    def empreinte_fichier(self, chemin: Path) -> t.Optional[str]:
+        """
+        Empreinte du contenu d'un fichier (None s'il n'existe pas), relu
+        seulement si sa date de modification ou sa taille a changé
+        """
+        try:
+            stat = chemin.stat()
+        except FileNotFoundError:
+            return None
+        cle = str(chemin)
+        connu = self.fichiers.get(cle)
+        if connu is not None and connu[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return connu[2]
+        empreinte = empreinte_contenu(chemin)
+        self.fichiers[cle] = [stat.st_mtime_ns, stat.st_size, empreinte]
+        return empreinte
+
+    def empreinte(self, noeud: Noeud) -> str:
+        """
+        Empreinte de la commande et du contenu des entrées
+        """
+        sha = hashlib.sha256(json.dumps(noeud.commande).encode())
+        for entree in noeud.entrees:
+            sha.update(f"{entree}={self.empreinte_fichier(entree)}".encode())
+        return sha.hexdigest()
+
+    def a_jour(self, noeud: Noeud, empreinte: str) -> bool:
+        """
+        Vrai si le noeud a été construit avec cette empreinte et que ses
+        sorties sont celles qu'il a produites
+        """
+        connu = self.noeuds.get(noeud.nom)
+        if connu is None or connu["empreinte"] != empreinte:
+            return False
+        return all(
+            self.empreinte_fichier(s) == connu["sorties"].get(str(s))
+            for s in noeud.sorties
+        )
+
+    def enregistrer(self, noeud: Noeud, empreinte: str) -> None:
+        self.noeuds[noeud.nom] = {
+            "empreinte": empreinte,
+            "sorties": {
+                str(s): self.empreinte_fichier(s) for s in noeud.sorties
+            },
+        }
+
+    def sauver(self) -> None:
+        if self.path is not None:
+            self.path.write_text(
+                json.dumps(
+                    {"fichiers": self.fichiers, "noeuds": self.noeuds},
+                    indent=1,
+                )
+            )
+
+
+def lancer(noeud: Noeud) -> int:
+    logger.info(f"{noeud.nom} : {' '.join(noeud.commande)}")
+    return subprocess.run(noeud.commande, check=False).returncode
+
+
+def construire(
+    noeuds: list[Noeud],
+    manifeste: Manifeste,
+    paralleles: t.Optional[int] = None,
+    forcer: bool = False,
+) -> dict[str, Statut]:
+    """
+    Construit les noeuds qui ne sont pas à jour, chacun dès que les noeuds
+    en amont sont terminés, au plus paralleles à la fois. Les noeuds en aval
+    d'un échec sont ignorés. Retourne le statut de chaque noeud.
+    """
+    dependances = amont(noeuds)
+    statuts: dict[int, Statut] = {}
+    en_cours: dict[concurrent.futures.Future, tuple[int, str]] = {}
+
+    with concurrent.futures.ThreadPoolExecutor(
+        paralleles or os.cpu_count()
+    ) as executeur:
+        while len(statuts) < len(noeuds):
+            # Noeuds prêts: tous les noeuds en amont sont terminés (un noeud
+            # à jour peut en rendre d'autres prêts)
+            termines = -1
+            while termines < len(statuts):
+                termines = len(statuts)
+                lances = {i for i, _ in en_cours.values()}
+                for i, noeud in enumerate(noeuds):
+                    if i in statuts or i in lances:
+                        continue
+                    if not dependances[i].issubset(statuts):
+                        continue
+                    if any(
+                        statuts[j] in ("échec", "ignoré")
+                        for j in dependances[i]
+                    ):
+                        statuts[i] = "ignoré"
+                        continue
+                    empreinte = manifeste.empreinte(noeud)
+                    if not forcer and manifeste.a_jour(noeud, empreinte):
+                        statuts[i] = "à jour"
+                        continue
+                    futur = executeur.submit(lancer, noeud)
+                    en_cours[futur] = (i, empreinte)
+
+            if not en_cours:
+                if len(statuts) < len(noeuds):
+                    noms = [
+                        n.nom for i, n in enumerate(noeuds) if i not in statuts
+                    ]
+                    raise ValueError(f"Dépendance circulaire entre {noms}")
+                break
+            finis, _ = concurrent.futures.wait(
+                en_cours, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for futur in finis:
+                i, empreinte = en_cours.pop(futur)
+                if futur.result() == 0:
+                    manifeste.enregistrer(noeuds[i], empreinte)
+                    statuts[i] = "construit"
+                else:
+                    logger.error(f"{noeuds[i].nom} : échec")
+                    manifeste.noeuds.pop(noeuds[i].nom, None)
+                    statuts[i] = "échec"
+            manifeste.sauver()
+
+    manifeste.sauver()
+    return {noeuds[i].nom: statuts[i] for i in range(len(noeuds))}
+
+
+class TestConstruction(unittest.TestCase):
+    def test_construire(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dossier = Path(tmp)
+            banque = dossier / "banque.csv"
+            banque.write_text("a\n")
+
+            def copie(nom: str, entree: Path, sortie: Path) -> Noeud:
+                # Recopie la première ligne de l'entrée
+                code = (
+                    f"open({str(sortie)!r}, 'w')"
+                    f".write(open({str(entree)!r}).readline())"
+                )
+                return Noeud(
+                    nom, [sys.executable, "-c", code], [entree], [sortie]
+                )
+
+            journal = dossier / "journal.csv"
+            noeuds = [
+                copie("bilan", journal, dossier / "bilan.csv"),
+                copie("journal", banque, journal),
+                copie("immobilisations", banque, dossier / "immo.csv"),
+            ]
+            manifeste = Manifeste(dossier / "manifeste.json")
+            self.assertEqual(
+                set(construire(noeuds, manifeste).values()), {"construit"}
+            )
+            manifeste = Manifeste(dossier / "manifeste.json")
+            self.assertEqual(
+                set(construire(noeuds, manifeste).values()), {"à jour"}
+            )
+
+            # Le journal change, mais sa première ligne (lue par le bilan)
+            # reste la même: le bilan n'est pas relancé
+            banque.write_text("a\nb\n")
+            self.assertEqual(
+                construire(noeuds, manifeste),
+                {
+                    "bilan": "à jour",
+                    "journal": "construit",
+                    "immobilisations": "construit",
+                },
+            )
+
+            # Une sortie effacée est reconstruite
+            (dossier / "bilan.csv").unlink()
+            self.assertEqual(
+                construire(noeuds, manifeste)["bilan"], "construit"
+            )
+
+            # Un échec fait ignorer les noeuds en aval
+            banque.unlink()
+            statuts = construire(noeuds, manifeste)
+            self.assertEqual(statuts["journal"], "échec")
+            self.assertEqual(statuts["bilan"], "ignoré")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Soldes à date ("solde au JJ/MM/AAAA") par sommes cumulées.
+
+Le journal est trié par compte puis par date, et les débits et crédits sont
+cumulés une fois. Le solde d'un compte, ou d'un préfixe de comptes, à une
+date quelconque est alors une recherche dichotomique et une soustraction.
+"""
+import typing as t
+import unittest
+import numpy as np
+import pandas as pd
+from .mapping import FIN
+
+if t.TYPE_CHECKING:
+    from . import Record
+
+Dates = t.Union[str, pd.Timestamp, t.Sequence[t.Union[str, pd.Timestamp]]]
+
+# Décalage des dates dans la clé (rang du compte, date)
+DECALAGE = np.int64(2**32)
+
+
+def to_days(dates: Dates) -> np.ndarray:
+    """
+    Convertit des dates JJ/MM/AAAA (ou des Timestamp) en jours
+    """
+    dates = pd.to_datetime(pd.Series(np.atleast_1d(dates)), dayfirst=True)
+    return dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+class Cumuls:
+    """
+    Débits et crédits cumulés d'un journal trié par compte et par date.
+    """
+
+    def __init__(self, records: t.Union[list["Record"], pd.DataFrame]):
+        colonnes = ["date", "compte", "libellé", "débit", "crédit"]
+        if isinstance(records, pd.DataFrame):
+            df = records[colonnes].copy()
+        else:
+            df = pd.DataFrame.from_records(records, columns=colonnes)
+        df["date"] = pd.to_datetime(df["date"], format="%d/%m/%Y")
+        df = df.sort_values(["compte", "date"], kind="stable")
+        self.ecritures = df.reset_index(drop=True)
+
+        self.comptes = self.ecritures["compte"].to_numpy(dtype=str)
+        self.debits = np.concatenate(
+            [[0.0], self.ecritures["débit"].to_numpy(dtype=float).cumsum()]
+        )
+        self.credits = np.concatenate(
+            [[0.0], self.ecritures["crédit"].to_numpy(dtype=float).cumsum()]
+        )
+
+        # Clé croissante (rang du compte, jour depuis la première date + 1)
+        self.uniques, rangs = np.unique(self.comptes, return_inverse=True)
+        jours = to_days(self.ecritures["date"])
+        self.origine = int(jours.min()) - 1 if len(jours) else 0
+        self.cles = rangs.astype(np.int64) * DECALAGE + (jours - self.origine)
+
+    def plage(self, prefixe: str) -> tuple[int, int]:
+        """
+        Lignes [début, fin) des écritures des comptes commençant par le
+        préfixe, dans l'ordre (compte, date)
+        """
+        debut = np.searchsorted(self.comptes, prefixe, side="left")
+        fin = np.searchsorted(self.comptes, prefixe + FIN, side="left")
+        return int(debut), int(fin)
+
+    def debit_credit(
+        self, prefixe: str, dates: Dates
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Débits et crédits cumulés des comptes commençant par le préfixe,
+        écritures du jour comprises, à chaque date
+        """
+        premier = np.searchsorted(self.uniques, prefixe, side="left")
+        dernier = np.searchsorted(self.uniques, prefixe + FIN, side="left")
+        rangs = np.arange(premier, dernier, dtype=np.int64)[:, None]
+
+        jours = np.clip(to_days(dates) - self.origine, 0, DECALAGE - 1)
+        debuts = np.searchsorted(self.cles, rangs * DECALAGE, side="left")
+        fins = np.searchsorted(
+            self.cles, rangs * DECALAGE + jours[None, :], side="right"
+        )
+        debit = (self.debits[fins] - self.debits[debuts]).sum(axis=0)
+        credit = (self.credits[fins] - self.credits[debuts]).sum(axis=0)
+        return debit, credit
+
+    def soldes(self, prefixe: str, dates: Dates) -> np.ndarray:
+        """
+        Soldes (débit - crédit) des comptes commençant par le préfixe, à
+        chaque date
+        """
+        debit, credit = self.debit_credit(prefixe, dates)
+        return debit - credit
+
+    def solde(self, prefixe: str, date: t.Union[str, pd.Timestamp]) -> float:
+        """
+        Solde (débit - crédit) d'un compte ou d'un préfixe à une date
+        """
+        return float(self.soldes(prefixe, date)[0])
+
+    def soldes_courants(self, prefixe: str) -> pd.DataFrame:
+        """
+        Ecritures des comptes commençant par le préfixe, triées par compte
+        et par date, avec le solde progressif de l'ensemble
+        """
+        debut, fin = self.plage(prefixe)
+        ecritures = self.ecritures.iloc[debut:fin].copy()
+        ecritures["solde"] = (
+            self.debits[debut + 1 : fin + 1] - self.debits[debut]
+        ) - (self.credits[debut + 1 : fin + 1] - self.credits[debut])
+        return ecritures
+
+
+class TestCumuls(unittest.TestCase):
+    def test_soldes(self):
+        records: list["Record"] = [
+            {
+                "date": "01/03/2022",
+                "compte": "512",
+                "libellé": "Vente",
+                "débit": 100.0,
+                "crédit": 0.0,
+            },
+            {
+                "date": "01/01/2022",
+                "compte": "512",
+                "libellé": "Ouverture",
+                "débit": 1000.0,
+                "crédit": 0.0,
+            },
+            {
+                "date": "20/03/2022",
+                "compte": "512",
+                "libellé": "Loyer",
+                "débit": 0.0,
+                "crédit": 400.0,
+            },
+            {
+                "date": "10/03/2022",
+                "compte": "512100",
+                "libellé": "Virement",
+                "débit": 50.0,
+                "crédit": 0.0,
+            },
+            {
+                "date": "01/03/2022",
+                "compte": "706",
+                "libellé": "Vente",
+                "débit": 0.0,
+                "crédit": 100.0,
+            },
+        ]
+        cumuls = Cumuls(records)
+        self.assertEqual(cumuls.solde("512", "15/03/2022"), 1150.0)
+        self.assertEqual(cumuls.solde("5121", "15/03/2022"), 50.0)
+        self.assertEqual(cumuls.solde("512", "31/12/2021"), 0.0)
+        self.assertEqual(cumuls.solde("7", "01/03/2022"), -100.0)
+        self.assertEqual(cumuls.solde("6", "01/03/2022"), 0.0)
+        self.assertEqual(
+            cumuls.soldes("5", ["01/01/2022", "31/03/2022"]).tolist(),
+            [1000.0, 750.0],
+        )
+
+        courants = cumuls.soldes_courants("512")
+        self.assertEqual(
+            courants["solde"].tolist(), [1000.0, 1100.0, 700.0, 750.0]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
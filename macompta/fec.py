@@ -0,0 +1,534 @@
+"""
+Fichier des écritures comptables (FEC, article A47 A-1 du LPF).
+
+Le FEC est un fichier texte à 18 colonnes, séparées par des tabulations ou
+des barres verticales, avec les dates au format AAAAMMJJ et les montants
+avec une virgule décimale. Il est lu et écrit par blocs de lignes, de
+sorte que la mémoire ne dépend pas de la taille du fichier, et les
+contrôles de structure sont faits sur chaque bloc au passage:
+    - les 18 colonnes, dans l'ordre;
+    - les champs obligatoires renseignés;
+    - des dates et des montants valides;
+    - les lignes dans l'ordre chronologique (EcritureDate croissante);
+    - chaque écriture (code journal, numéro) à une seule date, et
+      équilibrée, et le fichier aussi.
+
+Seules les écritures non équilibrées en fin de bloc (avec leur date) et la
+dernière date vue sont gardées d'un bloc à l'autre.
+"""
+import typing as t
+import csv
+import io
+import unittest
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .schema import COLONNES
+
+COLONNES_FEC = [
+    "JournalCode",
+    "JournalLib",
+    "EcritureNum",
+    "EcritureDate",
+    "CompteNum",
+    "CompteLib",
+    "CompAuxNum",
+    "CompAuxLib",
+    "PieceRef",
+    "PieceDate",
+    "EcritureLib",
+    "Debit",
+    "Credit",
+    "EcritureLet",
+    "DateLet",
+    "ValidDate",
+    "Montantdevise",
+    "Idevise",
+]
+
+OBLIGATOIRES = [
+    "JournalCode",
+    "JournalLib",
+    "EcritureNum",
+    "EcritureDate",
+    "CompteNum",
+    "CompteLib",
+    "PieceRef",
+    "PieceDate",
+    "EcritureLib",
+    "Debit",
+    "Credit",
+    "ValidDate",
+]
+
+DATES = ["EcritureDate", "PieceDate", "ValidDate"]
+
+TEXTES = [
+    "JournalCode",
+    "JournalLib",
+    "EcritureNum",
+    "CompteNum",
+    "CompteLib",
+    "CompAuxNum",
+    "CompAuxLib",
+    "PieceRef",
+    "EcritureLib",
+    "EcritureLet",
+]
+
+# Correspondance des colonnes du FEC vers celles du journal
+CORRESPONDANCE = {
+    "EcritureDate": "date",
+    "CompteNum": "compte",
+    "EcritureLib": "libellé",
+    "Debit": "débit",
+    "Credit": "crédit",
+}
+
+JOURNAL_DEFAUT = ("OD", "Opérations diverses")
+
+Separateur = t.Literal["\t", "|"]
+
+
+class ControleFEC:
+    """
+    Contrôles de structure d'un FEC, bloc par bloc.
+    """
+
+    def __init__(
+        self,
+        du: t.Optional[pd.Timestamp] = None,
+        au: t.Optional[pd.Timestamp] = None,
+        max_erreurs: int = 100,
+    ):
+        self.du, self.au = du, au
+        self.max_erreurs = max_erreurs
+        self.erreurs: list[str] = []
+        self.nb_erreurs = 0
+        self.lignes = 0
+        self.debit = 0
+        self.credit = 0
+        # Solde en centimes et date des écritures non équilibrées
+        self.ouvertes: dict[tuple[str, str], int] = {}
+        self.dates_ouvertes: dict[tuple[str, str], pd.Timestamp] = {}
+        # Plus grande EcritureDate des blocs précédents
+        self.derniere: t.Optional[np.datetime64] = None
+
+    def erreur(self, message: str, lignes: t.Optional[np.ndarray] = None):
+        """
+        Enregistre une erreur, pour les lignes données (numéros dans le
+        fichier, en-tête compris)
+        """
+        if lignes is not None:
+            if len(lignes) == 0:
+                return
+            exemples = ", ".join(str(n) for n in lignes[:5])
+            suite = "..." if len(lignes) > 5 else ""
+            message = f"{message} (lignes {exemples}{suite})"
+        self.nb_erreurs += 1
+        if len(self.erreurs) < self.max_erreurs:
+            self.erreurs.append(message)
+
+    def entetes(self, colonnes: t.Sequence[str]) -> None:
+        """
+        Les 18 colonnes obligatoires, dans l'ordre
+        """
+        if list(colonnes) != COLONNES_FEC:
+            self.erreur(f"En-têtes invalides: {list(colonnes)}")
+
+    def bloc(self, fec: pd.DataFrame) -> pd.DataFrame:
+        """
+        Contrôle un bloc de lignes (en texte) et retourne ses dates et ses
+        montants convertis (NaT ou NaN si invalides)
+        """
+        numeros = np.arange(len(fec)) + self.lignes + 2
+        self.lignes += len(fec)
+
+        vides = (fec[OBLIGATOIRES] == "").to_numpy()
+        for i, colonne in enumerate(OBLIGATOIRES):
+            self.erreur(f"{colonne} non renseigné", numeros[vides[:, i]])
+
+        valeurs = pd.DataFrame(index=fec.index)
+        for colonne in DATES:
+            valeurs[colonne] = pd.to_datetime(
+                fec[colonne], format="%Y%m%d", errors="coerce"
+            )
+            invalides = (
+                valeurs[colonne].isna() & (fec[colonne] != "")
+            ).to_numpy()
+            self.erreur(f"{colonne} invalide", numeros[invalides])
+
+        dates = valeurs["EcritureDate"]
+        hors = np.zeros(len(fec), dtype=bool)
+        if self.du is not None:
+            hors |= (dates < self.du).to_numpy()
+        if self.au is not None:
+            hors |= (dates > self.au).to_numpy()
+        self.erreur("EcritureDate hors de l'exercice", numeros[hors])
+        premieres = self.chronologie(fec, dates, numeros)
+
+        for colonne in ["Debit", "Credit"]:
+            valeurs[colonne] = montants_valeurs(fec[colonne])
+            invalides = (
+                valeurs[colonne].isna() & (fec[colonne] != "")
+            ).to_numpy()
+            self.erreur(f"{colonne} invalide", numeros[invalides])
+
+        # Equilibre en centimes, par écriture et pour le fichier
+        debits = np.round(valeurs["Debit"].fillna(0.0).to_numpy() * 100)
+        credits = np.round(valeurs["Credit"].fillna(0.0).to_numpy() * 100)
+        self.debit += int(debits.sum())
+        self.credit += int(credits.sum())
+        soldes = (
+            pd.Series(debits - credits)
+            .groupby(
+                [fec["JournalCode"].to_numpy(), fec["EcritureNum"].to_numpy()]
+            )
+            .sum()
+        )
+        for cle, solde in soldes.items():
+            solde = self.ouvertes.pop(cle, 0) + int(solde)
+            if solde != 0:
+                self.ouvertes[cle] = solde
+        self.dates_ouvertes = {
+            cle: premieres.get(cle, self.dates_ouvertes.get(cle))
+            for cle in self.ouvertes
+        }
+        return valeurs
+
+    def chronologie(
+        self, fec: pd.DataFrame, dates: pd.Series, numeros: np.ndarray
+    ) -> dict[tuple[str, str], pd.Timestamp]:
+        """
+        Contrôle l'ordre chronologique des lignes et la date unique de
+        chaque écriture (dates valides seulement). Retourne la date de
+        chaque écriture du bloc.
+        """
+        valides = dates.notna().to_numpy()
+        if not valides.any():
+            return {}
+        numeros = numeros[valides]
+        jours = dates.to_numpy()[valides]
+
+        # Plus grande date des lignes précédentes, blocs précédents compris
+        debut = jours[0] if self.derniere is None else self.derniere
+        avant = np.maximum.accumulate(np.concatenate([[debut], jours[:-1]]))
+        self.erreur(
+            "EcritureDate antérieure à une ligne précédente",
+            numeros[jours < avant],
+        )
+        self.derniere = max(avant[-1], jours[-1])
+
+        # Une seule date par écriture, celle de sa première ligne
+        ecritures = pd.DataFrame(
+            {
+                "JournalCode": fec["JournalCode"].to_numpy()[valides],
+                "EcritureNum": fec["EcritureNum"].to_numpy()[valides],
+                "date": jours,
+            }
+        )
+        cles = ["JournalCode", "EcritureNum"]
+        premieres = ecritures.groupby(cles, sort=False)["date"].first()
+        for cle, date in self.dates_ouvertes.items():
+            if cle in premieres.index and date is not None:
+                premieres.loc[cle] = date
+        attendues = premieres.reindex(
+            pd.MultiIndex.from_frame(ecritures[cles])
+        ).to_numpy()
+        self.erreur(
+            "EcritureDate différente dans une même écriture",
+            numeros[jours != attendues],
+        )
+        return premieres.to_dict()
+
+    def terminer(self) -> list[str]:
+        """
+        Contrôles de fin de fichier; retourne les erreurs
+        """
+        for (journal, numero), solde in self.ouvertes.items():
+            self.erreur(
+                f"Ecriture {journal} {numero} non équilibrée"
+                f" ({solde / 100:.2f})"
+            )
+        if self.debit != self.credit:
+            self.erreur(
+                f"Total des débits ({self.debit / 100:.2f}) différent du"
+                f" total des crédits ({self.credit / 100:.2f})"
+            )
+        return self.erreurs
+
+
+def _separateur(premiere: str) -> Separateur:
+    return "|" if premiere.count("|") > premiere.count("\t") else "\t"
+
+
+def lire_fec(
+    fec: t.Union[Path, t.TextIO],
+    controle: t.Optional[ControleFEC] = None,
+    taille: int = 100_000,
+    encoding: str = "utf-8-sig",
+) -> t.Iterator[pd.DataFrame]:
+    """
+    Lit un FEC par blocs d'au plus taille lignes, contrôlés au passage.
+
+    Chaque bloc est retourné avec les colonnes du journal (les lignes dont
+    la date ou un montant est invalide sont écartées), suivies des autres
+    colonnes du FEC telles quelles.
+    """
+    if isinstance(fec, (str, Path)):
+        with open(fec, newline="", encoding=encoding) as f:
+            yield from lire_fec(f, controle, taille)
+        return
+
+    controle = controle or ControleFEC()
+    premiere = fec.readline().rstrip("\r\n")
+    sep = _separateur(premiere)
+    entetes = [c.strip() for c in premiere.split(sep)]
+    controle.entetes(entetes)
+    if not set(COLONNES_FEC).issubset(entetes):
+        return
+
+    for bloc in pd.read_csv(
+        fec,
+        sep=sep,
+        names=entetes,
+        dtype=str,
+        keep_default_na=False,
+        quoting=csv.QUOTE_NONE,
+        chunksize=taille,
+    ):
+        valeurs = controle.bloc(bloc)
+        garder = valeurs["EcritureDate"].notna().to_numpy()
+        for colonne in ["Debit", "Credit"]:
+            garder &= (
+                valeurs[colonne].notna() | (bloc[colonne] == "")
+            ).to_numpy()
+
+        journal = bloc[garder].rename(columns=CORRESPONDANCE)
+        dates = bloc["EcritureDate"][garder]
+        journal["date"] = (
+            dates.str[6:8] + "/" + dates.str[4:6] + "/" + dates.str[0:4]
+        )
+        journal["débit"] = valeurs["Debit"][garder].fillna(0.0)
+        journal["crédit"] = valeurs["Credit"][garder].fillna(0.0)
+        autres = [c for c in journal.columns if c not in COLONNES]
+        yield journal[COLONNES + autres]
+
+
+def numeros_ecritures(
+    debits: np.ndarray, credits: np.ndarray, suivant: int, solde: int
+) -> tuple[np.ndarray, int, int]:
+    """
+    Numérote les écritures d'un bloc: une écriture se termine quand le
+    solde cumulé des lignes revient à zéro.
+
+    Retourne les numéros, le prochain numéro et le solde (en centimes) de
+    l'écriture en cours à la fin du bloc.
+    """
+    centimes = np.round((debits - credits) * 100).astype(np.int64)
+    cumul = solde + np.cumsum(centimes)
+    fins = cumul == 0
+    numeros = suivant + np.concatenate([[0], np.cumsum(fins)[:-1]])
+    if len(cumul) == 0:
+        return numeros.astype(int), suivant, solde
+    return numeros.astype(int), int(numeros[-1] + fins[-1]), int(cumul[-1])
+
+
+def montants_valeurs(montants: pd.Series) -> pd.Series:
+    """
+    Montants du FEC (virgule décimale, sans séparateur de milliers) en
+    nombres, NaN si invalides
+    """
+    return pd.to_numeric(
+        montants.str.replace(",", ".", regex=False), errors="coerce"
+    )
+
+
+def montants_fec(montants: np.ndarray) -> np.ndarray:
+    """
+    Montants au format du FEC: deux décimales et virgule
+    """
+    texte = np.char.mod("%.2f", np.round(montants, 2) + 0.0)
+    return np.char.replace(texte, ".", ",")
+
+
+class EcrivainFEC:
+    """
+    Ecrit un FEC bloc par bloc à partir d'écritures aux colonnes du
+    journal. Les colonnes du FEC déjà présentes (FEC importé) sont
+    reprises, les autres sont déduites: journal OD, écritures numérotées
+    par retour à l'équilibre, pièce et validation à la date de l'écriture.
+    """
+
+    def __init__(
+        self,
+        output: t.TextIO,
+        intitules: t.Optional[dict[str, str]] = None,
+        separateur: Separateur = "\t",
+        controle: t.Optional[ControleFEC] = None,
+    ):
+        self.output = output
+        self.intitules = intitules or {}
+        self.separateur = separateur
+        self.controle = controle or ControleFEC()
+        self.suivant = 1
+        self.solde = 0
+        output.write(separateur.join(COLONNES_FEC) + "\n")
+        self.controle.entetes(COLONNES_FEC)
+
+    def bloc(self, journal: pd.DataFrame) -> None:
+        """
+        Ecrit et contrôle un bloc d'écritures
+        """
+        debits = journal["débit"].to_numpy(dtype=float)
+        credits = journal["crédit"].to_numpy(dtype=float)
+        # Montants négatifs portés de l'autre côté
+        debits, credits = (
+            np.maximum(debits, 0.0) + np.maximum(-credits, 0.0),
+            np.maximum(credits, 0.0) + np.maximum(-debits, 0.0),
+        )
+        dates = journal["date"].astype(str)
+        dates = dates.str[6:10] + dates.str[3:5] + dates.str[0:2]
+        comptes = journal["compte"].astype(str)
+
+        fec = pd.DataFrame(index=journal.index)
+        fec["JournalCode"] = JOURNAL_DEFAUT[0]
+        fec["JournalLib"] = JOURNAL_DEFAUT[1]
+        if "EcritureNum" not in journal:
+            numeros, self.suivant, self.solde = numeros_ecritures(
+                debits, credits, self.suivant, self.solde
+            )
+            fec["EcritureNum"] = numeros.astype(str)
+        fec["EcritureDate"] = dates
+        fec["CompteNum"] = comptes
+        fec["CompteLib"] = comptes.map(self.intitules).fillna(
+            "Compte " + comptes
+        )
+        fec["CompAuxNum"] = ""
+        fec["CompAuxLib"] = ""
+        fec["PieceDate"] = dates
+        fec["EcritureLib"] = journal["libellé"].astype(str)
+        fec["Debit"] = montants_fec(debits)
+        fec["Credit"] = montants_fec(credits)
+        fec["EcritureLet"] = ""
+        fec["DateLet"] = ""
+        fec["ValidDate"] = dates
+        fec["Montantdevise"] = ""
+        fec["Idevise"] = ""
+
+        # Colonnes reprises d'un FEC importé
+        for colonne in COLONNES_FEC:
+            if colonne in journal and colonne not in CORRESPONDANCE:
+                fec[colonne] = journal[colonne].astype(str)
+        if "PieceRef" not in journal:
+            fec["PieceRef"] = fec["EcritureNum"]
+        fec = fec[COLONNES_FEC]
+
+        # Le séparateur ne peut pas apparaître dans les champs
+        remplacements = str.maketrans(
+            {self.separateur: " ", "\r": " ", "\n": " "}
+        )
+        for colonne in TEXTES:
+            # Une fois par valeur distincte (codes, intitulés répétés)
+            codes, valeurs = pd.factorize(fec[colonne])
+            propres = np.array(
+                [v.translate(remplacements) for v in valeurs], dtype=object
+            )
+            fec[colonne] = propres[codes] if len(codes) else fec[colonne]
+        self.controle.bloc(fec)
+        fec.to_csv(
+            self.output,
+            sep=self.separateur,
+            header=False,
+            index=False,
+            quoting=csv.QUOTE_NONE,
+            lineterminator="\n",
+        )
+
+
+class TestFEC(unittest.TestCase):
+    def test_aller_retour(self):
+        journal = pd.DataFrame(
+            {
+                "date": ["01/01/2022"] * 2 + ["03/01/2022"] * 4,
+                "compte": ["512", "101", "606", "512", "445", "512"],
+                "libellé": ["Apport", "Apport", "Achat|Bureau"] * 2,
+                "débit": [1000.0, 0.0, 100.0, 0.0, 20.0, 0.0],
+                "crédit": [0.0, 1000.0, 0.0, 100.0, 0.0, 20.0],
+            }
+        ).iloc[[0, 1, 2, 4, 3, 5]]
+        output = io.StringIO()
+        ecrivain = EcrivainFEC(output, {"512": "Banque"}, separateur="|")
+        ecrivain.bloc(journal.iloc[:3])
+        ecrivain.bloc(journal.iloc[3:])
+        self.assertEqual(ecrivain.controle.terminer(), [])
+
+        output.seek(0)
+        lignes = output.getvalue().splitlines()
+        self.assertEqual(
+            lignes[1].split("|")[:6],
+            ["OD", "Opérations diverses", "1", "20220101", "512", "Banque"],
+        )
+        self.assertEqual(lignes[3].split("|")[11], "100,00")
+
+        controle = ControleFEC()
+        blocs = list(lire_fec(output, controle, taille=4))
+        self.assertEqual(controle.terminer(), [])
+        relu = pd.concat(blocs)
+        self.assertEqual(
+            relu["EcritureNum"].tolist(), ["1", "1", "2", "2", "2", "2"]
+        )
+        self.assertEqual(relu["débit"].sum(), 1120.0)
+        self.assertEqual(relu["date"].iloc[-1], "03/01/2022")
+        self.assertEqual(relu["libellé"].iloc[-1], "Achat Bureau")
+
+    def test_controles(self):
+        fec = io.StringIO(
+            "\t".join(COLONNES_FEC)
+            + "\n"
+            + "OD\tDivers\t1\t20221301\t512\tBanque\t\t\tP1\t20220101\tX"
+            "\t10,00\t0,00\t\t\t20220101\t\t\n"
+            + "OD\tDivers\t2\t20220102\t512\t\t\t\tP2\t20220102\tY"
+            "\t5,00\t0,00\t\t\t20220102\t\t\n"
+        )
+        controle = ControleFEC()
+        blocs = list(lire_fec(fec, controle))
+        erreurs = controle.terminer()
+        self.assertEqual(len(blocs[0]), 1)
+        self.assertIn("EcritureDate invalide (lignes 2)", erreurs)
+        self.assertIn("CompteLib non renseigné (lignes 3)", erreurs)
+        self.assertIn("Ecriture OD 2 non équilibrée (5.00)", erreurs)
+
+    def test_chronologie(self):
+        def ligne(numero: str, date: str, debit: str, credit: str) -> str:
+            return (
+                f"OD\tDivers\t{numero}\t{date}\t512\tBanque\t\t\tP"
+                f"\t{date}\tX\t{debit}\t{credit}\t\t\t{date}\t\t\n"
+            )
+
+        fec = io.StringIO(
+            "\t".join(COLONNES_FEC)
+            + "\n"
+            + ligne("1", "20220105", "10,00", "0,00")
+            + ligne("1", "20220105", "0,00", "10,00")
+            # Ecriture à cheval sur deux blocs, à deux dates
+            + ligne("2", "20220110", "5,00", "0,00")
+            + ligne("2", "20220111", "0,00", "5,00")
+            # Retour en arrière, dans le bloc suivant
+            + ligne("3", "20220103", "1,00", "0,00")
+            + ligne("3", "20220103", "0,00", "1,00")
+        )
+        controle = ControleFEC()
+        list(lire_fec(fec, controle, taille=3))
+        self.assertEqual(
+            controle.terminer(),
+            [
+                "EcritureDate antérieure à une ligne précédente "
+                "(lignes 6, 7)",
+                "EcritureDate différente dans une même écriture (lignes 5)",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
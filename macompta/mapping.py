@@ -0,0 +1,65 @@
+"""
+Correspondance entre préfixes de comptes et postes d'un état de synthèse.
+
+Les préfixes sont compilés en une table d'intervalles triés: le poste d'un
+compte est trouvé par recherche dichotomique, le préfixe le plus long
+l'emportant sur les préfixes plus courts.
+"""
+import typing as t
+import unittest
+import numpy as np
+
+# Plus grand caractère: tous les comptes commençant par p sont dans
+# l'intervalle [p, p + FIN)
+FIN = "\U0010ffff"
+
+
+class PrefixTable(t.NamedTuple):
+    bornes: np.ndarray
+    cibles: np.ndarray
+
+
+def compile_prefixes(prefixes: dict[str, int]) -> PrefixTable:
+    """
+    Compile un dictionnaire préfixe -> numéro de poste en table
+    d'intervalles disjoints. Les comptes sans préfixe correspondant ont le
+    poste -1.
+    """
+    points = sorted({p for p in prefixes} | {p + FIN for p in prefixes})
+    bornes: list[str] = []
+    cibles: list[int] = []
+    for point in points:
+        couvrants = [p for p in prefixes if p <= point < p + FIN]
+        cible = prefixes[max(couvrants, key=len)] if couvrants else -1
+        # Fusion des intervalles contigus d'un même poste
+        if cibles and cibles[-1] == cible:
+            continue
+        bornes.append(point)
+        cibles.append(cible)
+    return PrefixTable(
+        np.array(bornes, dtype=str), np.array(cibles, dtype=int)
+    )
+
+
+def lookup(table: PrefixTable, comptes: t.Sequence[str]) -> np.ndarray:
+    """
+    Poste de chaque compte, -1 si aucun préfixe ne correspond
+    """
+    comptes = np.asarray(comptes, dtype=str)
+    if len(table.bornes) == 0:
+        return np.full(len(comptes), -1)
+    position = np.searchsorted(table.bornes, comptes, side="right") - 1
+    return np.where(position >= 0, table.cibles[position], -1)
+
+
+class TestMapping(unittest.TestCase):
+    def test_lookup(self):
+        table = compile_prefixes({"2": 0, "28": 1, "2813": 2, "4": 3})
+        postes = lookup(
+            table, ["205001", "280500", "281300", "281500", "3", "401", "6"]
+        )
+        self.assertEqual(postes.tolist(), [0, 1, 2, 1, -1, 3, -1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,341 @@
+"""
+Journal en colonnes dans une mémoire partagée (multiprocessing.
+shared_memory), pour lancer les rapports en parallèle sans relire le
+journal dans chaque processus.
+
+Le journal est chargé une fois, puis rangé dans un seul bloc de mémoire:
+jours, codes des comptes et des libellés, débits et crédits, et les textes
+distincts (comptes, libellés) en UTF-8. Les processus des rapports
+s'attachent au bloc au lieu de lire les fichiers CSV:
+
+    - load_journals_frame retourne un DataFrame dont les débits et les
+      crédits sont des vues sur le bloc, sans copie (voir frame);
+    - load_journals reconstruit la liste des écritures (un dict par
+      ligne), pour les rapports qui en ont besoin.
+"""
+import typing as t
+import contextlib
+import datetime
+import logging
+import runpy
+import sys
+import unittest
+from multiprocessing import shared_memory
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+if t.TYPE_CHECKING:
+    from . import Record
+
+logger = logging.getLogger(__name__)
+
+# Colonne: (dtype, position en octets, nombre d'éléments)
+Colonne = tuple[str, int, int]
+
+# Alignement des colonnes dans le bloc
+ALIGNEMENT = 8
+
+# Ordinal du jour 0 de la colonne des jours (01/01/1970)
+ORIGINE = datetime.date(1970, 1, 1).toordinal()
+
+
+class Descripteur(t.NamedTuple):
+    """
+    Ce qu'il faut transmettre à un processus pour s'attacher au journal
+    """
+
+    nom: str
+    colonnes: dict[str, Colonne]
+    journaux: tuple[str, ...]
+
+
+def _cle(journals: t.Iterable[t.Union[Path, str]]) -> tuple[str, ...]:
+    return tuple(str(Path(j).resolve()) for j in journals)
+
+
+def _textes(valeurs: t.Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Textes en UTF-8 mis bout à bout, et positions (en caractères) de début
+    de chaque texte
+    """
+    longueurs = np.fromiter((len(v) for v in valeurs), dtype=np.int64)
+    positions = np.concatenate([[0], np.cumsum(longueurs)])
+    contenu = np.frombuffer("".join(valeurs).encode(), dtype=np.uint8)
+    return contenu, positions
+
+
+class JournalPartage:
+    """
+    Colonnes du journal dans un bloc de mémoire partagée. Le processus qui
+    crée le bloc le libère à la fermeture.
+    """
+
+    def __init__(
+        self,
+        memoire: shared_memory.SharedMemory,
+        descripteur: Descripteur,
+        proprietaire: bool = False,
+    ):
+        self.memoire = memoire
+        self.descripteur = descripteur
+        self.proprietaire = proprietaire
+
+    @classmethod
+    def creer(
+        cls,
+        records: list["Record"],
+        journals: t.Iterable[t.Union[Path, str]] = (),
+    ) -> "JournalPartage":
+        """
+        Range les écritures (des journaux donnés) dans un nouveau bloc
+        """
+        df = pd.DataFrame.from_records(
+            records, columns=["date", "compte", "libellé", "débit", "crédit"]
+        )
+        dates = pd.to_datetime(df["date"], format="%d/%m/%Y")
+        jours = dates.to_numpy(dtype="datetime64[D]").astype(np.int32)
+        codes_comptes, comptes = pd.factorize(df["compte"])
+        codes_libelles, libelles = pd.factorize(df["libellé"])
+        comptes_texte, comptes_positions = _textes(list(comptes))
+        libelles_texte, libelles_positions = _textes(list(libelles))
+
+        tableaux: dict[str, np.ndarray] = {
+            "jours": jours,
+            "comptes": codes_comptes.astype(np.int32),
+            "libellés": codes_libelles.astype(np.int32),
+            "débits": df["débit"].to_numpy(dtype=np.float64),
+            "crédits": df["crédit"].to_numpy(dtype=np.float64),
+            "comptes_texte": comptes_texte,
+            "comptes_positions": comptes_positions,
+            "libellés_texte": libelles_texte,
+            "libellés_positions": libelles_positions,
+        }
+        colonnes: dict[str, Colonne] = {}
+        position = 0
+        for nom, tableau in tableaux.items():
+            colonnes[nom] = (tableau.dtype.str, position, len(tableau))
+            position += -(-tableau.nbytes // ALIGNEMENT) * ALIGNEMENT
+
+        memoire = shared_memory.SharedMemory(
+            create=True, size=max(position, 1)
+        )
+        descripteur = Descripteur(memoire.name, colonnes, _cle(journals))
+        journal = cls(memoire, descripteur, proprietaire=True)
+        for nom, tableau in tableaux.items():
+            journal.colonne(nom)[:] = tableau
+        return journal
+
+    @classmethod
+    def attacher(cls, descripteur: Descripteur) -> "JournalPartage":
+        """
+        S'attache au bloc d'un journal partagé (dans un autre processus)
+        """
+        memoire = shared_memory.SharedMemory(name=descripteur.nom)
+        return cls(memoire, descripteur)
+
+    def __enter__(self) -> "JournalPartage":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.fermer()
+
+    def fermer(self) -> None:
+        self.memoire.close()
+        if self.proprietaire:
+            self.memoire.unlink()
+
+    def __len__(self) -> int:
+        return self.descripteur.colonnes["jours"][2]
+
+    def colonne(self, nom: str) -> np.ndarray:
+        """
+        Colonne lue dans le bloc, sans copie
+        """
+        dtype, position, taille = self.descripteur.colonnes[nom]
+        return np.ndarray(
+            (taille,), dtype=dtype, buffer=self.memoire.buf, offset=position
+        )
+
+    def textes(self, nom: str) -> list[str]:
+        """
+        Textes distincts d'une colonne (comptes ou libellés)
+        """
+        contenu = self.colonne(f"{nom}_texte").tobytes().decode()
+        positions = self.colonne(f"{nom}_positions").tolist()
+        return [contenu[a:b] for a, b in zip(positions[:-1], positions[1:])]
+
+    def frame(self) -> pd.DataFrame:
+        """
+        Ecritures du journal en colonnes (date, compte, libellé, débit,
+        crédit). Les débits et crédits sont des vues sur le bloc; les
+        comptes et les libellés sont repris des textes distincts, sans créer
+        de nouvelle chaîne.
+        """
+        jours = self.colonne("jours").astype("datetime64[D]")
+        comptes = np.array(self.textes("comptes"), dtype=object)
+        libelles = pd.Categorical.from_codes(
+            self.colonne("libellés"), categories=self.textes("libellés")
+        )
+        return pd.DataFrame(
+            {
+                "date": jours.astype("datetime64[ns]"),
+                "compte": comptes[self.colonne("comptes")],
+                "libellé": libelles,
+                "débit": self.colonne("débits"),
+                "crédit": self.colonne("crédits"),
+            },
+            copy=False,
+        )
+
+    def records(self) -> list["Record"]:
+        """
+        Ecritures du journal, dans l'ordre. La liste est construite à chaque
+        appel: un dict par ligne, sans partage avec le bloc.
+        """
+        jours = self.colonne("jours")
+        uniques, inverse = np.unique(jours, return_inverse=True)
+        dates = [
+            datetime.date.fromordinal(int(j) + ORIGINE).strftime("%d/%m/%Y")
+            for j in uniques
+        ]
+        comptes = self.textes("comptes")
+        libelles = self.textes("libellés")
+        return [
+            {
+                "date": dates[d],
+                "compte": comptes[c],
+                "libellé": libelles[lib],
+                "débit": debit,
+                "crédit": credit,
+            }
+            for d, c, lib, debit, credit in zip(
+                inverse.tolist(),
+                self.colonne("comptes").tolist(),
+                self.colonne("libellés").tolist(),
+                self.colonne("débits").tolist(),
+                self.colonne("crédits").tolist(),
+            )
+        ]
+
+
+# Journaux partagés auxquels le processus est attaché, par fichiers
+JOURNAUX: dict[tuple[str, ...], JournalPartage] = {}
+
+
+def journal_partage(
+    journals: t.Iterable[t.Union[Path, str]]
+) -> t.Optional[JournalPartage]:
+    """
+    Journal partagé chargé à partir de ces fichiers, s'il y en a un
+    """
+    if not JOURNAUX:
+        return None
+    return JOURNAUX.get(_cle(journals))
+
+
+def attacher(descripteur: Descripteur) -> None:
+    """
+    Initialisation d'un processus de rapports: load_journals lira le
+    journal partagé
+    """
+    JOURNAUX[descripteur.journaux] = JournalPartage.attacher(descripteur)
+
+
+def executer_script(ligne: list[str]) -> int:
+    """
+    Exécute un script (chemin puis arguments) dans le processus courant,
+    et retourne son code de sortie
+    """
+    argv = sys.argv
+    sys.argv = [str(a) for a in ligne]
+    try:
+        runpy.run_path(sys.argv[0], run_name="__main__")
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        return 1
+    except Exception:
+        logger.exception(f"{Path(ligne[0]).name} : échec")
+        return 1
+    finally:
+        sys.argv = argv
+    return 0
+
+
+@contextlib.contextmanager
+def partager(
+    records: list["Record"], journals: t.Iterable[t.Union[Path, str]]
+) -> t.Iterator[JournalPartage]:
+    """
+    Journal partagé le temps du bloc with, aussi visible par load_journals
+    dans le processus courant
+    """
+    with JournalPartage.creer(records, journals) as journal:
+        JOURNAUX[journal.descripteur.journaux] = journal
+        try:
+            yield journal
+        finally:
+            del JOURNAUX[journal.descripteur.journaux]
+
+
+class TestPartage(unittest.TestCase):
+    def test_partage(self):
+        records: list["Record"] = [
+            {
+                "date": "01/01/2022",
+                "compte": "512",
+                "libellé": "Apport en capital",
+                "débit": 1000.0,
+                "crédit": 0.0,
+            },
+            {
+                "date": "01/01/2022",
+                "compte": "101",
+                "libellé": "Apport en capital",
+                "débit": 0.0,
+                "crédit": 1000.0,
+            },
+            {
+                "date": "15/03/2022",
+                "compte": "606",
+                "libellé": "Fournitures été",
+                "débit": 12.5,
+                "crédit": 0.0,
+            },
+        ]
+        with JournalPartage.creer(records, ["journal.csv"]) as journal:
+            self.assertEqual(len(journal), 3)
+            self.assertEqual(journal.records(), records)
+            frame = journal.frame()
+            self.assertEqual(
+                frame["date"].dt.strftime("%d/%m/%Y").tolist(),
+                [r["date"] for r in records],
+            )
+            self.assertEqual(
+                frame["libellé"].tolist(), [r["libellé"] for r in records]
+            )
+            self.assertTrue(
+                np.shares_memory(
+                    frame["débit"].to_numpy(), journal.colonne("débits")
+                )
+            )
+            del frame
+
+            # Un autre attachement voit les mêmes colonnes, sans copie
+            autre = JournalPartage.attacher(journal.descripteur)
+            debits = autre.colonne("débits")
+            self.assertEqual(debits.tolist(), [1000.0, 0.0, 12.5])
+            self.assertFalse(debits.flags.owndata)
+            self.assertEqual(autre.textes("comptes"), ["512", "101", "606"])
+            del debits
+            autre.fermer()
+
+        with partager(records, ["journal.csv"]):
+            self.assertIsNotNone(journal_partage(["journal.csv"]))
+            self.assertIsNone(journal_partage(["autre.csv"]))
+        self.assertEqual(JOURNAUX, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+"""
+Périodes de reporting et situations intermédiaires.
+
+Les mouvements sont agrégés une fois par compte et par période (mois,
+trimestre...). Les situations de fin de période sont ensuite les sommes
+cumulées de ces agrégats: douze situations mensuelles coûtent une agrégation
+et un cumul, comme une situation annuelle.
+"""
+import typing as t
+import unittest
+import numpy as np
+import pandas as pd
+from .stockage import Stockage
+from .twr import Frequency, to_period_alias
+
+if t.TYPE_CHECKING:
+    from . import Account, Record
+
+
+def bornes(
+    annee: t.Optional[int] = None,
+    du: t.Optional[str] = None,
+    au: t.Optional[str] = None,
+) -> tuple[pd.Timestamp, pd.Timestamp]:
+    """
+    Dates de début et de fin (JJ/MM/AAAA) d'une période, par défaut
+    l'année civile
+    """
+    if annee is None and (du is None or au is None):
+        raise ValueError("Préciser l'année ou les dates de début et de fin")
+    debut = pd.to_datetime(du or f"01/01/{annee}", format="%d/%m/%Y")
+    fin = pd.to_datetime(au or f"31/12/{annee}", format="%d/%m/%Y")
+    if fin < debut:
+        raise ValueError(f"Période vide: {du} - {au}")
+    return debut, fin
+
+
+def dates_records(records: list["Record"]) -> pd.Series:
+    """
+    Dates des écritures
+    """
+    return pd.to_datetime(
+        pd.Series([r["date"] for r in records], dtype=str), format="%d/%m/%Y"
+    )
+
+
+def filtrer_periode(
+    records: list["Record"], du: pd.Timestamp, au: pd.Timestamp
+) -> list["Record"]:
+    """
+    Ecritures datées entre du et au inclus
+    """
+    dates = dates_records(records)
+    garder = ((dates >= du) & (dates <= au)).to_numpy()
+    return [r for r, g in zip(records, garder) if g]
+
+
+def mouvements_par_periode(
+    records: t.Union[list["Record"], pd.DataFrame, Stockage],
+    frequence: Frequency = "monthly",
+    du: t.Optional[pd.Timestamp] = None,
+    au: t.Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    """
+    Agrège les mouvements (débit - crédit) par compte et par période, en
+    une seule passe sur les écritures.
+
+    Retourne un DataFrame avec les comptes en index et toutes les périodes
+    entre du et au (par défaut la première et la dernière écriture) en
+    colonnes, y compris celles sans écriture. Avec une base, les écritures
+    de la période sont agrégées par jour par SQLite.
+    """
+    alias = to_period_alias(frequence)
+    if isinstance(records, Stockage):
+        df = records.selection(du, au).mouvements_journaliers()
+    elif isinstance(records, pd.DataFrame):
+        df = records
+    else:
+        df = pd.DataFrame.from_records(
+            records, columns=["date", "compte", "débit", "crédit"]
+        )
+    dates = pd.to_datetime(df["date"], format="%d/%m/%Y")
+    if du is not None:
+        df, dates = df[dates >= du], dates[dates >= du]
+    if au is not None:
+        df, dates = df[dates <= au], dates[dates <= au]
+
+    periode = dates.dt.to_period(alias).rename("période")
+    mouvements = (df["débit"] - df["crédit"]).groupby([df["compte"], periode])
+    mouvements = mouvements.sum().unstack("période", fill_value=0.0)
+
+    debut = du if du is not None else dates.min()
+    fin = au if au is not None else dates.max()
+    if pd.isna(debut) or pd.isna(fin):
+        return mouvements
+    periodes = pd.period_range(debut, fin, freq=alias, name="période")
+    return mouvements.reindex(columns=periodes, fill_value=0.0)
+
+
+def situations(
+    mouvements: pd.DataFrame, ouverture: t.Optional[pd.Series] = None
+) -> pd.DataFrame:
+    """
+    Soldes de chaque compte à la fin de chaque période: cumul des
+    mouvements, à partir des soldes d'ouverture s'ils sont donnés
+    """
+    cumul = mouvements.cumsum(axis=1)
+    if ouverture is not None:
+        cumul = cumul.add(
+            ouverture.reindex(cumul.index, fill_value=0.0), axis=0
+        )
+    return cumul
+
+
+def comptes_situation(
+    situation: pd.Series, intitules: dict[str, str]
+) -> list["Account"]:
+    """
+    Comptes et soldes d'une situation
+    """
+    return [
+        {
+            "compte": str(compte),
+            "intitulé": intitules.get(compte, f"Compte {compte}"),
+            "solde": float(solde),
+        }
+        for compte, solde in situation.items()
+        if not np.isclose(solde, 0.0)
+    ]
+
+
+class TestPeriodes(unittest.TestCase):
+    def test_situations(self):
+        records: list["Record"] = [
+            {
+                "date": "15/01/2022",
+                "compte": "512",
+                "libellé": "Vente",
+                "débit": 100.0,
+                "crédit": 0.0,
+            },
+            {
+                "date": "15/01/2022",
+                "compte": "706",
+                "libellé": "Vente",
+                "débit": 0.0,
+                "crédit": 100.0,
+            },
+            {
+                "date": "10/03/2022",
+                "compte": "512",
+                "libellé": "Loyer",
+                "débit": 0.0,
+                "crédit": 40.0,
+            },
+            {
+                "date": "10/03/2022",
+                "compte": "613",
+                "libellé": "Loyer",
+                "débit": 40.0,
+                "crédit": 0.0,
+            },
+        ]
+        du, au = bornes(2022, au="31/03/2022")
+        mouvements = mouvements_par_periode(records, "monthly", du, au)
+        self.assertEqual(len(mouvements.columns), 3)
+
+        fins = situations(mouvements)
+        self.assertEqual(fins.loc["512"].tolist(), [100.0, 100.0, 60.0])
+        self.assertEqual(fins.loc["706"].tolist(), [-100.0, -100.0, -100.0])
+
+        trimestres = mouvements_par_periode(records, "quarterly")
+        self.assertEqual(trimestres["2022Q1"].sum(), 0.0)
+
+        janvier = pd.Timestamp("2022-01-31")
+        self.assertEqual(len(filtrer_periode(records, du, janvier)), 2)
+        comptes = comptes_situation(fins.iloc[:, 0], {"512": "Banque"})
+        self.assertEqual(
+            [(c["compte"], c["intitulé"]) for c in comptes],
+            [("512", "Banque"), ("706", "Compte 706")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
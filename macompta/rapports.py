@@ -0,0 +1,280 @@
+"""
+Rendu texte du grand livre et de la balance des comptes, compte par compte.
+
+Le rendu de chaque compte est gardé: après une modification du journal,
+seuls les comptes dont les écritures ont changé (et les comptes dont ils
+sont les sous-comptes) sont rendus à nouveau, les autres sont repris tels
+quels (voir surveiller.py).
+"""
+import typing as t
+import logging
+import unittest
+import pandas as pd
+from . import filter_accounts_by_class, filter_records_by_account
+from .cumuls import Cumuls
+from .periodes import filtrer_periode
+from .rollup import Rollup
+from .utils import two_decimals
+
+if t.TYPE_CHECKING:
+    from . import Account, Record
+
+logger = logging.getLogger(__name__)
+
+
+class Sections:
+    """
+    Rendus par compte, gardés d'un rendu à l'autre
+    """
+
+    def __init__(self):
+        self.rendus: dict[tuple[str, str], str] = {}
+
+    def invalider(self, comptes: t.Optional[t.Iterable[str]] = None) -> None:
+        """
+        Oublie le rendu des comptes modifiés, et de leurs préfixes (le
+        rendu d'un compte comprend ses sous-comptes), ou de tous les comptes
+        """
+        if comptes is None:
+            self.rendus.clear()
+            return
+        prefixes = {c[:i] for c in comptes for i in range(1, len(c) + 1)}
+        self.rendus = {
+            cle: rendu
+            for cle, rendu in self.rendus.items()
+            if cle[0] not in prefixes
+        }
+
+    def rendu(
+        self, account: "Account", rendre: t.Callable[["Account"], str]
+    ) -> str:
+        # Un changement d'intitulé change la clé, donc le rendu
+        cle = (account["compte"], account["intitulé"])
+        if cle not in self.rendus:
+            self.rendus[cle] = rendre(account)
+        return self.rendus[cle]
+
+
+def ligne_total(libelle: str, total: pd.Series) -> str:
+    """
+    Ligne de sous-total d'un préfixe de compte
+    """
+    return (
+        f"\t{libelle}\t{two_decimals(total['débit'])}"
+        f"\t{two_decimals(total['crédit'])}\t{two_decimals(total['solde'])}\n"
+    )
+
+
+class GrandLivre(Sections):
+    """
+    Grand livre de la période: les opérations compte par compte, classe par
+    classe, avec le solde progressif et les sous-totaux demandés
+    """
+
+    def __init__(
+        self,
+        du: pd.Timestamp,
+        au: pd.Timestamp,
+        profondeurs: t.Sequence[int] = (),
+        prefixes: t.Sequence[str] = (),
+    ):
+        super().__init__()
+        self.du, self.au = du, au
+        self.profondeurs = sorted(p for p in profondeurs if p > 1)
+        self.prefixes = tuple(prefixes)
+
+    def rendre(
+        self, accounts: list["Account"], records: list["Record"]
+    ) -> str:
+        """
+        Texte du grand livre (comptes triés)
+        """
+        du, au = self.du, self.au
+        # Sous-totaux de tous les préfixes sur la période; les cumuls (solde
+        # progressif depuis les écritures antérieures) ne sont calculés que
+        # s'il reste des comptes à rendre
+        rollup = Rollup.from_records(filtrer_periode(records, du, au))
+        cumuls: list[Cumuls] = []
+
+        def rendre_compte(account: "Account") -> str:
+            if not cumuls:
+                cumuls.append(Cumuls(records))
+            compte = account["compte"]
+            total = rollup.total(compte)
+            lignes = [
+                f"{compte}\t{account['intitulé']}"
+                f"\t{two_decimals(total['débit'])}"
+                f"\t{two_decimals(total['crédit'])}"
+                f"\t{two_decimals(total['solde'])}\n"
+            ]
+            ecritures = cumuls[0].soldes_courants(compte)
+            ecritures = ecritures[
+                (ecritures["date"] >= du) & (ecritures["date"] <= au)
+            ]
+            for libelle, debit, credit, solde in zip(
+                ecritures["libellé"],
+                ecritures["débit"],
+                ecritures["crédit"],
+                ecritures["solde"],
+            ):
+                lignes.append(
+                    f"\t{libelle}\t{two_decimals(debit)}"
+                    f"\t{two_decimals(credit)}\t{two_decimals(solde)}\n"
+                )
+            lignes.append("\n")
+            return "".join(lignes)
+
+        texte = [
+            "Grand livre\n",
+            f"{du.day}.{du.month}.{du.year} - {au.day}.{au.month}.{au.year}\n",
+            "\n",
+            "Compte\tLibellé\tDébit\tCrédit\tSolde\n",
+        ]
+        for classe in range(1, 9):
+            accounts_classe = [
+                a for a in accounts if a["compte"].startswith(str(classe))
+            ]
+            if self.prefixes:
+                accounts_classe = [
+                    a
+                    for a in accounts_classe
+                    if a["compte"].startswith(self.prefixes)
+                ]
+                if not accounts_classe:
+                    continue
+
+            texte += [f"Classe {classe}\n", "\n"]
+            logger.info(f"Classe {classe} : {len(accounts_classe)} comptes")
+
+            for i, account in enumerate(accounts_classe):
+                compte = account["compte"]
+                texte.append(self.rendu(account, rendre_compte))
+
+                # Sous-totaux des préfixes qui se terminent avec ce compte
+                suivant = (
+                    accounts_classe[i + 1]["compte"]
+                    if i + 1 < len(accounts_classe)
+                    else ""
+                )
+                for profondeur in reversed(self.profondeurs):
+                    prefixe = compte[:profondeur]
+                    if len(prefixe) == profondeur and not suivant.startswith(
+                        prefixe
+                    ):
+                        texte.append(
+                            ligne_total(
+                                f"Total {prefixe}", rollup.total(prefixe)
+                            )
+                        )
+
+            # Total de la classe
+            texte += [ligne_total("", rollup.total(str(classe))), "\n"]
+        return "".join(texte)
+
+
+class Balance(Sections):
+    """
+    Balance des comptes: mouvements et solde débiteur ou créditeur de
+    chaque compte (sous-comptes compris)
+    """
+
+    def __init__(self, annee: int):
+        super().__init__()
+        self.annee = annee
+
+    def rendre(
+        self, accounts: list["Account"], records: list["Record"]
+    ) -> str:
+        """
+        Texte de la balance (comptes triés)
+        """
+
+        def rendre_compte(account: "Account") -> str:
+            records_account = filter_records_by_account(
+                records, account["compte"]
+            )
+            mvt_credit = sum([record["crédit"] for record in records_account])
+            mvt_debit = sum([record["débit"] for record in records_account])
+            return ligne_balance(account, mvt_debit, mvt_credit)
+
+        texte = [
+            "Grand livre\n",
+            f"1.1.{self.annee} - 31.12.{self.annee}\n",
+            "\n",
+            "Numéro de\tLibellé\tMouvement\t\tSolde\n",
+            "Compte\tLibellé\tDébit\tCrédit\tSolde\n",
+        ]
+        for classe in range(1, 9):
+            for account in filter_accounts_by_class(accounts, classe):
+                texte.append(self.rendu(account, rendre_compte))
+        return "".join(texte)
+
+
+def ligne_balance(
+    account: "Account", mvt_debit: float, mvt_credit: float
+) -> str:
+    """
+    Ligne de la balance d'un compte
+    """
+    balance = mvt_debit - mvt_credit
+    solde_debit = balance if balance > 0 else 0
+    solde_credit = -balance if balance < 0 else 0
+    return (
+        f"{account['compte']}\t{account['intitulé']}\t"
+        f"{two_decimals(mvt_debit)}\t"
+        f"{two_decimals(mvt_credit)}\t"
+        f"{two_decimals(solde_debit)}\t"
+        f"{two_decimals(solde_credit)}\n"
+    )
+
+
+class TestRapports(unittest.TestCase):
+    def test_grand_livre(self):
+        records: list["Record"] = [
+            {
+                "date": "01/01/2022",
+                "compte": "512",
+                "libellé": "Apport",
+                "débit": 1000.0,
+                "crédit": 0.0,
+            },
+            {
+                "date": "01/01/2022",
+                "compte": "101",
+                "libellé": "Apport",
+                "débit": 0.0,
+                "crédit": 1000.0,
+            },
+        ]
+        accounts: list["Account"] = [
+            {"compte": "101", "intitulé": "Capital", "solde": 0.0},
+            {"compte": "512", "intitulé": "Banque", "solde": 0.0},
+        ]
+        du, au = pd.Timestamp("2022-01-01"), pd.Timestamp("2022-12-31")
+        grand_livre = GrandLivre(du, au)
+        texte = grand_livre.rendre(accounts, records)
+        self.assertIn("512\tBanque\t1000.0\t0.0\t1000.0\n", texte)
+
+        # Seule la section du compte modifié est rendue à nouveau
+        capital = grand_livre.rendus[("101", "Capital")]
+        records.append(
+            {
+                "date": "02/01/2022",
+                "compte": "512100",
+                "libellé": "Virement",
+                "débit": 50.0,
+                "crédit": 0.0,
+            }
+        )
+        grand_livre.invalider(["512100"])
+        self.assertNotIn(("512", "Banque"), grand_livre.rendus)
+        texte = grand_livre.rendre(accounts, records)
+        self.assertIs(grand_livre.rendus[("101", "Capital")], capital)
+        self.assertIn("512\tBanque\t1050.0\t0.0\t1050.0\n", texte)
+
+        balance = Balance(2022).rendre(accounts, records)
+        self.assertIn("512\tBanque\t1050.0\t0.0\t1050.0\t0\n", balance)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,318 @@
+"""
+Compte de résultat et soldes intermédiaires de gestion (SIG), calculés
+directement depuis le journal en une seule agrégation des comptes 6 et 7.
+"""
+import typing as t
+import unittest
+import numpy as np
+import pandas as pd
+from .bilan import Ligne, ecritures_avant_cloture
+from .mapping import compile_prefixes, lookup
+from .periodes import mouvements_par_periode
+from .stockage import Stockage
+from .twr import Frequency, to_period_alias
+
+if t.TYPE_CHECKING:
+    from . import Record
+
+POSTES: list[Ligne] = [
+    {
+        "section": "Produits d'exploitation",
+        "ligne": "Ventes de marchandises",
+        "comptes": ["707", "7097"],
+    },
+    {
+        "section": "Produits d'exploitation",
+        "ligne": "Production vendue",
+        "comptes": ["70"],
+    },
+    {
+        "section": "Produits d'exploitation",
+        "ligne": "Production stockée",
+        "comptes": ["71"],
+    },
+    {
+        "section": "Produits d'exploitation",
+        "ligne": "Production immobilisée",
+        "comptes": ["72"],
+    },
+    {
+        "section": "Produits d'exploitation",
+        "ligne": "Subventions d'exploitation",
+        "comptes": ["74"],
+    },
+    {
+        "section": "Produits d'exploitation",
+        "ligne": "Reprises sur amortissements et provisions, transferts",
+        "comptes": ["781", "791"],
+    },
+    {
+        "section": "Produits d'exploitation",
+        "ligne": "Autres produits",
+        "comptes": ["7", "75"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Achats de marchandises",
+        "comptes": ["607", "6097"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Variation de stock de marchandises",
+        "comptes": ["6037"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Achats de matières premières et approvisionnements",
+        "comptes": ["601", "602", "6091", "6092"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Variation de stock de matières premières",
+        "comptes": ["603"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Autres achats et charges externes",
+        "comptes": ["60", "61", "62"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Impôts, taxes et versements assimilés",
+        "comptes": ["63"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Salaires et traitements",
+        "comptes": ["64"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Charges sociales",
+        "comptes": ["645", "646", "647", "648"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Dotations aux amortissements et provisions",
+        "comptes": ["68"],
+    },
+    {
+        "section": "Charges d'exploitation",
+        "ligne": "Autres charges",
+        "comptes": ["6", "65"],
+    },
+    {
+        "section": "Produits financiers",
+        "ligne": "Produits financiers",
+        "comptes": ["76", "786", "796"],
+    },
+    {
+        "section": "Charges financières",
+        "ligne": "Charges financières",
+        "comptes": ["66", "686"],
+    },
+    {
+        "section": "Produits exceptionnels",
+        "ligne": "Produits exceptionnels",
+        "comptes": ["77", "787", "797"],
+    },
+    {
+        "section": "Charges exceptionnelles",
+        "ligne": "Charges exceptionnelles",
+        "comptes": ["67", "687"],
+    },
+    {
+        "section": "Impôts",
+        "ligne": "Participation des salariés",
+        "comptes": ["691"],
+    },
+    {
+        "section": "Impôts",
+        "ligne": "Impôts sur les bénéfices",
+        "comptes": ["69"],
+    },
+]
+
+# Chaque solde est la somme algébrique (produits - charges) de postes ou de
+# soldes précédents
+SIG: dict[str, list[str]] = {
+    "Marge commerciale": [
+        "Ventes de marchandises",
+        "Achats de marchandises",
+        "Variation de stock de marchandises",
+    ],
+    "Production de l'exercice": [
+        "Production vendue",
+        "Production stockée",
+        "Production immobilisée",
+    ],
+    "Valeur ajoutée": [
+        "Marge commerciale",
+        "Production de l'exercice",
+        "Achats de matières premières et approvisionnements",
+        "Variation de stock de matières premières",
+        "Autres achats et charges externes",
+    ],
+    "Excédent brut d'exploitation": [
+        "Valeur ajoutée",
+        "Subventions d'exploitation",
+        "Impôts, taxes et versements assimilés",
+        "Salaires et traitements",
+        "Charges sociales",
+    ],
+    "Résultat d'exploitation": [
+        "Excédent brut d'exploitation",
+        "Reprises sur amortissements et provisions, transferts",
+        "Autres produits",
+        "Dotations aux amortissements et provisions",
+        "Autres charges",
+    ],
+    "Résultat financier": ["Produits financiers", "Charges financières"],
+    "Résultat courant avant impôts": [
+        "Résultat d'exploitation",
+        "Résultat financier",
+    ],
+    "Résultat exceptionnel": [
+        "Produits exceptionnels",
+        "Charges exceptionnelles",
+    ],
+    "Résultat de l'exercice": [
+        "Résultat courant avant impôts",
+        "Résultat exceptionnel",
+        "Participation des salariés",
+        "Impôts sur les bénéfices",
+    ],
+}
+
+
+class CompteResultat(t.NamedTuple):
+    comptes: pd.DataFrame
+    postes: pd.DataFrame
+    sig: pd.DataFrame
+
+
+def soldes_par_periode(
+    records: t.Union[list["Record"], pd.DataFrame, Stockage],
+    frequence: Frequency = "monthly",
+    du: t.Optional[pd.Timestamp] = None,
+    au: t.Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    """
+    Agrège les écritures des comptes 6 et 7 (hors clôture) par compte et
+    par période, en une seule passe.
+
+    Retourne un DataFrame avec les comptes en index, les périodes en
+    colonnes et le solde (crédit - débit) en valeur: les produits sont
+    positifs, les charges négatives.
+    """
+    mouvements = mouvements_par_periode(
+        ecritures_avant_cloture(records), frequence, du, au
+    )
+    gestion = mouvements.index.str.startswith(("6", "7"))
+    return 0.0 - mouvements[gestion]
+
+
+def regrouper(soldes: pd.DataFrame, frequence: Frequency) -> pd.DataFrame:
+    """
+    Regroupe les colonnes de période vers une fréquence moins fine (par
+    exemple des mois vers des années) sans relire les écritures.
+    """
+    colonnes = soldes.columns.asfreq(to_period_alias(frequence))
+    return soldes.T.groupby(colonnes).sum().T
+
+
+def compte_resultat(
+    soldes: pd.DataFrame, postes: list[Ligne] = POSTES
+) -> CompteResultat:
+    """
+    Calcule le compte de résultat et les SIG à partir des soldes par compte
+    et par période (voir soldes_par_periode).
+
+    Les montants des postes sont positifs, qu'il s'agisse de produits ou de
+    charges. Les SIG sont des soldes produits - charges.
+    """
+    table = compile_prefixes(
+        {p: i for i, ligne in enumerate(postes) for p in ligne["comptes"]}
+    )
+    numeros = lookup(table, soldes.index.to_numpy(dtype=str))
+    if (numeros < 0).any():
+        inconnus = soldes.index[numeros < 0].tolist()
+        raise ValueError(f"Comptes sans poste: {inconnus}")
+
+    noms = [ligne["ligne"] for ligne in postes]
+    algebriques = soldes.groupby(np.take(noms, numeros)).sum()
+    algebriques = algebriques.reindex(noms, fill_value=0.0)
+
+    soldes_sig: dict[str, pd.Series] = {}
+    for nom, composantes in SIG.items():
+        soldes_sig[nom] = sum(
+            soldes_sig[c] if c in soldes_sig else algebriques.loc[c]
+            for c in composantes
+        )
+
+    # Charges présentées en positif
+    charges = np.array([ligne["comptes"][0][0] == "6" for ligne in postes])
+    montants = algebriques.mul(np.where(charges, -1.0, 1.0), axis=0) + 0.0
+    montants.insert(0, "section", [ligne["section"] for ligne in postes])
+    montants.index.name = "ligne"
+
+    return CompteResultat(
+        soldes, montants, pd.DataFrame(soldes_sig).T.rename_axis("solde")
+    )
+
+
+class TestResultat(unittest.TestCase):
+    def test_compte_resultat(self):
+        records: list["Record"] = [
+            {
+                "date": "01/02/2022",
+                "compte": "706",
+                "libellé": "Vente",
+                "débit": 0.0,
+                "crédit": 1000.0,
+            },
+            {
+                "date": "01/03/2022",
+                "compte": "606",
+                "libellé": "Fournitures",
+                "débit": 100.0,
+                "crédit": 0.0,
+            },
+            {
+                "date": "31/12/2022",
+                "compte": "681",
+                "libellé": "Dot. amort.",
+                "débit": 300.0,
+                "crédit": 0.0,
+            },
+            {
+                "date": "15/01/2023",
+                "compte": "706",
+                "libellé": "Vente",
+                "débit": 0.0,
+                "crédit": 500.0,
+            },
+            {
+                "date": "31/12/2022",
+                "compte": "706",
+                "libellé": "Fermeture: Vente",
+                "débit": 1000.0,
+                "crédit": 0.0,
+            },
+        ]
+        soldes = soldes_par_periode(records)
+        self.assertEqual(len(soldes.columns), 12)
+
+        resultat = compte_resultat(regrouper(soldes, "yearly"))
+        n, n1 = pd.Period("2022", "Y"), pd.Period("2023", "Y")
+        self.assertEqual(resultat.postes.loc["Production vendue", n], 1000.0)
+        self.assertEqual(
+            resultat.postes.loc["Autres achats et charges externes", n], 100.0
+        )
+        self.assertEqual(resultat.sig.loc["Valeur ajoutée", n], 900.0)
+        self.assertEqual(resultat.sig.loc["Résultat d'exploitation", n], 600.0)
+        self.assertEqual(resultat.sig.loc["Résultat de l'exercice", n1], 500.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Arbre des préfixes du plan de comptes: classe (1 chiffre) -> compte
+(2, 3 chiffres...) -> sous-compte.
+
+Les montants des comptes feuilles sont remontés à tous les niveaux en une
+seule passe ascendante; le sous-total d'un préfixe est ensuite lu en O(1).
+"""
+import typing as t
+import unittest
+import numpy as np
+import pandas as pd
+
+if t.TYPE_CHECKING:
+    from . import Record
+
+
+class Rollup:
+    """
+    Sous-totaux de tous les préfixes d'un ensemble de comptes.
+    """
+
+    def __init__(self, montants: pd.DataFrame):
+        """
+        montants: DataFrame indexé par compte, une colonne par montant
+        (débit, crédit, solde...)
+        """
+        comptes = [str(c) for c in montants.index]
+        prefixes = sorted(
+            {c[:i] for c in comptes for i in range(1, len(c) + 1)}
+        )
+        self.noeuds: dict[str, int] = {p: i for i, p in enumerate(prefixes)}
+        self.profondeurs = np.array([len(p) for p in prefixes], dtype=int)
+        self.parents = np.array(
+            [self.noeuds[p[:-1]] if len(p) > 1 else -1 for p in prefixes],
+            dtype=int,
+        )
+        self.colonnes = list(montants.columns)
+
+        # Montants propres à chaque noeud (un compte peut être le préfixe
+        # d'un autre, par exemple 512 et 512100)
+        self.totaux = np.zeros((len(prefixes), len(self.colonnes)))
+        np.add.at(
+            self.totaux,
+            [self.noeuds[c] for c in comptes],
+            montants.to_numpy(dtype=float),
+        )
+
+        # Passe ascendante: chaque niveau s'ajoute à son parent
+        for profondeur in range(self.profondeurs.max(initial=0), 1, -1):
+            niveau = np.flatnonzero(self.profondeurs == profondeur)
+            np.add.at(self.totaux, self.parents[niveau], self.totaux[niveau])
+
+    @classmethod
+    def from_records(cls, records: list["Record"]) -> "Rollup":
+        """
+        Sous-totaux débit, crédit et solde des écritures
+        """
+        df = pd.DataFrame.from_records(
+            records, columns=["compte", "débit", "crédit"]
+        )
+        montants = df.groupby("compte")[["débit", "crédit"]].sum()
+        montants["solde"] = montants["débit"] - montants["crédit"]
+        return cls(montants)
+
+    def total(self, prefixe: str) -> pd.Series:
+        """
+        Sous-total d'un préfixe, nul si aucun compte ne commence par ce
+        préfixe
+        """
+        if prefixe not in self.noeuds:
+            return pd.Series(0.0, index=self.colonnes)
+        return pd.Series(
+            self.totaux[self.noeuds[prefixe]], index=self.colonnes
+        )
+
+    def niveau(self, profondeur: int) -> pd.DataFrame:
+        """
+        Sous-totaux de tous les préfixes d'une longueur donnée
+        """
+        prefixes = [p for p in self.noeuds if len(p) == profondeur]
+        return pd.DataFrame(
+            self.totaux[[self.noeuds[p] for p in prefixes]],
+            index=pd.Index(prefixes, name="compte"),
+            columns=self.colonnes,
+        )
+
+    def enfants(self, prefixe: str) -> list[str]:
+        """
+        Préfixes fils directs d'un préfixe
+        """
+        if prefixe not in self.noeuds:
+            return []
+        parent = self.noeuds[prefixe]
+        prefixes = list(self.noeuds)
+        return [prefixes[i] for i in np.flatnonzero(self.parents == parent)]
+
+
+class TestRollup(unittest.TestCase):
+    def test_rollup(self):
+        montants = pd.DataFrame(
+            {"solde": [100.0, 50.0, 25.0, -30.0, 10.0]},
+            index=["211", "213", "2813", "512", "512100"],
+        )
+        rollup = Rollup(montants)
+        self.assertEqual(rollup.total("2")["solde"], 175.0)
+        self.assertEqual(rollup.total("21")["solde"], 150.0)
+        self.assertEqual(rollup.total("28")["solde"], 25.0)
+        self.assertEqual(rollup.total("512")["solde"], -20.0)
+        self.assertEqual(rollup.total("6")["solde"], 0.0)
+        self.assertEqual(rollup.enfants("2"), ["21", "28"])
+        self.assertEqual(
+            rollup.niveau(1)["solde"].to_dict(), {"2": 175.0, "5": -20.0}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+"""
+Schémas des journaux.
+
+Les journaux arrivent sous plusieurs formes: le livre-journal natif
+(date, compte, libellé, débit, crédit) ou les exports ("N de compte",
+"Débit", "Crédit", montants en "€10,000.00"...). Chaque forme connue est
+décrite par la correspondance de ses colonnes vers les colonnes du journal,
+et toutes sont lues par le même chemin: lecture du CSV en texte, renommage,
+puis conversion des dates et des montants colonne par colonne.
+"""
+import typing as t
+import csv
+import unittest
+import io
+from pathlib import Path
+import pandas as pd
+from .utils import convert_dates, parse_montants
+
+if t.TYPE_CHECKING:
+    from . import Record
+
+# Colonnes du journal, dans l'ordre des écritures (Record)
+COLONNES = ["date", "compte", "libellé", "débit", "crédit"]
+
+# Correspondance des colonnes de chaque schéma vers celles du journal
+SCHEMAS: dict[str, dict[str, str]] = {
+    "journal": {c: c for c in COLONNES},
+    "export": {
+        "Date": "date",
+        "N de compte": "compte",
+        "Libellé": "libellé",
+        "Débit": "débit",
+        "Crédit": "crédit",
+    },
+}
+
+
+def detecter_schema(colonnes: t.Iterable[str]) -> t.Optional[str]:
+    """
+    Premier schéma dont toutes les colonnes sont présentes
+    """
+    presentes = {str(c).strip() for c in colonnes}
+    for nom, correspondance in SCHEMAS.items():
+        if presentes.issuperset(correspondance):
+            return nom
+    return None
+
+
+def adapter(df: pd.DataFrame, schema: t.Optional[str] = None) -> pd.DataFrame:
+    """
+    Colonnes du journal (dates JJ/MM/AAAA, comptes et libellés en texte,
+    montants en nombres) à partir d'un DataFrame d'un schéma connu. Les
+    autres colonnes sont gardées telles quelles, après celles du journal.
+    """
+    df = df.rename(columns=lambda c: str(c).strip())
+    if schema is None:
+        schema = detecter_schema(df.columns)
+    if schema is None:
+        raise ValueError(f"Schéma de journal inconnu: {list(df.columns)}")
+
+    df = df.rename(columns=SCHEMAS[schema])
+    autres = [c for c in df.columns if c not in COLONNES]
+    df = df[COLONNES + autres].copy()
+    df["date"] = convert_dates(df["date"])
+    df["compte"] = df["compte"].astype(str).str.strip()
+    df["libellé"] = df["libellé"].fillna("").astype(str)
+    df["débit"] = parse_montants(df["débit"]).fillna(0.0)
+    df["crédit"] = parse_montants(df["crédit"]).fillna(0.0)
+    return df
+
+
+def lire_journal(
+    journal: t.Union[Path, t.TextIO], schema: t.Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Lit un journal CSV d'un schéma connu. Une ligne de titre avant les
+    en-têtes (exports) est sautée.
+    """
+    if not isinstance(journal, (str, Path)):
+        return _lire_journal(journal, schema)
+    with open(journal, newline="", encoding="utf-8-sig") as f:
+        return _lire_journal(f, schema)
+
+
+def blocs_journal(
+    journal: Path, taille: int = 100_000, schema: t.Optional[str] = None
+) -> t.Iterator[pd.DataFrame]:
+    """
+    Lit un journal CSV par blocs d'au plus taille lignes, chaque bloc étant
+    adapté aux colonnes du journal
+    """
+    with open(journal, newline="", encoding="utf-8-sig") as f:
+        entetes = _entetes(f)
+        for bloc in pd.read_csv(
+            f,
+            dtype=str,
+            keep_default_na=False,
+            names=entetes,
+            chunksize=taille,
+        ):
+            yield adapter(bloc, schema)
+
+
+def _entetes(f: t.TextIO) -> t.Optional[list[str]]:
+    # Les en-têtes sont sur la première ligne, ou sur la deuxième après une
+    # ligne de titre (None: à lire par read_csv)
+    premiere = next(csv.reader([f.readline()]), [])
+    return None if detecter_schema(premiere) is None else premiere
+
+
+def _lire_journal(f: t.TextIO, schema: t.Optional[str]) -> pd.DataFrame:
+    entetes = _entetes(f)
+    return adapter(
+        pd.read_csv(f, dtype=str, keep_default_na=False, names=entetes),
+        schema,
+    )
+
+
+def records_journal(df: pd.DataFrame) -> list["Record"]:
+    """
+    Ecritures d'un journal adapté
+    """
+    return df[COLONNES].to_dict("records")  # type: ignore[return-value]
+
+
+class TestSchema(unittest.TestCase):
+    def test_parse_montants(self):
+        montants = pd.Series(
+            ["€10,000.00", "10 000,00 €", "(1 234,50 €)", "-12.5", "1,5", ""]
+        )
+        self.assertEqual(
+            parse_montants(montants).fillna(0.0).tolist(),
+            [10000.0, 10000.0, -1234.5, -12.5, 1.5, 0.0],
+        )
+
+    def test_lire_journal(self):
+        export = io.StringIO(
+            "Journal export\n"
+            "Journal,Numéro,Date,Libellé,N de compte,Débit,Crédit\n"
+            'BQ,1,2022-01-03,Achat,606000,"€1,120.50",€0.00\n'
+            'BQ,1,2022-01-03,Achat,512000,€0.00,"€1,120.50"\n'
+        )
+        df = lire_journal(export)
+        self.assertEqual(list(df.columns), COLONNES + ["Journal", "Numéro"])
+        self.assertEqual(
+            records_journal(df)[0],
+            {
+                "date": "03/01/2022",
+                "compte": "606000",
+                "libellé": "Achat",
+                "débit": 1120.5,
+                "crédit": 0.0,
+            },
+        )
+
+        journal = io.StringIO(
+            "date,compte,libellé,débit,crédit\n"
+            "01/01/2022,512,Apport,1000.0,0.0\n"
+        )
+        self.assertEqual(lire_journal(journal)["débit"].tolist(), [1000.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,536 @@
+"""
+Service local du grand livre: les journaux sont chargés une fois, et les
+requêtes (balance, grand livre d'un compte, solde, bilan provisoire) sont
+servies en HTTP sur un port local ou une socket Unix.
+
+Les écritures sont indexées par compte, triées par date, avec les débits
+et crédits cumulés: une balance ou un solde sur une période est une
+recherche dichotomique par compte. Les index sont construits d'un coup au
+chargement (un tri par compte et par date); les écritures ajoutées (POST
+/ecritures) mettent à jour les index du compte concerné, sans recharger
+les journaux.
+
+    GET  /balance?prefixe=4&du=01/01/2022&au=31/12/2022
+    GET  /grand-livre?compte=411&du=01/01/2022&au=31/12/2022
+    GET  /solde?compte=512&date=31/03/2022
+    GET  /bilan?au=31/12/2022
+    POST /ecritures  (journal CSV, avec ses en-têtes)
+"""
+import typing as t
+import asyncio
+import bisect
+import datetime
+import io
+import itertools
+import json
+import logging
+import unittest
+import urllib.parse
+from pathlib import Path
+import pandas as pd
+from .bilan import LIBELLES_CLOTURE, calculer_bilan
+from .mapping import FIN
+from .schema import COLONNES, lire_journal, records_journal
+
+if t.TYPE_CHECKING:
+    from . import Account, Record
+
+logger = logging.getLogger(__name__)
+
+Date = t.Union[str, pd.Timestamp, None]
+
+# Taille maximale d'une requête (en-têtes et corps)
+TAILLE_MAX = 64 * 1024 * 1024
+
+
+def jour(date: Date, defaut: int) -> int:
+    """
+    Numéro du jour d'une date JJ/MM/AAAA (ou d'un Timestamp)
+    """
+    if date is None or date == "":
+        return defaut
+    if isinstance(date, pd.Timestamp):
+        return date.toordinal()
+    return datetime.date(
+        int(date[6:10]), int(date[3:5]), int(date[0:2])
+    ).toordinal()
+
+
+def cloture(record: "Record") -> float:
+    """
+    Solde (débit - crédit) d'une écriture de clôture, 0 pour les autres
+    """
+    if record["libellé"].startswith(LIBELLES_CLOTURE):
+        return record["débit"] - record["crédit"]
+    return 0.0
+
+
+class Mouvements:
+    """
+    Ecritures d'un compte triées par date, avec les débits, les crédits et
+    les soldes des écritures de clôture cumulés
+    """
+
+    def __init__(self):
+        self.jours: list[int] = []
+        self.positions: list[int] = []
+        self.debits: list[float] = [0.0]
+        self.credits: list[float] = [0.0]
+        self.clotures: list[float] = [0.0]
+
+    @classmethod
+    def charger(
+        cls, jours: list[int], positions: list[int], records: list["Record"]
+    ) -> "Mouvements":
+        """
+        Index d'un compte à partir de ses écritures déjà triées par date
+        (jours et positions dans le journal)
+        """
+        mouvements = cls()
+        mouvements.jours = jours
+        mouvements.positions = positions
+        ecritures = [records[p] for p in positions]
+        mouvements.debits = list(
+            itertools.accumulate((r["débit"] for r in ecritures), initial=0.0)
+        )
+        mouvements.credits = list(
+            itertools.accumulate((r["crédit"] for r in ecritures), initial=0.0)
+        )
+        mouvements.clotures = list(
+            itertools.accumulate(map(cloture, ecritures), initial=0.0)
+        )
+        return mouvements
+
+    def inserer(self, jour: int, position: int, record: "Record") -> None:
+        # Après les écritures du même jour: l'ordre du journal est gardé
+        i = bisect.bisect_right(self.jours, jour)
+        self.jours.insert(i, jour)
+        self.positions.insert(i, position)
+        for cumuls, montant in [
+            (self.debits, record["débit"]),
+            (self.credits, record["crédit"]),
+            (self.clotures, cloture(record)),
+        ]:
+            cumuls.insert(i + 1, cumuls[i] + montant)
+            # Les cumuls suivants sont décalés (ajout hors de l'ordre)
+            for j in range(i + 2, len(cumuls)):
+                cumuls[j] += montant
+
+    def plage(self, du: int, au: int) -> tuple[int, int]:
+        """
+        Ecritures [début, fin) entre les jours du et au compris
+        """
+        return (
+            bisect.bisect_left(self.jours, du),
+            bisect.bisect_right(self.jours, au),
+        )
+
+    def solde(self, au: int, avant_cloture: bool = False) -> float:
+        """
+        Solde (débit - crédit) au jour compris
+        """
+        fin = bisect.bisect_right(self.jours, au)
+        solde = self.debits[fin] - self.credits[fin]
+        if avant_cloture:
+            solde -= self.clotures[fin]
+        return solde
+
+
+class Registre:
+    """
+    Ecritures en mémoire, indexées par compte
+    """
+
+    def __init__(
+        self,
+        records: t.Iterable["Record"] = (),
+        accounts: t.Iterable["Account"] = (),
+    ):
+        self.records: list["Record"] = list(records)
+        self.intitules = {a["compte"]: a["intitulé"] for a in accounts}
+        self.mouvements: dict[str, Mouvements] = {}
+
+        # Un tri (stable) par compte et par date, puis les cumuls de chaque
+        # compte d'un coup: les écritures d'un même jour gardent l'ordre du
+        # journal, comme avec ajouter
+        jours = [jour(r["date"], 0) for r in self.records]
+        ordre = sorted(
+            range(len(self.records)),
+            key=lambda i: (self.records[i]["compte"], jours[i]),
+        )
+        for compte, groupe in itertools.groupby(
+            ordre, key=lambda i: self.records[i]["compte"]
+        ):
+            positions = list(groupe)
+            self.mouvements[compte] = Mouvements.charger(
+                [jours[p] for p in positions], positions, self.records
+            )
+        # Comptes triés, pour les recherches par préfixe
+        self.comptes: list[str] = list(self.mouvements)
+
+    def ajouter(self, records: t.Iterable["Record"]) -> int:
+        """
+        Ajoute des écritures et met à jour les index. Retourne le nombre
+        d'écritures ajoutées.
+        """
+        nombre = 0
+        for record in records:
+            compte = record["compte"]
+            if compte not in self.mouvements:
+                self.mouvements[compte] = Mouvements()
+                bisect.insort(self.comptes, compte)
+            self.mouvements[compte].inserer(
+                jour(record["date"], 0), len(self.records), record
+            )
+            self.records.append(record)
+            nombre += 1
+        return nombre
+
+    def comptes_prefixe(self, prefixe: str = "") -> list[str]:
+        """
+        Comptes commençant par le préfixe
+        """
+        debut = bisect.bisect_left(self.comptes, prefixe)
+        fin = bisect.bisect_left(self.comptes, prefixe + FIN)
+        return self.comptes[debut:fin]
+
+    def balance(
+        self, prefixe: str = "", du: Date = None, au: Date = None
+    ) -> list[dict[str, t.Any]]:
+        """
+        Débits, crédits et solde de chaque compte sur la période
+        """
+        premier, dernier = jour(du, 0), jour(au, 10**9)
+        lignes = []
+        for compte in self.comptes_prefixe(prefixe):
+            mouvements = self.mouvements[compte]
+            debut, fin = mouvements.plage(premier, dernier)
+            if debut == fin:
+                continue
+            debit = mouvements.debits[fin] - mouvements.debits[debut]
+            credit = mouvements.credits[fin] - mouvements.credits[debut]
+            lignes.append(
+                {
+                    "compte": compte,
+                    "intitulé": self.intitule(compte),
+                    "débit": round(debit, 2),
+                    "crédit": round(credit, 2),
+                    "solde": round(debit - credit, 2),
+                }
+            )
+        return lignes
+
+    def solde(
+        self, prefixe: str, date: Date = None, avant_cloture: bool = False
+    ) -> float:
+        """
+        Solde (débit - crédit) des comptes commençant par le préfixe, à la
+        date comprise
+        """
+        dernier = jour(date, 10**9)
+        return sum(
+            self.mouvements[compte].solde(dernier, avant_cloture)
+            for compte in self.comptes_prefixe(prefixe)
+        )
+
+    def grand_livre(
+        self, prefixe: str, du: Date = None, au: Date = None
+    ) -> list[dict[str, t.Any]]:
+        """
+        Ecritures des comptes commençant par le préfixe sur la période,
+        compte par compte, avec le solde progressif depuis l'ouverture
+        """
+        premier, dernier = jour(du, 0), jour(au, 10**9)
+        lignes = []
+        for compte in self.comptes_prefixe(prefixe):
+            mouvements = self.mouvements[compte]
+            debut, fin = mouvements.plage(premier, dernier)
+            for i in range(debut, fin):
+                ligne = dict(self.records[mouvements.positions[i]])
+                solde = mouvements.debits[i + 1] - mouvements.credits[i + 1]
+                ligne["solde"] = round(solde, 2)
+                lignes.append(ligne)
+        return lignes
+
+    def intitule(self, compte: str) -> str:
+        return self.intitules.get(compte, f"Compte {compte}")
+
+    def accounts(
+        self, date: Date = None, avant_cloture: bool = False
+    ) -> list["Account"]:
+        """
+        Comptes connus avec leur solde à la date (voir update_accounts)
+        """
+        dernier = jour(date, 10**9)
+        comptes = sorted(set(self.intitules) | set(self.comptes))
+        return [
+            {
+                "compte": compte,
+                "intitulé": self.intitule(compte),
+                "solde": self.mouvements[compte].solde(dernier, avant_cloture)
+                if compte in self.mouvements
+                else 0.0,
+            }
+            for compte in comptes
+        ]
+
+    def bilan(self, au: Date = None) -> list[dict[str, t.Any]]:
+        """
+        Bilan provisoire à la date, hors écritures de clôture
+        """
+        bilan = calculer_bilan(self.accounts(au, avant_cloture=True))
+        return bilan.round(2).to_dict("records")
+
+
+class Serveur:
+    """
+    Serveur HTTP minimal (HTTP/1.1, une requête par connexion) au-dessus
+    d'un Registre. Les écritures reçues sont ajoutées au journal s'il est
+    donné.
+    """
+
+    def __init__(self, registre: Registre, journal: t.Optional[Path] = None):
+        self.registre = registre
+        self.journal = journal
+
+    async def servir(
+        self,
+        hote: str = "127.0.0.1",
+        port: int = 8765,
+        socket: t.Optional[Path] = None,
+    ) -> asyncio.AbstractServer:
+        """
+        Démarre l'écoute sur le port local, ou sur la socket Unix
+        """
+        if socket is not None:
+            return await asyncio.start_unix_server(
+                self.connexion, path=str(socket), limit=TAILLE_MAX
+            )
+        return await asyncio.start_server(
+            self.connexion, hote, port, limit=TAILLE_MAX
+        )
+
+    async def connexion(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            statut, reponse = await self.requete(reader)
+        except (asyncio.IncompleteReadError, ValueError) as e:
+            statut, reponse = 400, {"erreur": str(e)}
+        corps = json.dumps(reponse, ensure_ascii=False).encode()
+        writer.write(
+            f"HTTP/1.1 {statut} {STATUTS[statut]}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(corps)}\r\n"
+            "Connection: close\r\n\r\n".encode() + corps
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def requete(self, reader: asyncio.StreamReader) -> tuple[int, t.Any]:
+        entete = await reader.readuntil(b"\r\n\r\n")
+        lignes = entete.decode("latin-1").split("\r\n")
+        methode, cible, _ = lignes[0].split(" ", 2)
+        entetes = {
+            cle.strip().lower(): valeur.strip()
+            for cle, _, valeur in (
+                ligne.partition(":") for ligne in lignes[1:]
+            )
+            if cle
+        }
+        url = urllib.parse.urlsplit(cible)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        corps = await reader.readexactly(int(entetes.get("content-length", 0)))
+
+        route = ROUTES.get((methode, url.path))
+        if route is None:
+            return 404, {"erreur": f"{methode} {url.path} inconnu"}
+        debut = asyncio.get_running_loop().time()
+        reponse = route(self, params, corps)
+        duree = (asyncio.get_running_loop().time() - debut) * 1000
+        logger.info(f"{methode} {cible} : {duree:.1f} ms")
+        return 200, reponse
+
+    def balance(self, params: dict[str, str], corps: bytes) -> t.Any:
+        return self.registre.balance(
+            params.get("prefixe", ""), params.get("du"), params.get("au")
+        )
+
+    def grand_livre(self, params: dict[str, str], corps: bytes) -> t.Any:
+        return self.registre.grand_livre(
+            params.get("compte", ""), params.get("du"), params.get("au")
+        )
+
+    def solde(self, params: dict[str, str], corps: bytes) -> t.Any:
+        compte = params.get("compte", "")
+        solde = self.registre.solde(compte, params.get("date"))
+        return {"compte": compte, "solde": round(solde, 2)}
+
+    def bilan(self, params: dict[str, str], corps: bytes) -> t.Any:
+        return self.registre.bilan(params.get("au"))
+
+    def ecritures(self, params: dict[str, str], corps: bytes) -> t.Any:
+        journal = lire_journal(io.StringIO(corps.decode("utf-8-sig")))
+        nombre = self.registre.ajouter(records_journal(journal))
+        if self.journal is not None:
+            journal[COLONNES].to_csv(
+                self.journal, mode="a", header=False, index=False
+            )
+        return {"ajoutées": nombre, "total": len(self.registre.records)}
+
+
+STATUTS = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+ROUTES: dict[
+    tuple[str, str], t.Callable[[Serveur, dict[str, str], bytes], t.Any]
+] = {
+    ("GET", "/balance"): Serveur.balance,
+    ("GET", "/grand-livre"): Serveur.grand_livre,
+    ("GET", "/solde"): Serveur.solde,
+    ("GET", "/bilan"): Serveur.bilan,
+    ("POST", "/ecritures"): Serveur.ecritures,
+}
+
+
+class TestRegistre(unittest.TestCase):
+    def test_registre(self):
+        records: list["Record"] = [
+            {
+                "date": "01/01/2022",
+                "compte": "512",
+                "libellé": "Apport",
+                "débit": 1000.0,
+                "crédit": 0.0,
+            },
+            {
+                "date": "01/01/2022",
+                "compte": "101",
+                "libellé": "Apport",
+                "débit": 0.0,
+                "crédit": 1000.0,
+            },
+            {
+                "date": "15/03/2022",
+                "compte": "512100",
+                "libellé": "Virement",
+                "débit": 50.0,
+                "crédit": 0.0,
+            },
+        ]
+        registre = Registre(
+            records[:2],
+            [{"compte": "512", "intitulé": "Banque", "solde": 0.0}],
+        )
+        self.assertEqual(registre.solde("5"), 1000.0)
+
+        # Ajout après coup, et hors de l'ordre des dates
+        registre.ajouter(records[2:])
+        registre.ajouter(
+            [
+                {
+                    "date": "01/02/2022",
+                    "compte": "512",
+                    "libellé": "Loyer",
+                    "débit": 0.0,
+                    "crédit": 400.0,
+                }
+            ]
+        )
+        self.assertEqual(registre.solde("512", "31/01/2022"), 1000.0)
+        self.assertEqual(registre.solde("512"), 650.0)
+        self.assertEqual(registre.comptes_prefixe("51"), ["512", "512100"])
+        self.assertEqual(
+            [r["solde"] for r in registre.grand_livre("512", du="01/02/2022")],
+            [600.0, 50.0],
+        )
+        balance = registre.balance("5", au="28/02/2022")
+        self.assertEqual(
+            balance,
+            [
+                {
+                    "compte": "512",
+                    "intitulé": "Banque",
+                    "débit": 1000.0,
+                    "crédit": 400.0,
+                    "solde": 600.0,
+                }
+            ],
+        )
+        self.assertEqual(registre.accounts()[1]["solde"], 600.0)
+
+    def test_chargement(self):
+        # Les index construits au chargement sont ceux des ajouts un à un
+        records: list["Record"] = [
+            {
+                "date": date,
+                "compte": compte,
+                "libellé": libelle,
+                "débit": debit,
+                "crédit": credit,
+            }
+            for date, compte, libelle, debit, credit in [
+                ("15/03/2022", "512", "Vente", 100.0, 0.0),
+                ("01/01/2022", "512", "Apport", 1000.0, 0.0),
+                ("15/03/2022", "512", "Frais", 0.0, 20.0),
+                ("01/01/2022", "101", "Apport", 0.0, 1000.0),
+                ("15/03/2022", "706", "Vente", 0.0, 100.0),
+                ("15/03/2022", "627", "Frais", 20.0, 0.0),
+                ("31/12/2022", "512", "Fermeture: Banque", 0.0, 1080.0),
+            ]
+        ]
+        charge = Registre(records)
+        ajoute = Registre()
+        ajoute.ajouter(records)
+        self.assertEqual(charge.comptes, ajoute.comptes)
+        for compte in charge.comptes:
+            self.assertEqual(
+                vars(charge.mouvements[compte]),
+                vars(ajoute.mouvements[compte]),
+            )
+        self.assertEqual(charge.solde("512", avant_cloture=True), 1080.0)
+
+
+class TestServeur(unittest.IsolatedAsyncioTestCase):
+    async def test_serveur(self):
+        serveur = Serveur(Registre())
+        ecoute = await serveur.servir(port=0)
+        port = ecoute.sockets[0].getsockname()[1]
+
+        async def envoyer(requete: bytes) -> tuple[bytes, t.Any]:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(requete)
+            reponse = await reader.read()
+            writer.close()
+            await writer.wait_closed()
+            entete, _, corps = reponse.partition(b"\r\n\r\n")
+            return entete.split(b"\r\n")[0], json.loads(corps)
+
+        corps = (
+            "date,compte,libellé,débit,crédit\n"
+            "01/01/2022,512,Apport,1000.0,0.0\n"
+            "01/01/2022,101,Apport,0.0,1000.0\n"
+        ).encode()
+        statut, reponse = await envoyer(
+            b"POST /ecritures HTTP/1.1\r\n"
+            + f"Content-Length: {len(corps)}\r\n\r\n".encode()
+            + corps
+        )
+        self.assertEqual(statut, b"HTTP/1.1 200 OK")
+        self.assertEqual(reponse, {"ajoutées": 2, "total": 2})
+
+        _, reponse = await envoyer(
+            b"GET /solde?compte=512&date=31/12/2022 HTTP/1.1\r\n\r\n"
+        )
+        self.assertEqual(reponse, {"compte": "512", "solde": 1000.0})
+        statut, _ = await envoyer(b"GET /inconnu HTTP/1.1\r\n\r\n")
+        self.assertEqual(statut, b"HTTP/1.1 404 Not Found")
+
+        ecoute.close()
+        await ecoute.wait_closed()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Situation de clôture d'un exercice: soldes de tous les comptes avant les
+écritures de clôture et totaux des états de synthèse, enregistrés en JSON.
+
+Les colonnes N-1 des rapports de l'exercice suivant sont lues dans cette
+situation, sans recharger le journal de l'exercice précédent.
+"""
+import typing as t
+import json
+import unittest
+import tempfile
+from pathlib import Path
+import pandas as pd
+from .bilan import calculer_bilan
+from .resultat import compte_resultat
+from .utils import two_decimals
+
+if t.TYPE_CHECKING:
+    from . import Account
+
+
+class Snapshot(t.TypedDict):
+    annee: int
+    comptes: list["Account"]
+    bilan: dict[str, float]
+    resultat: dict[str, float]
+    sig: dict[str, float]
+
+
+def soldes_resultat(accounts: list["Account"], annee: int) -> pd.DataFrame:
+    """
+    Soldes (crédit - débit) des comptes 6 et 7 sur une colonne annuelle,
+    au format attendu par compte_resultat
+    """
+    gestion = [a for a in accounts if a["compte"].startswith(("6", "7"))]
+    return pd.DataFrame(
+        {pd.Period(annee, "Y"): [-a["solde"] for a in gestion]},
+        index=pd.Index([a["compte"] for a in gestion], name="compte"),
+    )
+
+
+def creer_snapshot(accounts: list["Account"], annee: int) -> Snapshot:
+    """
+    Crée la situation de clôture à partir des soldes des comptes avant les
+    écritures de clôture
+    """
+    accounts = [
+        {
+            "compte": a["compte"],
+            "intitulé": a["intitulé"],
+            "solde": two_decimals(float(a["solde"])),
+        }
+        for a in accounts
+    ]
+    bilan = calculer_bilan(accounts).set_index("ligne")["net"]
+    resultat = compte_resultat(soldes_resultat(accounts, annee))
+    periode = pd.Period(annee, "Y")
+    return {
+        "annee": annee,
+        "comptes": accounts,
+        "bilan": {k: float(v) for k, v in bilan.items()},
+        "resultat": {k: float(v) for k, v in resultat.postes[periode].items()},
+        "sig": {k: float(v) for k, v in resultat.sig[periode].items()},
+    }
+
+
+def save_snapshot(snapshot: Snapshot, path: Path) -> None:
+    """
+    Enregistre la situation de clôture
+    """
+    with open(path, "w") as fid:
+        json.dump(snapshot, fid, ensure_ascii=False, indent=1)
+
+
+def load_snapshot(path: Path) -> Snapshot:
+    """
+    Charge une situation de clôture
+    """
+    with open(path) as fid:
+        return json.load(fid)
+
+
+def soldes_snapshot(snapshot: Snapshot) -> dict[str, float]:
+    """
+    Solde de clôture de chaque compte
+    """
+    return {a["compte"]: a["solde"] for a in snapshot["comptes"]}
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_snapshot(self):
+        accounts: list["Account"] = [
+            {"compte": "101", "intitulé": "Capital", "solde": -1000.0},
+            {"compte": "512", "intitulé": "Banque", "solde": 1500.0},
+            {"compte": "706", "intitulé": "Ventes", "solde": -800.0},
+            {"compte": "606", "intitulé": "Achats", "solde": 300.0},
+        ]
+        snapshot = creer_snapshot(accounts, 2022)
+        self.assertEqual(snapshot["bilan"]["Disponibilités"], 1500.0)
+        self.assertEqual(snapshot["bilan"]["Résultat de l'exercice"], 500.0)
+        self.assertEqual(snapshot["resultat"]["Production vendue"], 800.0)
+        self.assertEqual(snapshot["sig"]["Résultat de l'exercice"], 500.0)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "2022.json"
+            save_snapshot(snapshot, path)
+            self.assertEqual(load_snapshot(path), snapshot)
+        self.assertEqual(soldes_snapshot(snapshot)["512"], 1500.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,340 @@
+"""
+Stockage facultatif des journaux, comptes et immobilisations dans une base
+SQLite.
+
+Les fichiers CSV sont chargés une fois, par blocs et en une transaction par
+fichier. Les écritures sont indexées par (compte, date) et par date: les
+filtres par préfixe de compte et par période, et les agrégations par
+compte, sont faits par SQLite, qui ne lit que les lignes concernées.
+
+Un Stockage peut remplacer la liste des écritures dans
+filter_records_by_account, update_accounts, ecritures_avant_cloture et
+mouvements_par_periode. Les filtres (période, comptes et libellés exclus)
+sont posés par selection() et s'appliquent à toutes les requêtes.
+"""
+import typing as t
+import copy
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+import pandas as pd
+from .mapping import FIN
+from .schema import blocs_journal
+
+if t.TYPE_CHECKING:
+    from . import Account, Immobilisation, Record
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ecritures (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    compte TEXT NOT NULL,
+    libelle TEXT NOT NULL,
+    debit REAL NOT NULL,
+    credit REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ecritures_compte_date ON ecritures (compte, date);
+CREATE INDEX IF NOT EXISTS ecritures_date ON ecritures (date);
+CREATE INDEX IF NOT EXISTS ecritures_source ON ecritures (source);
+CREATE TABLE IF NOT EXISTS comptes (
+    compte TEXT PRIMARY KEY,
+    intitule TEXT NOT NULL,
+    solde REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS immobilisations (
+    compte TEXT PRIMARY KEY,
+    intitule TEXT NOT NULL,
+    montant REAL NOT NULL,
+    duree REAL NOT NULL,
+    date TEXT NOT NULL,
+    mode TEXT,
+    cession TEXT
+);
+"""
+
+# Dates stockées en AAAA-MM-JJ (ordre chronologique), lues en JJ/MM/AAAA
+DATE_JOURNAL = (
+    "substr(date, 9, 2) || '/' || substr(date, 6, 2) || '/' "
+    "|| substr(date, 1, 4)"
+)
+
+Date = t.Union[str, pd.Timestamp]
+
+
+def date_iso(date: Date) -> str:
+    """
+    Date JJ/MM/AAAA (ou Timestamp) au format AAAA-MM-JJ
+    """
+    if isinstance(date, pd.Timestamp):
+        return date.strftime("%Y-%m-%d")
+    return f"{date[6:10]}-{date[3:5]}-{date[0:2]}"
+
+
+class Stockage:
+    """
+    Base SQLite des écritures, avec une sélection (période, comptes et
+    libellés exclus) appliquée à toutes les requêtes.
+    """
+
+    def __init__(self, path: t.Union[Path, str]):
+        self.connexion = sqlite3.connect(str(path))
+        self.connexion.executescript(SCHEMA)
+        self.du: t.Optional[str] = None
+        self.au: t.Optional[str] = None
+        self.comptes_exclus: tuple[str, ...] = ()
+        self.libelles_exclus: tuple[str, ...] = ()
+
+    def __enter__(self) -> "Stockage":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.fermer()
+
+    def fermer(self) -> None:
+        self.connexion.close()
+
+    def selection(
+        self,
+        du: t.Optional[Date] = None,
+        au: t.Optional[Date] = None,
+        comptes_exclus: t.Sequence[str] = (),
+        libelles_exclus: t.Sequence[str] = (),
+    ) -> "Stockage":
+        """
+        Même base, restreinte à la période et sans les comptes et les
+        libellés commençant par les préfixes exclus (en plus de la
+        sélection courante)
+        """
+        vue = copy.copy(self)
+        if du is not None:
+            vue.du = max(date_iso(du), self.du or "")
+        if au is not None:
+            vue.au = min(date_iso(au), self.au or "9999")
+        vue.comptes_exclus = self.comptes_exclus + tuple(comptes_exclus)
+        vue.libelles_exclus = self.libelles_exclus + tuple(libelles_exclus)
+        return vue
+
+    def _conditions(
+        self, prefixe: t.Optional[str] = None
+    ) -> tuple[str, list[t.Any]]:
+        """
+        Clause WHERE de la sélection, et d'un préfixe de compte
+        """
+        conditions, params = ["1"], []
+        if prefixe is not None:
+            # Intervalle [préfixe, préfixe + FIN): parcours de l'index
+            conditions.append("compte >= ? AND compte < ?")
+            params += [prefixe, prefixe + FIN]
+        if self.du is not None:
+            conditions.append("date >= ?")
+            params.append(self.du)
+        if self.au is not None:
+            conditions.append("date <= ?")
+            params.append(self.au)
+        for exclu in self.comptes_exclus:
+            conditions.append("NOT (compte >= ? AND compte < ?)")
+            params += [exclu, exclu + FIN]
+        for exclu in self.libelles_exclus:
+            conditions.append("substr(libelle, 1, ?) != ?")
+            params += [len(exclu), exclu]
+        return " AND ".join(conditions), params
+
+    def charger_journaux(
+        self, journals: t.Iterable[Path], taille: int = 100_000
+    ) -> int:
+        """
+        Charge (ou recharge) des journaux CSV, par blocs, en une
+        transaction par fichier. Retourne le nombre d'écritures chargées.
+        """
+        total = 0
+        for journal in journals:
+            source = str(Path(journal).resolve())
+            with self.connexion:
+                self.connexion.execute(
+                    "DELETE FROM ecritures WHERE source = ?", (source,)
+                )
+                for bloc in blocs_journal(journal, taille):
+                    dates = bloc["date"]
+                    dates = (
+                        dates.str[6:10]
+                        + "-"
+                        + dates.str[3:5]
+                        + "-"
+                        + dates.str[0:2]
+                    )
+                    self.connexion.executemany(
+                        "INSERT INTO ecritures "
+                        "(source, date, compte, libelle, debit, credit) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        zip(
+                            [source] * len(bloc),
+                            dates,
+                            bloc["compte"],
+                            bloc["libellé"],
+                            bloc["débit"].astype(float),
+                            bloc["crédit"].astype(float),
+                        ),
+                    )
+                    total += len(bloc)
+        return total
+
+    def charger_comptes(self, accounts: list["Account"]) -> None:
+        """
+        Charge les comptes, en remplaçant ceux déjà présents
+        """
+        with self.connexion:
+            self.connexion.executemany(
+                "INSERT OR REPLACE INTO comptes VALUES (?, ?, ?)",
+                [(a["compte"], a["intitulé"], a["solde"]) for a in accounts],
+            )
+
+    def charger_immobilisations(
+        self, immobilisations: list["Immobilisation"]
+    ) -> None:
+        """
+        Charge les immobilisations, en remplaçant celles déjà présentes
+        """
+        with self.connexion:
+            self.connexion.executemany(
+                "INSERT OR REPLACE INTO immobilisations "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        i["compte"],
+                        i["intitulé"],
+                        i["montant"],
+                        i["durée"],
+                        i["date"],
+                        i.get("mode"),
+                        i.get("cession"),
+                    )
+                    for i in immobilisations
+                ],
+            )
+
+    def ecritures(self, prefixe: t.Optional[str] = None) -> list["Record"]:
+        """
+        Ecritures de la sélection, des comptes commençant par le préfixe,
+        dans l'ordre de chargement
+        """
+        where, params = self._conditions(prefixe)
+        curseur = self.connexion.execute(
+            f"SELECT {DATE_JOURNAL}, compte, libelle, debit, credit "
+            f"FROM ecritures WHERE {where} ORDER BY id",
+            params,
+        )
+        return [
+            {
+                "date": date,
+                "compte": compte,
+                "libellé": libelle,
+                "débit": debit,
+                "crédit": credit,
+            }
+            for date, compte, libelle, debit, credit in curseur
+        ]
+
+    def soldes(self, prefixe: t.Optional[str] = None) -> dict[str, float]:
+        """
+        Solde (débit - crédit) de chaque compte de la sélection
+        """
+        where, params = self._conditions(prefixe)
+        curseur = self.connexion.execute(
+            "SELECT compte, SUM(debit) - SUM(credit) FROM ecritures "
+            f"WHERE {where} GROUP BY compte ORDER BY compte",
+            params,
+        )
+        return dict(curseur.fetchall())
+
+    def mouvements_journaliers(self) -> pd.DataFrame:
+        """
+        Débits et crédits de la sélection agrégés par compte et par jour
+        (colonnes date, compte, débit, crédit)
+        """
+        where, params = self._conditions()
+        return pd.read_sql_query(
+            f'SELECT {DATE_JOURNAL} AS date, compte, SUM(debit) AS "débit", '
+            f'SUM(credit) AS "crédit" FROM ecritures WHERE {where} '
+            "GROUP BY compte, date",
+            self.connexion,
+            params=params,
+        )
+
+    def accounts(self) -> list["Account"]:
+        """
+        Comptes chargés
+        """
+        curseur = self.connexion.execute(
+            "SELECT compte, intitule, solde FROM comptes ORDER BY compte"
+        )
+        return [
+            {"compte": compte, "intitulé": intitule, "solde": solde}
+            for compte, intitule, solde in curseur
+        ]
+
+    def immobilisations(self) -> list["Immobilisation"]:
+        """
+        Immobilisations chargées
+        """
+        curseur = self.connexion.execute(
+            "SELECT compte, intitule, montant, duree, date, mode, cession "
+            "FROM immobilisations ORDER BY compte"
+        )
+        immobilisations: list["Immobilisation"] = []
+        for compte, intitule, montant, duree, date, mode, cession in curseur:
+            immo: "Immobilisation" = {
+                "compte": compte,
+                "intitulé": intitule,
+                "montant": montant,
+                "durée": duree,
+                "date": date,
+            }
+            if mode:
+                immo["mode"] = mode
+            if cession:
+                immo["cession"] = cession
+            immobilisations.append(immo)
+        return immobilisations
+
+
+class TestStockage(unittest.TestCase):
+    def test_stockage(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = Path(tmp) / "journal.csv"
+            journal.write_text(
+                "date,compte,libellé,débit,crédit\n"
+                "01/01/2021,512,Apport,1000.0,0.0\n"
+                "01/01/2021,101,Apport,0.0,1000.0\n"
+                "15/03/2022,606,Achat,100.0,0.0\n"
+                "15/03/2022,512,Achat,0.0,100.0\n"
+                "31/12/2022,512100,Fermeture: Banque,0.0,50.0\n"
+            )
+            with Stockage(Path(tmp) / "base.sqlite") as base:
+                self.assertEqual(base.charger_journaux([journal]), 5)
+                # Recharger un fichier remplace ses écritures
+                self.assertEqual(base.charger_journaux([journal]), 5)
+                self.assertEqual(len(base.ecritures()), 5)
+
+                self.assertEqual(
+                    [r["compte"] for r in base.ecritures("512")],
+                    ["512", "512", "512100"],
+                )
+                self.assertEqual(
+                    base.soldes("512"), {"512": 900.0, "512100": -50.0}
+                )
+
+                annee = base.selection(
+                    "01/01/2022", "31/12/2022", libelles_exclus=["Fermeture: "]
+                )
+                self.assertEqual(annee.soldes(), {"512": -100.0, "606": 100.0})
+                self.assertEqual(annee.ecritures("6")[0]["date"], "15/03/2022")
+                sans_banque = base.selection(comptes_exclus=["5"])
+                self.assertEqual(set(sans_banque.soldes()), {"101", "606"})
+                jours = annee.mouvements_journaliers()
+                self.assertEqual(len(jours), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""
+Etalement des subventions d'investissement.
+
+La quote-part virée au résultat chaque année suit le plan d'amortissement de
+l'immobilisation financée: subvention x dotation / valeur d'origine.
+"""
+import typing as t
+import unittest
+import numpy as np
+import pandas as pd
+from .amortissement import annees_sortie, tableau_amortissements
+from .utils import two_decimals
+
+if t.TYPE_CHECKING:
+    from . import Immobilisation, Record, Subvention
+
+
+def compte_reprise(compte: str) -> str:
+    """
+    Compte de reprise d'une subvention: 139 suivi du compte sans le 13, pour
+    que les subventions 131 et 138 aient chacune leur compte (1391, 1398)
+    """
+    return f"139{compte[2:]}"
+
+
+def tableau_subventions(
+    subventions: list["Subvention"],
+    immobilisations: list["Immobilisation"],
+    tableau: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Construit les plans d'étalement de toutes les subventions à partir de la
+    matrice des plans d'amortissement (voir tableau_amortissements).
+    L'année de sortie de l'immobilisation, le solde de la subvention est
+    entièrement repris.
+
+    Retourne un DataFrame avec les comptes de subvention en index, les
+    années en colonnes et les quote-parts en valeur.
+    """
+    if not subventions:
+        return pd.DataFrame(index=pd.Index([], name="compte"), dtype=float)
+
+    liees = [s["immobilisation"] for s in subventions]
+    inconnues = set(liees) - set(tableau.index)
+    if inconnues:
+        raise ValueError(f"Immobilisations non trouvées: {inconnues}")
+
+    montants = pd.Series(
+        [i["montant"] for i in immobilisations], index=tableau.index
+    )
+    sorties = annees_sortie(immobilisations, tableau)
+
+    # Quote-part: même rythme que l'amortissement de l'immobilisation
+    subvention = np.array([s["montant"] for s in subventions])
+    ratio = subvention / montants.loc[liees].to_numpy()
+    plans = tableau.loc[liees].to_numpy() * ratio[:, None]
+
+    # Reprise du solde à la sortie de l'immobilisation
+    annees = tableau.columns.to_numpy()
+    sortie = annees[None, :] == sorties.loc[liees].to_numpy()[:, None]
+    apres = annees[None, :] > sorties.loc[liees].to_numpy()[:, None]
+    plans[apres] = 0.0
+    reste = subvention - np.where(apres | sortie, 0.0, plans).sum(axis=1)
+    plans = np.where(sortie, reste[:, None], plans)
+
+    return pd.DataFrame(
+        plans,
+        index=pd.Index([s["compte"] for s in subventions], name="compte"),
+        columns=annees,
+    )
+
+
+def ecrire_quotes_parts(
+    subventions: list["Subvention"],
+    plans: pd.DataFrame,
+    annee: int,
+    date: t.Optional[str] = None,
+) -> list["Record"]:
+    """
+    Ecritures de quote-part de l'exercice (au centime): débit 139x, crédit
+    777, datées de la fin de l'exercice
+    """
+    records: list["Record"] = []
+    date = date or f"31/12/{annee}"
+    if annee not in plans.columns:
+        return records
+
+    for subvention, quote_part in zip(subventions, plans[annee]):
+        quote_part = two_decimals(float(quote_part))
+        if quote_part <= 0:
+            continue
+        libelle = f"Quote-part subv.: {subvention['intitulé']}"
+        records.append(
+            {
+                "date": date,
+                "compte": compte_reprise(subvention["compte"]),
+                "libellé": libelle,
+                "débit": quote_part,
+                "crédit": 0.0,
+            }
+        )
+        records.append(
+            {
+                "date": date,
+                "compte": "777",
+                "libellé": libelle,
+                "débit": 0.0,
+                "crédit": quote_part,
+            }
+        )
+
+    return records
+
+
+class TestSubventions(unittest.TestCase):
+    def test_tableau_subventions(self):
+        immos: list["Immobilisation"] = [
+            {
+                "compte": "205001",
+                "intitulé": "Logiciel",
+                "montant": 1000.0,
+                "durée": 4,
+                "date": "01/01/2021",
+                "cession": "31/12/2022",
+            }
+        ]
+        subventions: list["Subvention"] = [
+            {
+                "compte": "131001",
+                "intitulé": "Subvention logiciel",
+                "montant": 400.0,
+                "immobilisation": "205001",
+            }
+        ]
+        tableau = tableau_amortissements(immos)
+        plans = tableau_subventions(subventions, immos, tableau)
+
+        # 100 par an, le solde de 300 repris à la cession en 2022
+        self.assertEqual(plans.loc["131001", 2021], 100.0)
+        self.assertEqual(plans.loc["131001", 2022], 300.0)
+        self.assertEqual(plans.loc["131001"].sum(), 400.0)
+
+        records = ecrire_quotes_parts(subventions, plans, 2021)
+        self.assertEqual(
+            [(r["compte"], r["débit"], r["crédit"]) for r in records],
+            [("1391001", 100.0, 0.0), ("777", 0.0, 100.0)],
+        )
+
+    def test_compte_reprise(self):
+        self.assertEqual(compte_reprise("131001"), "1391001")
+        self.assertEqual(compte_reprise("138001"), "1398001")
+
+
+if __name__ == "__main__":
+    unittest.main()
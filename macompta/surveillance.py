@@ -0,0 +1,273 @@
+"""
+Surveillance des fichiers d'entrée et graphe des étapes (entrées ->
+journal -> rapports).
+
+Chaque étape déclare ses entrées et ses sorties; une étape dépend d'une
+autre si elle lit l'une de ses sorties. Quand des fichiers changent, seules
+les étapes qui les lisent, directement ou par une étape en amont, sont
+relancées, dans l'ordre du graphe. Les fichiers sont surveillés par
+scrutation (date de modification et taille), sans dépendance.
+"""
+import typing as t
+import collections
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+if t.TYPE_CHECKING:
+    from . import Record
+
+Etat = dict[Path, t.Optional[tuple[int, int]]]
+
+
+class Etape(t.NamedTuple):
+    nom: str
+    entrees: list[Path]
+    sorties: list[Path]
+    # Appelée avec les entrées modifiées de l'étape
+    action: t.Callable[[set[Path]], None]
+
+
+class Noeud(t.Protocol):
+    """
+    Noeud du graphe: une étape, ou une commande (voir construction.py)
+    """
+
+    @property
+    def nom(self) -> str:
+        ...
+
+    @property
+    def entrees(self) -> list[Path]:
+        ...
+
+    @property
+    def sorties(self) -> list[Path]:
+        ...
+
+
+N = t.TypeVar("N", bound=Noeud)
+
+
+def amont(noeuds: t.Sequence[Noeud]) -> list[set[int]]:
+    """
+    Indices des noeuds dont chaque noeud lit les sorties
+    """
+    producteurs = {
+        sortie: i for i, noeud in enumerate(noeuds) for sortie in noeud.sorties
+    }
+    return [
+        {producteurs[e] for e in noeud.entrees if e in producteurs} - {i}
+        for i, noeud in enumerate(noeuds)
+    ]
+
+
+def ordonner(etapes: list[N]) -> list[N]:
+    """
+    Etapes dans l'ordre du graphe: chaque étape après celles dont elle lit
+    les sorties
+    """
+    dependances = amont(etapes)
+    ordre: list[int] = []
+    restantes = list(range(len(etapes)))
+    while restantes:
+        pretes = [i for i in restantes if dependances[i].issubset(ordre)]
+        if not pretes:
+            noms = [etapes[i].nom for i in restantes]
+            raise ValueError(f"Dépendance circulaire entre {noms}")
+        ordre += pretes
+        restantes = [i for i in restantes if i not in pretes]
+    return [etapes[i] for i in ordre]
+
+
+def etapes_affectees(etapes: list[Etape], modifies: set[Path]) -> list[Etape]:
+    """
+    Etapes à relancer, dans l'ordre, quand les fichiers modifiés changent:
+    celles qui les lisent, puis celles qui lisent leurs sorties...
+    """
+    modifies = set(modifies)
+    affectees = []
+    for etape in ordonner(etapes):
+        if modifies.intersection(etape.entrees):
+            affectees.append(etape)
+            modifies.update(etape.sorties)
+    return affectees
+
+
+def etat(chemins: t.Iterable[Path]) -> Etat:
+    """
+    Date de modification et taille des fichiers (None s'ils n'existent pas)
+    """
+    resultat: Etat = {}
+    for chemin in chemins:
+        try:
+            stat = chemin.stat()
+        except FileNotFoundError:
+            resultat[chemin] = None
+        else:
+            resultat[chemin] = (stat.st_mtime_ns, stat.st_size)
+    return resultat
+
+
+def fichiers_modifies(avant: Etat, apres: Etat) -> set[Path]:
+    return {c for c in apres if avant.get(c) != apres[c]}
+
+
+def executer(etapes: list[Etape], modifies: set[Path]) -> list[Etape]:
+    """
+    Relance les étapes affectées par les fichiers modifiés, chacune avec
+    ses entrées modifiées (sorties des étapes en amont comprises)
+    """
+    modifies = set(modifies)
+    affectees = etapes_affectees(etapes, modifies)
+    for etape in affectees:
+        etape.action(modifies.intersection(etape.entrees))
+        modifies.update(etape.sorties)
+    return affectees
+
+
+def surveiller(
+    etapes: list[Etape],
+    intervalle: float = 1.0,
+    iterations: t.Optional[int] = None,
+) -> None:
+    """
+    Lance toutes les étapes, puis scrute les entrées et relance les étapes
+    affectées à chaque modification.
+
+    Après une relance, seules les entrées écrites par les étapes lancées
+    sont relues: une entrée modifiée pendant la relance garde son état
+    d'avant, et sa modification est vue à la scrutation suivante.
+    """
+    entrees = {e for etape in etapes for e in etape.entrees}
+    precedent = etat(entrees)
+    lancees = executer(etapes, entrees)
+    precedent.update(etat(sorties_lues(lancees, entrees)))
+    while iterations is None or iterations > 0:
+        time.sleep(intervalle)
+        courant = etat(entrees)
+        modifies = fichiers_modifies(precedent, courant)
+        if modifies:
+            lancees = executer(etapes, modifies)
+            # Les sorties écrites par les étapes ne sont pas des changements
+            courant.update(etat(sorties_lues(lancees, entrees)))
+        precedent = courant
+        if iterations is not None:
+            iterations -= 1
+
+
+def sorties_lues(etapes: list[Etape], entrees: set[Path]) -> set[Path]:
+    """
+    Sorties des étapes lues par d'autres étapes
+    """
+    return {s for etape in etapes for s in etape.sorties} & entrees
+
+
+def comptes_modifies(avant: list["Record"], apres: list["Record"]) -> set[str]:
+    """
+    Comptes dont les écritures diffèrent entre deux versions du journal
+    """
+    ecritures = collections.Counter(
+        (r["compte"], r["date"], r["libellé"], r["débit"], r["crédit"])
+        for r in apres
+    )
+    ecritures.subtract(
+        (r["compte"], r["date"], r["libellé"], r["débit"], r["crédit"])
+        for r in avant
+    )
+    return {cle[0] for cle, nombre in ecritures.items() if nombre != 0}
+
+
+class TestSurveillance(unittest.TestCase):
+    def test_etapes(self):
+        lancees: list[tuple[str, set[Path]]] = []
+
+        def etape(nom: str, entrees: list[str], sorties: list[str]) -> Etape:
+            return Etape(
+                nom,
+                [Path(e) for e in entrees],
+                [Path(s) for s in sorties],
+                lambda modifies: lancees.append((nom, modifies)),
+            )
+
+        etapes = [
+            etape("bilan", ["journal.csv", "compte.csv"], ["bilan.csv"]),
+            etape("journal", ["banque.csv", "compte.csv"], ["journal.csv"]),
+            etape("immobilisations", ["immo.csv"], ["immo-2022.csv"]),
+        ]
+        self.assertEqual(
+            [e.nom for e in ordonner(etapes)],
+            ["journal", "immobilisations", "bilan"],
+        )
+
+        executer(etapes, {Path("banque.csv")})
+        self.assertEqual(
+            lancees,
+            [
+                ("journal", {Path("banque.csv")}),
+                ("bilan", {Path("journal.csv")}),
+            ],
+        )
+        self.assertEqual(
+            [e.nom for e in etapes_affectees(etapes, {Path("immo.csv")})],
+            ["immobilisations"],
+        )
+
+    def test_etat(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fichier = Path(tmp) / "banque.csv"
+            avant = etat([fichier])
+            self.assertEqual(avant, {fichier: None})
+            fichier.write_text("date,montant\n")
+            self.assertEqual(
+                fichiers_modifies(avant, etat([fichier])), {fichier}
+            )
+
+    def test_surveiller(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            banque = Path(tmp) / "banque.csv"
+            journal = Path(tmp) / "journal.csv"
+            bilan = Path(tmp) / "bilan.csv"
+            banque.write_text("a\n")
+            lancees: list[str] = []
+
+            def construire_journal(modifies: set[Path]) -> None:
+                lancees.append("journal")
+                journal.write_text(banque.read_text())
+                if len(lancees) == 1:
+                    # Modification de la banque pendant la construction
+                    banque.write_text("a\nb\n")
+
+            def construire_bilan(modifies: set[Path]) -> None:
+                lancees.append("bilan")
+                bilan.write_text(journal.read_text())
+
+            etapes = [
+                Etape("journal", [banque], [journal], construire_journal),
+                Etape("bilan", [journal], [bilan], construire_bilan),
+            ]
+            surveiller(etapes, 0.0, iterations=2)
+
+        # La modification est vue, le journal réécrit ne relance rien
+        self.assertEqual(lancees, ["journal", "bilan"] * 2)
+
+    def test_comptes_modifies(self):
+        record: "Record" = {
+            "date": "01/01/2022",
+            "compte": "512",
+            "libellé": "Apport",
+            "débit": 1000.0,
+            "crédit": 0.0,
+        }
+        autre: "Record" = dict(record, compte="101")  # type: ignore
+        modifie: "Record" = dict(record, débit=900.0)  # type: ignore
+        self.assertEqual(comptes_modifies([record, autre], [autre]), {"512"})
+        self.assertEqual(
+            comptes_modifies([record, autre], [modifie, autre]), {"512"}
+        )
+        self.assertEqual(comptes_modifies([record], [record]), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
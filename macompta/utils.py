@@ -1,4 +1,7 @@
+import typing as t
 import time
+import numpy as np
+import pandas as pd
 
 
 def convert_date(date: str) -> str:
@@ -20,3 +23,69 @@ def two_decimals(number: float) -> float:
     Round a number to two decimals
     """
     return round(number, 2)
+
+
+def convert_dates(dates: pd.Series) -> pd.Series:
+    """
+    Convertit une colonne de dates au format JJ/MM/AAAA, comme convert_date
+    mais format par format plutôt que ligne par ligne
+    """
+    dates = dates.astype(str).str.strip()
+    resultat = dates.copy()
+    for motif, format in [(",", "%B %d, %Y"), ("-", "%Y-%m-%d")]:
+        masque = dates.str.contains(motif, regex=False)
+        if masque.any():
+            resultat[masque] = pd.to_datetime(
+                dates[masque], format=format
+            ).dt.strftime("%d/%m/%Y")
+    inconnues = ~dates.str.contains(r"[,/-]")
+    if inconnues.any():
+        raise ValueError(f"Date {dates[inconnues].iloc[0]} not recognized")
+    return resultat
+
+
+def parse_montants(
+    montants: pd.Series, errors: t.Literal["raise", "coerce"] = "raise"
+) -> pd.Series:
+    """
+    Convertit une colonne de montants en nombres: "€10,000.00",
+    "10 000,00 €", "(1 234,50 €)" (négatif), "-12.5" ou des nombres.
+
+    Le dernier séparateur est décimal s'il est suivi d'une ou deux
+    décimales, ou si les deux séparateurs sont présents; une virgule seule
+    suivie de trois chiffres est un séparateur de milliers. Les cellules
+    vides, et les montants invalides avec errors="coerce", donnent NaN.
+    """
+    if pd.api.types.is_numeric_dtype(montants):
+        return montants.astype(float)
+
+    # Les montants déjà au format numérique ("-12.5") sont convertis
+    # directement, les autres sont analysés
+    nombres = pd.to_numeric(montants, errors="coerce").astype(float)
+    texte = montants.astype("string").str.strip()
+    autres = (nombres.isna() & texte.fillna("").ne("")).to_numpy(bool)
+    if autres.any():
+        nombres[autres] = _analyser_montants(texte[autres], errors)
+    return nombres.rename(montants.name)
+
+
+def _analyser_montants(
+    texte: pd.Series, errors: t.Literal["raise", "coerce"]
+) -> np.ndarray:
+    negatif = texte.str.match(r"^\(.*\)$").fillna(False).to_numpy(bool)
+    texte = texte.str.replace(r"[()€\s\u00a0\u202f]|EUR", "", regex=True)
+
+    # Virgule décimale: "1234,5", "1 234,50", "1.234,56"
+    virgule = texte.str.contains(r",\d{1,2}$") | (
+        texte.str.contains(".", regex=False) & texte.str.contains(r",\d*$")
+    )
+    virgule = virgule.fillna(False).to_numpy(bool)
+    texte = texte.where(
+        ~virgule,
+        texte.str.replace(".", "", regex=False).str.replace(
+            ",", ".", regex=False
+        ),
+    ).str.replace(",", "", regex=False)
+
+    nombres = pd.to_numeric(texte.replace("", pd.NA), errors=errors)
+    return np.where(negatif, -nombres.to_numpy(float), nombres.to_numpy(float))
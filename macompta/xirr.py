@@ -0,0 +1,224 @@
+import numpy as np
+import pandas as pd
+import unittest
+from .twr import Frequency, daily_valuations, rollup_twr, to_period_alias
+
+
+DAYS_IN_YEAR = 365.0
+
+
+def _npv(
+    rate: np.ndarray, amounts: np.ndarray, years: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Net present value of each row of cash flows and its derivative.
+    """
+    discount = (1.0 + rate[:, None]) ** -years
+    npv = (amounts * discount).sum(axis=1)
+    derivative = (-years * amounts * discount).sum(axis=1) / (1.0 + rate)
+    return npv, derivative
+
+
+def xirr(
+    amounts: np.ndarray,
+    days: np.ndarray,
+    guess: float = 0.1,
+    tol: float = 1e-9,
+    max_iter: int = 50,
+    bisect_iter: int = 200,
+) -> np.ndarray:
+    """
+    Compute the internal rate of return of many irregular cash-flow series
+    at once.
+
+    Parameters:
+        amounts (np.ndarray): A (series, flows) matrix of cash flows, padded
+            with zeros. Money invested is negative, money received positive.
+        days (np.ndarray): The day of each cash flow, relative to any origin.
+        guess (float): The starting rate of the Newton iterations.
+        tol (float): The tolerance on the net present value.
+        max_iter (int): The number of Newton iterations.
+        bisect_iter (int): The number of bisection iterations for the series
+            on which Newton did not converge.
+
+    Returns:
+        np.ndarray: The annual rate of each series, NaN if it has none.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    years = np.asarray(days, dtype=float) / DAYS_IN_YEAR
+    years = years - years.min(axis=1, keepdims=True)
+    scale = np.abs(amounts).max(axis=1)
+    scale[scale == 0] = 1.0
+    amounts = amounts / scale[:, None]
+
+    # Batched Newton iterations, only on the series not converged yet
+    rate = np.full(len(amounts), guess)
+    active = np.ones(len(amounts), dtype=bool)
+    with np.errstate(all="ignore"):
+        for _ in range(max_iter):
+            if not active.any():
+                break
+            npv, derivative = _npv(
+                rate[active], amounts[active], years[active]
+            )
+            step = npv / derivative
+            rate[active] -= step
+            active[active] = np.abs(npv) > tol
+        npv, _ = _npv(rate, amounts, years)
+
+    # Bisection fallback where Newton diverged or left the valid domain
+    failed = ~np.isfinite(rate) | (rate <= -1.0) | ~(np.abs(npv) <= tol)
+    if failed.any():
+        rate[failed] = _bisect(
+            amounts[failed], years[failed], bisect_iter, tol
+        )
+
+    return rate
+
+
+def _bisect(
+    amounts: np.ndarray, years: np.ndarray, iterations: int, tol: float
+) -> np.ndarray:
+    """
+    Batched bisection on [-99.99%, +10000%], NaN without a sign change.
+    """
+    low = np.full(len(amounts), -0.9999)
+    high = np.full(len(amounts), 100.0)
+    with np.errstate(all="ignore"):
+        npv_low, _ = _npv(low, amounts, years)
+        npv_high, _ = _npv(high, amounts, years)
+        bracketed = np.sign(npv_low) != np.sign(npv_high)
+        for _ in range(iterations):
+            middle = (low + high) / 2
+            npv_middle, _ = _npv(middle, amounts, years)
+            same = np.sign(npv_middle) == np.sign(npv_low)
+            low = np.where(same, middle, low)
+            npv_low = np.where(same, npv_middle, npv_low)
+            high = np.where(same, high, middle)
+            if (np.abs(npv_middle) <= tol).all():
+                break
+    rate = (low + high) / 2
+    rate[~bracketed] = np.nan
+    return rate
+
+
+def padded_cash_flows(
+    key: np.ndarray, date: np.ndarray, amount: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Scatter long-format cash flows into padded matrices, one row per key.
+
+    Returns:
+        tuple: The unique keys, the amounts and the days (since the epoch).
+    """
+    keys, row = np.unique(key, return_inverse=True)
+    order = np.argsort(row, kind="stable")
+    row = row[order]
+    counts = np.bincount(row, minlength=len(keys))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    column = np.arange(len(row)) - starts[row]
+
+    amounts = np.zeros((len(keys), max(counts.max(initial=0), 1)))
+    days = np.zeros_like(amounts)
+    amounts[row, column] = np.asarray(amount, dtype=float)[order]
+    days[row, column] = np.asarray(date, dtype="datetime64[D]")[order].astype(
+        float
+    )
+    # Padding days equal to the first flow, so that they do not move the
+    # origin of the series
+    padding = np.arange(days.shape[1]) >= counts[:, None]
+    days = np.where(padding, days[:, :1], days)
+    return keys, amounts, days
+
+
+def compute_mwr_by_account(
+    df: pd.DataFrame, frequency: Frequency = "yearly"
+) -> pd.Series:
+    """
+    Compute the money-weighted return (XIRR) of every account and period.
+
+    The value at the start of a period counts as an investment, apports and
+    retraits as investments and withdrawals, and the value at the end of the
+    period as a withdrawal.
+
+    Parameters:
+        df (pd.DataFrame): A long-format frame with the columns compte, date,
+            type, débit and crédit, as for compute_twr_by_account.
+        frequency (Frequency): The length of the periods.
+
+    Returns:
+        pd.Series: The annual rate of each (compte, period).
+    """
+    period = to_period_alias(frequency)
+    daily = daily_valuations(df)
+    ends = rollup_twr(daily, frequency)["value"].reset_index()
+    daily = daily.reset_index()
+    daily["period"] = daily["date"].dt.to_period(period)
+    ends["begin"] = ends.groupby("compte")["value"].shift(fill_value=0.0)
+    ends["key"] = np.arange(len(ends))
+    flows = daily[daily["flow"] != 0].merge(
+        ends[["compte", "period", "key"]], on=["compte", "period"]
+    )
+
+    key = np.concatenate([ends["key"], flows["key"], ends["key"]])
+    date = np.concatenate(
+        [
+            ends["period"].dt.start_time.to_numpy(),
+            flows["date"].to_numpy(),
+            ends["period"].dt.end_time.dt.normalize().to_numpy(),
+        ]
+    )
+    amount = np.concatenate([-ends["begin"], -flows["flow"], ends["value"]])
+    keys, amounts, days = padded_cash_flows(key, date, amount)
+
+    index = pd.MultiIndex.from_frame(ends.loc[keys, ["compte", "period"]])
+    return pd.Series(xirr(amounts, days), index=index, name="mwr")
+
+
+class TestXIRR(unittest.TestCase):
+    def test_xirr(self):
+        amounts = np.array(
+            [
+                [-100.0, 110.0, 0.0],
+                [-1000.0, 500.0, 600.0],
+                [100.0, 50.0, 0.0],
+            ]
+        )
+        days = np.array(
+            [
+                [0.0, 365.0, 0.0],
+                [0.0, 365.0, 730.0],
+                [0.0, 365.0, 0.0],
+            ]
+        )
+        rate = xirr(amounts, days)
+
+        self.assertAlmostEqual(rate[0], 0.10)
+        # 500 / (1 + r) + 600 / (1 + r)^2 = 1000
+        self.assertAlmostEqual(
+            500 / (1 + rate[1]) + 600 / (1 + rate[1]) ** 2, 1000
+        )
+        # Only positive flows: no rate
+        self.assertTrue(np.isnan(rate[2]))
+
+    def test_compute_mwr_by_account(self):
+        df = pd.DataFrame(
+            {
+                "compte": [1, 1, 2, 2],
+                "date": pd.to_datetime(
+                    ["2022-01-01", "2022-12-31", "2022-01-01", "2022-07-02"]
+                ),
+                "type": ["apport", "plus-value", "apport", "apport"],
+                "débit": [100.0, 10.0, 100.0, 100.0],
+                "crédit": [0.0, 0.0, 0.0, 0.0],
+            }
+        )
+        mwr = compute_mwr_by_account(df)
+
+        self.assertAlmostEqual(mwr.loc[(1, "2022")], 0.10, places=3)
+        # No gain: the rate is zero whatever the timing of the flows
+        self.assertAlmostEqual(mwr.loc[(2, "2022")], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,18 +21,23 @@ Amortissement du logiciel,,,,,,
 ,,Mode,,linéaire,,
 ,,Amortissement annuel,,"€3,800.00",,
 """
+import typing as t
 import logging
 from pathlib import Path
 import tap
+import pandas as pd
 from macompta import (
     Immobilisation,
-    Record,
     load_accounts,
     load_immobilisations,
     is_immo_corporelle,
-    filter_records_by_account,
-    load_journals,
 )
+from macompta.amortissement import (
+    tableau_amortissements_cache,
+    annees_sortie,
+    compte_amortissement,
+)
+from macompta.snapshot import load_snapshot, soldes_snapshot
 from macompta.utils import two_decimals
 
 # Log to stdout
@@ -43,9 +48,10 @@ logger = logging.getLogger(__name__)
 class Arguments(tap.Tap):
     compte: Path
     immobilisations: list[Path]
-    journals: list[Path]
     annee: int
     output: Path
+    cache: t.Optional[Path] = None  # Cache des plans d'amortissement
+    precedent: t.Optional[Path] = None  # Situation de clôture N-1
 
 
 def main(args: Arguments) -> None:
@@ -67,8 +73,24 @@ def main(args: Arguments) -> None:
     immobilisations = load_immobilisations(args.immobilisations)
     logger.info(f"Immobilisations chargées: {len(immobilisations)}")
 
-    # Load the records
-    records = load_journals(args.journals)
+    # Plans d'amortissement de toutes les immobilisations en une fois
+    tableau = tableau_amortissements_cache(immobilisations, args.cache)
+    sorties = annees_sortie(immobilisations, tableau)
+
+    # Amortissements cumulés à la clôture N-1, lus dans la situation
+    if args.precedent is not None:
+        soldes = soldes_snapshot(load_snapshot(args.precedent))
+        precedents: t.Optional[pd.Series] = pd.Series(
+            {
+                i["compte"]: -soldes.get(
+                    compte_amortissement(i["compte"]), 0.0
+                )
+                for i in immobilisations
+            },
+            dtype=float,
+        )
+    else:
+        precedents = None
 
     # Create the output file
     logger.info(f"Création du fichier {args.output}")
@@ -79,14 +101,21 @@ def main(args: Arguments) -> None:
         f.write(f"1.1.{args.annee} - 31.12.{args.annee}\n")
         f.write("\n")
         f.write(
-            "Postes de bilan\tValeur brute au début de l'exercice\tAugmentations\tDiminutions\tValeur brute à la fin de l'exercice\n"
+            "Postes de bilan\tValeur brute au début de l'exercice\tAugmentations\tDiminutions\tValeur brute à la fin de l'exercice\tExercice N-1\n"
         )
 
     # Ecriture des amortissements liees aux immobilisations corporelles
     with open(args.output, "a") as f:
         f.write("Immobilisations corporelles\t\t\t\t\n")
     immo_corporelles = [i for i in immobilisations if is_immo_corporelle(i)]
-    ecrire_amortissements(args.output, immo_corporelles, records)
+    ecrire_amortissements(
+        args.output,
+        immo_corporelles,
+        args.annee,
+        tableau,
+        sorties,
+        precedents,
+    )
 
     # Ecriture des amortissements liees aux immobilisations incorporelles
     with open(args.output, "a") as f:
@@ -94,43 +123,52 @@ def main(args: Arguments) -> None:
     immo_incorporelles = [
         i for i in immobilisations if not is_immo_corporelle(i)
     ]
-    ecrire_amortissements(args.output, immo_incorporelles, records)
+    ecrire_amortissements(
+        args.output,
+        immo_incorporelles,
+        args.annee,
+        tableau,
+        sorties,
+        precedents,
+    )
 
 
 def ecrire_amortissements(
-    output: Path, immobilisations: list[Immobilisation], records: list[Record]
+    output: Path,
+    immobilisations: list[Immobilisation],
+    annee: int,
+    tableau: pd.DataFrame,
+    sorties: pd.Series,
+    precedents: t.Optional[pd.Series] = None,
 ) -> None:
     """
-    Ecrit les amortissements liées aux immobilisations corporelles dans le fichier de sortie
+    Ecrit les amortissements des immobilisations dans le fichier de sortie,
+    à partir de la matrice des plans d'amortissement. La colonne N-1 vient
+    de la situation de clôture de l'exercice précédent, si elle est donnée.
     """
+    # Cumul au début de l'exercice, dotations et reprises de l'exercice
+    debuts = tableau.loc[:, tableau.columns < annee].sum(axis=1)
+    if annee in tableau.columns:
+        augs = tableau[annee]
+    else:
+        augs = debuts * 0.0
+    dims = (debuts + augs).where(sorties == annee, 0.0)
+
     with open(output, "a") as f:
         # Write the immobilisations
         for immo in immobilisations:
-            debut = immo["montant"]
-            compte_amortissement = f"28{immo['compte'][2:]}"
-            aug = sum(
-                [
-                    op["débit"]
-                    for op in filter_records_by_account(
-                        records, compte_amortissement
-                    )
-                ]
-            )
-            dim = sum(
-                [
-                    op["crédit"]
-                    for op in filter_records_by_account(
-                        records, compte_amortissement
-                    )
-                ]
-            )
-            fin = debut + aug - dim
-
             compte = immo["compte"]
             intitule = immo["intitulé"]
+            # Seules les immobilisations au bilan pendant l'exercice
+            present = int(immo["date"][-4:]) <= annee <= sorties[compte]
+            debut = debuts[compte] if present else 0.0
+            aug = augs[compte] if present else 0.0
+            dim = dims[compte]
+            fin = debut + aug - dim
+            n1 = "" if precedents is None else two_decimals(precedents[compte])
 
             f.write(
-                f"{compte}\t{intitule}\t{debut}\t{two_decimals(aug)}\t{two_decimals(dim)}\t{two_decimals(fin)}\n"
+                f"{compte}\t{intitule}\t{two_decimals(debut)}\t{two_decimals(aug)}\t{two_decimals(dim)}\t{two_decimals(fin)}\t{n1}\n"
             )
 
 
@@ -0,0 +1,61 @@
+"""
+Ce script écrit les journaux dans une archive Parquet partitionnée par
+année et par classe de compte, et/ou en extrait un journal CSV pour une
+période et des préfixes de comptes:
+
+    archive.py --archive data/archive --journals data/livre-journal.csv
+    archive.py --archive data/archive --du 01/01/2021 --au 31/12/2021 \\
+        --prefixes 4 --output clients-2021.csv
+
+L'extraction ne lit que les partitions et les groupes de lignes
+concernés. L'archive nécessite pyarrow.
+"""
+import typing as t
+import logging
+from pathlib import Path
+import tap
+from macompta.archive import ecrire_archive, lire_archive
+from macompta.periodes import bornes
+from macompta.schema import blocs_journal
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Arguments(tap.Tap):
+    archive: Path  # Dossier de l'archive (une archive par entité)
+    journals: list[Path] = []  # Journaux à archiver
+    output: t.Optional[Path] = None  # Journal CSV extrait
+    annee: t.Optional[int] = None
+    du: t.Optional[str] = None  # JJ/MM/AAAA
+    au: t.Optional[str] = None  # JJ/MM/AAAA
+    prefixes: list[str] = []  # Préfixes de comptes extraits
+    taille: int = 100_000  # Lignes par bloc
+
+
+def main():
+    args = Arguments().parse_args()
+
+    if args.journals:
+        logger.info(f"Archivage de {len(args.journals)} journaux")
+        ecrire_archive(
+            (
+                bloc
+                for journal in args.journals
+                for bloc in blocs_journal(journal, args.taille)
+            ),
+            args.archive,
+        )
+
+    if args.output is not None:
+        du, au = None, None
+        if args.annee is not None or args.du or args.au:
+            du, au = bornes(args.annee, args.du, args.au)
+        ecritures = lire_archive(args.archive, du, au, args.prefixes)
+        logger.info(f"Extraction de {len(ecritures)} écritures")
+        ecritures.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
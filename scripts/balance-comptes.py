@@ -3,7 +3,7 @@ Enregistre la balance des comptes
 
 Prend en entrée :
     - le fichier des comptes
-    - les journaux
+    - les journaux, ou la base SQLite (voir base.py)
 
 Le script créé un fichier balance.csv avec les colonnes suivantes :
     - compte
@@ -22,6 +22,7 @@ Le script contient des étapes de vérification :
     - le résultat net doit être égal à la différence entre les comptes de bilan
 """
 
+import typing as t
 import logging
 from pathlib import Path
 import tap
@@ -34,7 +35,8 @@ from macompta import (
     load_journals,
     filter_accounts_by_class,
 )
-from macompta.utils import two_decimals
+from macompta.rapports import ligne_balance
+from macompta.stockage import Stockage
 
 # Log to stdout
 logging.basicConfig(level=logging.INFO)
@@ -44,19 +46,26 @@ logger = logging.getLogger(__name__)
 # Arguments CLI
 class Arguments(tap.Tap):
     compte: Path
-    journals: list[Path]
+    journals: list[Path] = []
     output: Path
     annee: int
+    base: t.Optional[Path] = None  # Base SQLite à la place des journaux
 
 
 def main():
     args = Arguments().parse_args()
 
-    # Load the records
-    records = load_journals(args.journals)
-    # Remove the records with the libellé starting with "Fermeture: "
-    records = [record for record in records if record["compte"][:1] != "8"]
-    logger.info(f"Chargement des opérations : {len(records)}")
+    # Load the records, without the class 8 accounts
+    records: t.Union[list[Record], Stockage]
+    if args.base is not None:
+        # Filtering and grouping are done by SQLite, on the year only
+        records = Stockage(args.base).selection(
+            f"01/01/{args.annee}", f"31/12/{args.annee}", comptes_exclus=["8"]
+        )
+    else:
+        records = load_journals(args.journals)
+        records = [r for r in records if r["compte"][:1] != "8"]
+        logger.info(f"Chargement des opérations : {len(records)}")
 
     accounts = load_accounts([args.compte])
     # add accounts in the journals
@@ -75,26 +84,19 @@ def main():
             export_account(args.output, account, records)
 
 
-def export_account(output: Path, account: Account, records: list[Record]):
+def export_account(
+    output: Path, account: Account, records: t.Union[list[Record], Stockage]
+):
     # Filter the records
     records_account = filter_records_by_account(records, account["compte"])
 
     # Compute the balance
     mvt_credit = sum([record["crédit"] for record in records_account])
     mvt_debit = sum([record["débit"] for record in records_account])
-    balance = mvt_debit - mvt_credit
-    solde_debit = balance if balance > 0 else 0
-    solde_credit = -balance if balance < 0 else 0
 
     # Export the account
     with open(output, "a") as f:
-        f.write(
-            f"{account['compte']}\t{account['intitulé']}\t"
-            f"{two_decimals(mvt_debit)}\t"
-            f"{two_decimals(mvt_credit)}\t"
-            f"{two_decimals(solde_debit)}\t"
-            f"{two_decimals(solde_credit)}\n"
-        )
+        f.write(ligne_balance(account, mvt_debit, mvt_credit))
 
 
 def export_header(output: Path, annee: int):
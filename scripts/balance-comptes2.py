@@ -1,42 +1,119 @@
+"""
+Calcule la balance des comptes à partir du grand livre Excel (une feuille
+par compte, ou une seule feuille) produit par grand-livre2.py.
+
+Le classeur est lu en flux (lecture seule), feuille par feuille, et les
+débits et crédits sont cumulés par compte au fil des lignes. Si les
+journaux de l'exercice sont donnés et existent, le classeur n'est pas lu
+du tout: la balance est calculée directement sur les écritures.
+"""
+import typing as t
+import logging
+from pathlib import Path
 import pandas as pd
+import openpyxl
 import tap
+from macompta import load_journals
+from macompta.periodes import bornes, filtrer_periode
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 
-def calculate_account_balance(file_path: str, output_path: str):
-    # Load all sheets from the Excel file into a dictionary of DataFrames
-    all_sheets = pd.read_excel(file_path, sheet_name=None)
+def lire_grand_livre(file_path: Path) -> pd.DataFrame:
+    """
+    Débits et crédits cumulés par compte, en une lecture des feuilles du
+    classeur. Les lignes sans numéro de compte (totaux) sont ignorées.
+    """
+    totaux: dict[t.Any, list[float]] = {}
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            compte = header.index("N de compte")
+            debit = header.index("Débit")
+            credit = header.index("Crédit")
 
-    # Initialize an empty DataFrame to hold the balance for all accounts
-    all_balance_decomposed = pd.DataFrame()
+            for row in rows:
+                if row[compte] is None:
+                    continue
+                montants = totaux.setdefault(row[compte], [0.0, 0.0])
+                montants[0] += float(row[debit] or 0.0)
+                montants[1] += float(row[credit] or 0.0)
+    finally:
+        wb.close()
 
-    # Iterate over all sheets in the dictionary
-    for sheet_name, df in all_sheets.items():
-        # Drop rows where 'N de compte' is NaN
-        ledger_cleaned = df.dropna(subset=['N de compte'])
+    return pd.DataFrame.from_dict(
+        totaux, orient="index", columns=["Débit", "Crédit"]
+    ).rename_axis("N de compte")
 
-        # Calculate the balance for each account
-        balance = ledger_cleaned.groupby('N de compte')[['Débit', 'Crédit']].sum()
 
-        # Decompose the balance into Debit/Credit
-        solde = (balance['Débit'] - balance['Crédit'])
-        # round off solde
-        solde = solde.round(2)
-        balance['Solde Débit'] = solde.where(solde > 0, 0)
-        balance['Solde Crédit'] = solde.where(solde < 0, 0)
+def lire_journaux(
+    journals: list[Path], annee: t.Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Débits et crédits cumulés par compte, à partir des journaux
+    """
+    records = load_journals(journals)
+    if annee is not None:
+        records = filtrer_periode(records, *bornes(annee))
+    df = pd.DataFrame.from_records(
+        records, columns=["compte", "débit", "crédit"]
+    )
+    return (
+        df.groupby("compte")[["débit", "crédit"]]
+        .sum()
+        .rename(columns={"débit": "Débit", "crédit": "Crédit"})
+        .rename_axis("N de compte")
+    )
 
-        balance.reset_index(inplace=True)
 
-        # Append the balance of the current sheet to the all_balance DataFrame
-        all_balance_decomposed = all_balance_decomposed._append(balance)
+def decomposer(balance: pd.DataFrame) -> pd.DataFrame:
+    """
+    Décompose le solde de chaque compte en solde débiteur ou créditeur
+    """
+    # round off solde
+    solde = (balance["Débit"] - balance["Crédit"]).round(2)
+    balance["Solde Débit"] = solde.where(solde > 0, 0)
+    balance["Solde Crédit"] = solde.where(solde < 0, 0)
+    return balance.reset_index()
 
-    # Save the all_balance DataFrame to an Excel file
-    all_balance_decomposed.to_excel(output_path, index=False)
+
+def calculate_account_balance(
+    file_path: t.Optional[Path],
+    output_path: Path,
+    journals: t.Sequence[Path] = (),
+    annee: t.Optional[int] = None,
+):
+    if journals and all(Path(j).exists() for j in journals):
+        logger.info("Calcul de la balance sur les journaux")
+        balance = lire_journaux(list(journals), annee)
+    elif file_path is not None:
+        logger.info(f"Lecture du grand livre {file_path}")
+        balance = lire_grand_livre(file_path)
+    else:
+        raise ValueError("Aucun grand livre ni journal disponible")
+    logger.info(f"Chargement des comptes : {len(balance)}")
+
+    # Save the balance to an Excel file
+    decomposer(balance).to_excel(output_path, index=False)
 
 
 class Arguments(tap.Tap):
-    grand_livre: str # Path to the Excel file containing the account data
-    output: str # Path to save the output Excel file with account balance
+    # Path to the Excel file containing the account data
+    grand_livre: t.Optional[Path] = None
+    output: Path  # Path to save the output Excel file with account balance
+    journals: list[Path] = []  # Journaux utilisés à la place du classeur
+    annee: t.Optional[int] = None  # Exercice des journaux
+
 
 if __name__ == "__main__":
     args = Arguments().parse_args()
 
-    calculate_account_balance(args.grand_livre, args.output)
+    calculate_account_balance(
+        args.grand_livre, args.output, args.journals, args.annee
+    )
@@ -0,0 +1,45 @@
+"""
+Ce script charge les journaux, les comptes et les immobilisations dans une
+base SQLite, utilisable ensuite par les rapports (option --base) à la place
+des fichiers CSV.
+
+Un journal déjà chargé est remplacé: le script peut être relancé après
+chaque modification des fichiers.
+"""
+import logging
+from pathlib import Path
+import tap
+from macompta import load_accounts, load_immobilisations
+from macompta.stockage import Stockage
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Arguments(tap.Tap):
+    base: Path
+    journals: list[Path] = []
+    comptes: list[Path] = []
+    immobilisations: list[Path] = []
+    taille: int = 100_000  # Lignes par bloc
+
+
+def main():
+    args = Arguments().parse_args()
+
+    with Stockage(args.base) as base:
+        ecritures = base.charger_journaux(args.journals, args.taille)
+        logger.info(f"Chargement des opérations : {ecritures}")
+
+        accounts = load_accounts(args.comptes)
+        base.charger_comptes(accounts)
+        logger.info(f"Chargement des comptes : {len(accounts)}")
+
+        immobilisations = load_immobilisations(args.immobilisations)
+        base.charger_immobilisations(immobilisations)
+        logger.info(f"Chargement des immobilisations : {len(immobilisations)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -58,16 +58,25 @@ Exemple de fichier de sortie:
 ,Ecarts de conversion passif (IV),,,,€0.00,€0.00,,,
 ,,,TOTAL GENERAL,,#REF!,"€114,100.77",,,
 """
+import csv
+import typing as t
 from pathlib import Path
+import pandas as pd
 import tap
-from macompta import (
-    Account,
-    load_accounts,
-    load_journals,
-    update_accounts,
-    filter_records_by_account,
-    Record,
+from macompta import load_accounts, load_journals
+from macompta.bilan import calculer_bilan, ecritures_avant_cloture
+from macompta.periodes import (
+    bornes,
+    comptes_situation,
+    mouvements_par_periode,
+    situations,
 )
+from macompta.snapshot import load_snapshot
+from macompta.stockage import Stockage
+from macompta.twr import Frequency
+from macompta.utils import two_decimals
+
+ROMAINS = ["I", "II", "III", "IV", "V"]
 
 
 class Arguments(tap.Tap):
@@ -75,10 +84,15 @@ class Arguments(tap.Tap):
     Arguments de la ligne de commande.
     """
 
-    journals: list[Path]
+    journals: list[Path] = []
     comptes: list[Path]
-    annee: int
+    annee: t.Optional[int] = None
+    du: t.Optional[str] = None  # JJ/MM/AAAA, 01/01 par défaut
+    au: t.Optional[str] = None  # JJ/MM/AAAA, 31/12 par défaut
+    frequence: Frequency = "yearly"  # Une situation par période
     output: Path
+    precedent: t.Optional[Path] = None  # Situation de clôture N-1
+    base: t.Optional[Path] = None  # Base SQLite à la place des journaux
 
 
 def main():
@@ -88,85 +102,116 @@ def main():
     args = Arguments().parse_args()
     print(args)
 
-    # Lire les journaux
-    journals = load_journals(args.journals)
-
-    # et les comptes
-    compte = load_accounts(args.comptes)
-    compte = update_accounts(compte, journals)
-
-    ecrire_header(args.output, args.annee)
-    ecrire_actif(journals, args.output)
-    ecrire_passif(compte, args.output)
-
-
-def ecrire_header(output: Path, annee: int):
+    # Lire les journaux (ou la base jusqu'à la fin de la période), sans les
+    # écritures de clôture
+    du, au = bornes(args.annee, args.du, args.au)
+    if args.base is not None:
+        journals = ecritures_avant_cloture(
+            Stockage(args.base).selection(au=au)
+        )
+    else:
+        journals = ecritures_avant_cloture(load_journals(args.journals))
+
+    # et les intitulés des comptes
+    intitules = {
+        a["compte"]: a["intitulé"] for a in load_accounts(args.comptes)
+    }
+
+    # Mouvements agrégés une fois par période, soldes de fin de période par
+    # cumul: une situation par période entre du et au
+    mouvements = mouvements_par_periode(journals, args.frequence, au=au)
+    fins = situations(mouvements)
+    periodes = [p for p in fins.columns if p.end_time >= du]
+
+    # Exercice N-1 lu dans la situation de clôture
+    precedent = None
+    if args.precedent is not None:
+        precedent = load_snapshot(args.precedent)
+
+    for periode in periodes:
+        # Tous les postes en une seule agrégation
+        bilan = calculer_bilan(comptes_situation(fins[periode], intitules))
+        if precedent is not None:
+            bilan["n1"] = bilan["ligne"].map(precedent["bilan"]).fillna(0.0)
+        else:
+            bilan["n1"] = float("nan")
+
+        output = args.output
+        if args.frequence != "yearly":
+            output = output.with_name(
+                f"{output.stem}-{periode}{output.suffix}"
+            )
+        fin = min(periode.end_time.normalize(), au)
+        ecrire_header(output, du, fin)
+        ecrire_actif(bilan[bilan["cote"] == "actif"], output)
+        ecrire_passif(bilan[bilan["cote"] == "passif"], output)
+
+
+def ecrire_header(output: Path, du: pd.Timestamp, au: pd.Timestamp):
     """
     Ecrit l'en-tête du bilan.
     """
     with open(output, "w") as fid:
         fid.write(",,,,,,,,,\n")
         fid.write(",Bilan comptable,,,,,,,,\n")
-        fid.write(f"1.1.{annee} - 31.12.{annee}\n")
+        fid.write(
+            f"{du.day}.{du.month}.{du.year} - {au.day}.{au.month}.{au.year}\n"
+        )
         fid.write(",,,,,,,,,\n")
 
 
-def ecrire_actif(records: list[Record], output: Path):
+def ecrire_actif(actif: pd.DataFrame, output: Path):
     """
     Ecrit l'actif du bilan.
     """
-    with open(output, "a") as fid:
-        fid.write(",,Exercice N,,Exercice N-1\n")
-        fid.write("ACTIF,,,,\n")
-        fid.write("ACTIF IMMOBILISE,,,,\n")
-
-    ecrire_actif_immobilise(records, output)
-
-
-def ecrire_actif_immobilise(records: list[Record], output: Path):
-    with open(output, "a") as fid:
-        fid.write("ACTIF IMMOBILISE,,,,\n")
-
-    # Calcul les totaux des immobilisations incorporelles (comptes 20x)
-    # - exercice N: brut, amortissements & provisions, net
-    # - exercice N-1: net
-    # Puis affiche les lignes correspondantes
-    immo_incorporelles = filter_records_by_account(records, "20")
-    amort_incorporelles = filter_records_by_account(records, "280")
-    prov_incorporelles = filter_records_by_account(records, "281")
-    brut_n = sum(
-        [record["débit"] - record["crédit"] for record in immo_incorporelles]
-    )
-    amort_n = sum(
-        [record["débit"] - record["crédit"] for record in amort_incorporelles]
-    )
-    prov_n = sum(
-        [record["débit"] - record["crédit"] for record in prov_incorporelles]
-    )
-    net_n = brut_n - amort_n - prov_n
-
-    with open(output, "a") as fid:
-        fid.write(
-            f"Immobilisations incorporelles,{brut_n},{amort_n+prov_n},{net_n}\n"
+    colonnes = ["brut", "amortissements", "net"]
+    with open(output, "a", newline="") as fid:
+        writer = csv.writer(fid)
+        writer.writerow(["", "ACTIF", "Exercice N", "", "", "Exercice N-1"])
+        writer.writerow(
+            ["", "", "Brut", "Amortissements et provisions", "Net", "Net"]
         )
-    # fid.write(",,,,,\n")
-    # fid.write("Frais d'établissement,,,,,,,,,\n")
-    # fid.write(",,,,,,,,,\n")
-    # fid.write("Frais de recherche et de développement,,,,,,,,,\n")
-    # fid.write(",,,,,,,,,\n")
-    # fid.write(
-    #     "Concessions, brevets, licences, marques, droits et valeurs similaires,,,,,,,,,\n"
-    # )
-    # fid.write(",,,,,,,,,\n")
-    # fid.write("Fonds commercial,,,,,,,,,\n")
-    # fid.write(",,,,,,,,,\n")
-    # fid.write("Autres immobilisations incorporelles,,,,,,,,,\n")
-    # fid.write(",,,,,,,,,\n")
-    # fid.write("Immobilisations corporelles,,,,,,,,,\n")
-    # fid.write(",,,,,,,,,\n")
-    # fid.write("Terrains,,,,,,,,,\n")
-    # fid.write(",,,,,,,,,\n")
-    # fid.write("Constructions,,,,,,,,,\n")
-    # fid.write(",,,,,,,,,\n")
-    # fid.write("Immobilisations financières,,,,,,,,,\n")
-    # fid.write(",,,,,,,,,\n")
+        ecrire_sections(writer, actif, colonnes)
+
+
+def ecrire_passif(passif: pd.DataFrame, output: Path):
+    """
+    Ecrit le passif du bilan.
+    """
+    with open(output, "a", newline="") as fid:
+        writer = csv.writer(fid)
+        writer.writerow([""] * 6)
+        writer.writerow(["", "PASSIF", "Exercice N", "Exercice N-1"])
+        writer.writerow(["", "", "Net", "Net"])
+        ecrire_sections(writer, passif, ["net"])
+
+
+def ecrire_sections(
+    writer: t.Any, postes: pd.DataFrame, colonnes: list[str]
+) -> None:
+    """
+    Ecrit les postes section par section, avec le total de chaque section
+    et le total général. La colonne N-1 est laissée vide sans situation
+    de clôture de l'exercice précédent.
+    """
+    colonnes = colonnes + ["n1"]
+
+    def montants(valeurs: pd.Series) -> list[t.Any]:
+        return [
+            "" if pd.isna(valeurs[c]) else two_decimals(valeurs[c])
+            for c in colonnes
+        ]
+
+    sections = postes.groupby("section", sort=False)
+    for numero, (section, lignes) in zip(ROMAINS, sections):
+        writer.writerow(["", section])
+        for _, ligne in lignes.iterrows():
+            writer.writerow(["", ligne["ligne"]] + montants(ligne))
+        totaux = lignes[colonnes].sum(min_count=1)
+        writer.writerow(["", f"Total {numero}"] + montants(totaux))
+    totaux = postes[colonnes].sum(min_count=1)
+    writer.writerow(["", "TOTAL GENERAL"] + montants(totaux))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,17 @@
 import pandas as pd
 import tap
+from macompta.schema import lire_journal
 
 def check_debit_credit_totals(df: pd.DataFrame):
-    total_debit = df['Débit'].sum()
-    total_credit = df['Crédit'].sum()
+    total_debit = df['débit'].sum()
+    total_credit = df['crédit'].sum()
 
     if total_debit != total_credit:
         print(f"Warning: Total Debit ({total_debit}) does not equal Total Credit ({total_credit}).")
 
 def check_account_balances(df: pd.DataFrame):
-    for account, account_data in df.groupby('N de compte'):
-        balance = account_data['Débit'].sum() - account_data['Crédit'].sum()
+    for account, account_data in df.groupby('compte'):
+        balance = account_data['débit'].sum() - account_data['crédit'].sum()
 
         # Check if the balance is negative
         # But leave a tolerance of 0.01 for rounding errors
@@ -18,20 +19,21 @@ def check_account_balances(df: pd.DataFrame):
             print(f"Warning: Account {account} has a negative balance ({balance}).")
 
 def check_unused_journals(df: pd.DataFrame):
-    if df['Journal'].isna().any():
+    if 'Journal' in df and (df['Journal'] == '').any():
         print("Warning: There are transactions with no journal specified.")
 
 def check_account_numbers(df: pd.DataFrame):
-    if not df['N de compte'].astype(str).str.match(r'\d{6}').all():
+    if not df['compte'].str.match(r'\d{6}').all():
         print("Warning: There are accounts with invalid account numbers.")
 
 def check_for_duplicates(df: pd.DataFrame):
-    if df.duplicated(subset=['Journal', 'Numéro', 'Date', 'Identifiant', 'Libellé', 'Débit', 'Crédit']).any():
+    subset = [c for c in ['Journal', 'Numéro', 'Identifiant'] if c in df]
+    if df.duplicated(subset=subset + ['date', 'compte', 'libellé', 'débit', 'crédit']).any():
         print("Warning: There are duplicate transactions.")
 
 def perform_checks(journal_path: str):
-    # Load the journal data
-    df = pd.read_csv(journal_path, skiprows=1)
+    # Load the journal data (native journal or export)
+    df = lire_journal(journal_path)
 
     # Perform the checks
     check_debit_credit_totals(df)
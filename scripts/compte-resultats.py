@@ -1,15 +1,33 @@
+"""
+Compte de résultat et soldes intermédiaires de gestion (SIG) calculés depuis
+le livre-journal. Les écritures ne sont lues et agrégées qu'une fois, par
+mois; les colonnes annuelles (N, N-1) ou mensuelles en sont déduites.
+
+La sortie est un fichier csv (séparé par des tabulations), tex ou pdf.
+"""
 import typing as t
 import os
+import logging
 from pathlib import Path
 import pandas as pd
 import tempfile
 import tap
-
-
-class CompteResultats(t.TypedDict):
-    revenues: pd.DataFrame
-    expenses: pd.DataFrame
-    net_income: float
+from macompta import load_accounts, load_journals_frame
+from macompta.resultat import (
+    CompteResultat,
+    compte_resultat,
+    regrouper,
+    soldes_par_periode,
+)
+from macompta.periodes import bornes
+from macompta.snapshot import load_snapshot, soldes_resultat
+from macompta.stockage import Stockage
+from macompta.twr import Frequency, to_period_alias
+from macompta.utils import two_decimals
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 
 def display_amount(x: float) -> str:
@@ -25,56 +43,60 @@ def display_libelle(x: str) -> str:
     )
 
 
-def prepare_financial_statements(filename: Path) -> CompteResultats:
-    # Load the data
-    data = pd.read_csv(filename)
-
-    # Rename the columns
-    data.columns = data.iloc[0]
-
-    # Drop the first row
-    data = data[1:]
-
-    # Convert 'N de compte' to string type to handle it properly
-    data["N de compte"] = data["N de compte"].astype(str)
-
-    # Define the sales and purchases
-    sales: pd.DataFrame = data[data["N de compte"].str.startswith("7")]
-    purchases: pd.DataFrame = data[data["N de compte"].str.startswith("6")]
-
-    # Remove the '€' symbol and thousands separator, and convert to numeric
-    sales["Débit"] = (
-        sales["Débit"].replace({"€": "", ",": ""}, regex=True).astype(float)
+def selectionner_periodes(
+    tableau: pd.DataFrame, annee: t.Optional[int], frequence: Frequency
+) -> pd.DataFrame:
+    """
+    Colonnes N et N-1 en annuel, périodes de l'année N sinon
+    """
+    if annee is None:
+        return tableau
+    premiere = annee - 1 if frequence == "yearly" else annee
+    alias = to_period_alias(frequence)
+    periodes = pd.period_range(
+        pd.Period(premiere, "Y").asfreq(alias, "start"),
+        pd.Period(annee, "Y").asfreq(alias, "end"),
     )
-    sales["Crédit"] = (
-        sales["Crédit"].replace({"€": "", ",": ""}, regex=True).astype(float)
-    )
-    purchases["Débit"] = (
-        purchases["Débit"]
-        .replace({"€": "", ",": ""}, regex=True)
-        .astype(float)
-    )
-    purchases["Crédit"] = (
-        purchases["Crédit"]
-        .replace({"€": "", ",": ""}, regex=True)
-        .astype(float)
-    )
-
-    # Calculate total sales and purchases
-    total_sales = sales["Crédit"].sum() - sales["Débit"].sum()
-    total_purchases = purchases["Débit"].sum() - purchases["Crédit"].sum()
+    return tableau.reindex(columns=periodes, fill_value=0.0)
 
-    # Prepare the result
-    result: CompteResultats = {
-        "revenues": sales,
-        "expenses": purchases,
-        "net_income": float(total_sales - total_purchases),
-    }
-
-    return result
 
+def export_to_csv(
+    compte_resultats: CompteResultat,
+    intitules: dict[str, str],
+    output: Path,
+):
+    periodes = "\t".join(str(p) for p in compte_resultats.sig.columns)
+    with open(output, "w") as f:
+        f.write("Compte de résultat\n")
+        f.write(f"Section\tPoste\t{periodes}\n")
+        for ligne, row in compte_resultats.postes.iterrows():
+            montants = "\t".join(
+                str(two_decimals(v)) for v in row.iloc[1:].to_numpy()
+            )
+            f.write(f"{row['section']}\t{ligne}\t{montants}\n")
+
+        f.write("\n")
+        f.write(f"Soldes intermédiaires de gestion\t\t{periodes}\n")
+        for solde, row in compte_resultats.sig.iterrows():
+            montants = "\t".join(str(two_decimals(v)) for v in row)
+            f.write(f"\t{solde}\t{montants}\n")
+
+        f.write("\n")
+        f.write(f"Compte\tIntitulé\t{periodes}\n")
+        for compte, row in compte_resultats.comptes.iterrows():
+            montants = "\t".join(str(two_decimals(v)) for v in row)
+            f.write(f"{compte}\t{intitules.get(compte, '')}\t{montants}\n")
+
+
+def export_to_latex(
+    compte_resultats: CompteResultat,
+    intitules: dict[str, str],
+    output: Path,
+):
+    periodes = compte_resultats.sig.columns
+    alignement = "l|l" + "|r" * len(periodes)
+    en_tete = " & ".join(str(p) for p in periodes)
 
-def export_to_latex(compte_resultats: CompteResultats, output: Path):
     # Write header and preambule
     with open(output, "w") as f:
         f.write("\\documentclass{article}\n")
@@ -89,59 +111,40 @@ def export_to_latex(compte_resultats: CompteResultats, output: Path):
         f.write("\\date{\\today}\n")
         f.write("\\begin{document}\n")
 
-    # Write the revenues
-    with open(output, "a") as f:
-        f.write("\\section{Revenues}\n")
-        f.write("\\begin{tabular}{l|c|c|c|c}\n")
-        f.write("\\hline\n")
-        f.write("Compte & Libellé & Crédit & Débit & Solde \\\\\n")
-        f.write("\\hline\n")
-        for index, row in compte_resultats["revenues"].iterrows():
-            solde = display_amount(row["Crédit"] - row["Débit"])
-            debit_str = display_amount(float(row["Débit"]))
-            credit_str = display_amount(float(row["Crédit"]))
-            libelle = display_libelle(str(row["Libellé"]))
-            f.write(
-                f"{row['N de compte']} & {libelle} & {credit_str} "
-                f"& {debit_str} & {solde} \\\\\n"
+    # Write the revenues then the expenses, account by account
+    comptes = compte_resultats.comptes
+    for titre, classe, signe in [("Revenues", "7", 1), ("Dépenses", "6", -1)]:
+        with open(output, "a") as f:
+            f.write(f"\\section{{{titre}}}\n")
+            f.write(f"\\begin{{longtable}}{{{alignement}}}\n")
+            f.write("\\hline\n")
+            f.write(f"Compte & Libellé & {en_tete} \\\\\n")
+            f.write("\\hline\n")
+            lignes = comptes[comptes.index.str.startswith(classe)]
+            for compte, row in lignes.iterrows():
+                libelle = display_libelle(intitules.get(compte, ""))
+                montants = " & ".join(display_amount(signe * v) for v in row)
+                f.write(f"{compte} & {libelle} & {montants} \\\\\n")
+            f.write("\\hline\n")
+            totaux = " & ".join(
+                display_amount(signe * v) for v in lignes.sum()
             )
-        f.write("\\hline\n")
-        f.write("\\end{tabular}\n")
+            f.write(f"Total & & {totaux} \\\\\n")
+            f.write("\\hline\n")
+            f.write("\\end{longtable}\n")
 
-    # Write the expenses
+    # Write the SIG down to the net income
     with open(output, "a") as f:
-        f.write("\\section{Dépenses}\n")
-        f.write("\\begin{tabular}{l|c|c|c|c}\n")
+        f.write("\\section{Soldes intermédiaires de gestion}\n")
+        f.write(f"\\begin{{longtable}}{{l{'|r' * len(periodes)}}}\n")
         f.write("\\hline\n")
-        f.write("Compte & Libellé & Crédit & Débit & Solde \\\\\n")
+        f.write(f"Solde & {en_tete} \\\\\n")
         f.write("\\hline\n")
-        for index, row in compte_resultats["expenses"].iterrows():
-            solde = display_amount(row["Débit"] - row["Crédit"])
-            debit_str = display_amount(float(row["Débit"]))
-            credit_str = display_amount(float(row["Crédit"]))
-            libelle = display_libelle(str(row["Libellé"]))
-            f.write(
-                f"{row['N de compte']} & {libelle} & {credit_str}"
-                f"& {debit_str} & {solde} \\\\\n"
-            )
+        for solde, row in compte_resultats.sig.iterrows():
+            montants = " & ".join(display_amount(v) for v in row)
+            f.write(f"{display_libelle(solde)} & {montants} \\\\\n")
         f.write("\\hline\n")
-        f.write("\\end{tabular}\n")
-
-    # Write the total and net income
-    with open(output, "a") as f:
-        total = display_amount(
-            compte_resultats["revenues"]["Crédit"].sum()
-            - compte_resultats["expenses"]["Débit"].sum()
-        )
-        net_income = display_amount(compte_resultats["net_income"])
-        f.write("\\section{Total et Résultat Net}\n")
-        f.write("\\begin{tabular}{l|c}\n")
-        f.write("\\hline\n")
-        f.write(f"Total & {total} \\\\\n")
-        f.write("\\hline\n")
-        f.write(f"Résultat Net & {net_income} \\\\\n")
-        f.write("\\hline\n")
-        f.write("\\end{tabular}\n")
+        f.write("\\end{longtable}\n")
 
     # Write the footer
     with open(output, "a") as f:
@@ -149,24 +152,67 @@ def export_to_latex(compte_resultats: CompteResultats, output: Path):
 
 
 class Arguments(tap.Tap):
-    journal: Path
+    journals: list[Path] = []
+    comptes: list[Path] = []  # Intitulés des comptes
+    annee: t.Optional[int] = None  # Exercice N
+    du: t.Optional[str] = None  # JJ/MM/AAAA
+    au: t.Optional[str] = None  # JJ/MM/AAAA
+    frequence: Frequency = "yearly"
     output: Path
+    precedent: t.Optional[Path] = None  # Situation de clôture N-1
+    base: t.Optional[Path] = None  # Base SQLite à la place des journaux
 
 
 if __name__ == "__main__":
     args = Arguments().parse_args()
 
-    compte_resultats = prepare_financial_statements(args.journal)
+    # Avec une base, seuls les exercices N-1 et N sont lus
+    records: t.Union[pd.DataFrame, Stockage]
+    if args.base is not None:
+        records = Stockage(args.base)
+        if args.annee is not None:
+            records = records.selection(
+                f"01/01/{args.annee - 1}", f"31/12/{args.annee}"
+            )
+    else:
+        records = load_journals_frame(args.journals)
+    intitules = {
+        a["compte"]: a["intitulé"] for a in load_accounts(args.comptes)
+    }
 
-    if args.output.suffix == ".tex":
-        export_to_latex(compte_resultats, args.output)
+    # Une seule agrégation, par mois, regroupée ensuite par période
+    if args.du is not None or args.au is not None:
+        du, au = bornes(args.annee, args.du, args.au)
+        soldes = soldes_par_periode(records, "monthly", du, au)
+        soldes = regrouper(soldes, args.frequence)
+    else:
+        soldes = soldes_par_periode(records, "monthly")
+        soldes = regrouper(soldes, args.frequence)
+        soldes = selectionner_periodes(soldes, args.annee, args.frequence)
+
+    # Exercice N-1 lu dans la situation de clôture plutôt que dans le journal
+    if args.precedent is not None and args.frequence == "yearly":
+        snapshot = load_snapshot(args.precedent)
+        precedent = soldes_resultat(snapshot["comptes"], snapshot["annee"])
+        soldes = soldes.drop(columns=precedent.columns, errors="ignore")
+        soldes = pd.concat([precedent, soldes], axis=1).fillna(0.0)
+        soldes = soldes.sort_index()
+    compte_resultats = compte_resultat(soldes)
+    resultat = compte_resultats.sig.loc["Résultat de l'exercice"]
+    logger.info(f"Résultat de l'exercice: {resultat.to_dict()}")
+
+    if args.output.suffix == ".csv":
+        export_to_csv(compte_resultats, intitules, args.output)
+
+    elif args.output.suffix == ".tex":
+        export_to_latex(compte_resultats, intitules, args.output)
 
     elif args.output.suffix == ".pdf":
         with tempfile.TemporaryDirectory() as tmpdir:
             tmp = Path(str(tmpdir))
             tmp_tex = tmp / "compte-resultats.tex"
             tmp_pdf = tmp / "compte-resultats.pdf"
-            export_to_latex(compte_resultats, tmp_tex)
+            export_to_latex(compte_resultats, intitules, tmp_tex)
             os.system(f"pdflatex -output-directory {tmp} {tmp_tex} -quiet")
             tmp_pdf.rename(args.output)
 
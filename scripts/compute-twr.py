@@ -1,9 +1,7 @@
 import pandas as pd
-from pydantic import BaseModel
-import numpy as np
-import numpy_financial as npf
 import tap
-from macompta.twr import compute_twr
+from macompta.twr import compute_twr_by_account
+from macompta.xirr import compute_mwr_by_account
 
 
 def load_data(filepath):
@@ -22,72 +20,39 @@ def load_data(filepath):
     return df
 
 
-def select_account(df: pd.DataFrame, account: int) -> pd.DataFrame:
-    return df[df["N Compte"] % 100 == account]
-
-
-def compute_values(df: pd.DataFrame):
+def compute_values(df: pd.DataFrame) -> pd.DataFrame:
     """
     df is a DataFrame with the following columns:
     - N Compte: account number
     - Date: full date
+    - Type: type of transaction (apport, retrait, other)
     - Débit: debit value
     - Crédit: credit value
+
+    All the accounts are computed in a single grouped pass. The returns are
+    growth factors: roi is the linked time-weighted return since the first
+    transaction, twr and mwr are the time-weighted and money-weighted
+    returns of each year, side by side.
     """
-    accounts: list[int] = sorted(list(df["N Compte"].unique()))
-    output: dict[tuple[str, int], pd.DataFrame] = {}
-
-    for account in accounts:
-        df_account = select_account(df, account)
-        df_account["Solde"] = df_account["Débit"].fillna(0.0)
-        df_account["Solde"] -= df_account["Crédit"].fillna(0.0)
-        df_account = df_account.set_index("Date")
-        df_account = df_account.sort_index()
-
-        twr_series = compute_twr(
-            df_account["Solde"].to_numpy(),
-            df_account.index.to_numpy(),
-            df_account["Type"].to_numpy(),
-            frequency="yearly",
-        )
-        # Convert index to string
-        years = twr_series.index.strftime("%Y")
-        twr_series.index = years
-
-        # Compute the investments which are the cumulative sum of the solde for each period but only for operations of apport/retrait
-        df_account["Solde_investment"] = np.where(
-            df_account["Type"].isin(["apport", "retrait"]),
-            df_account["Solde"],
-            0,
-        )
-        inv_series = (
-            df_account["Solde_investment"]
-            .cumsum()
-            .resample("Y")
-            .last()
-            .fillna(method="ffill")
-        )
-        inv_series.index = years
-        output[("capital", account)] = inv_series
-
-        # Compute the net values which are the cumulative solde (the last one of each period
-        nv_series = (
-            df_account["Solde"]
-            .cumsum()
-            .resample("Y")
-            .last()
-            .fillna(method="ffill")
-        )
-        nv_series.index = years
-        output[("nv", account)] = nv_series
-
-        output[("twr", account)] = twr_series
-
-    # Convert output into a DataFrame with a hierarchical index
-    export = pd.DataFrame(output)
-    export.columns = pd.MultiIndex.from_product(
-        [accounts, ["capital", "value", "roi"]]
+    df = df.rename(
+        columns={
+            "N Compte": "compte",
+            "Date": "date",
+            "Type": "type",
+            "Débit": "débit",
+            "Crédit": "crédit",
+        }
+    )
+    values = compute_twr_by_account(df, frequency="yearly")
+    values = values.rename(columns={"twr": "roi", "period_twr": "twr"})
+    values["mwr"] = 1 + compute_mwr_by_account(df, frequency="yearly")
+
+    # One column per (account, value) and one row per year
+    export = values.unstack("compte").swaplevel(axis=1).sort_index(axis=1)
+    export = export.reindex(
+        columns=["capital", "value", "roi", "twr", "mwr"], level=1
     )
+    export.index = export.index.strftime("%Y")
 
     return export
 
@@ -0,0 +1,195 @@
+"""
+Ce script construit les rapports de l'exercice (livre journal, base,
+grand livre, balance, bilan, compte de résultat, immobilisations,
+amortissements, trésorerie et FEC) à partir des fichiers du dossier data,
+comme les cibles du Makefile, mais:
+
+    - seuls les rapports dont les entrées (contenu des fichiers) ou les
+      paramètres ont changé sont reconstruits;
+    - le livre journal est chargé une fois dans la base SQLite, que les
+      rapports lisent ensuite (option --base);
+    - les rapports indépendants sont construits en parallèle.
+
+    construire.py --annee 2022
+    construire.py --annee 2022 --rapports bilan grand-livre
+
+Les empreintes sont gardées dans data/.construction.json.
+"""
+import typing as t
+import logging
+import sys
+from pathlib import Path
+import tap
+from macompta.construction import Manifeste, Noeud, commande, construire
+from macompta.surveillance import amont
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCRIPTS = Path(__file__).parent
+
+
+class Arguments(tap.Tap):
+    annee: int
+    data: Path = Path("data")
+    rapports: list[str] = []  # Rapports à construire (et leurs entrées)
+    paralleles: t.Optional[int] = None  # Rapports construits à la fois
+    forcer: bool = False  # Tout reconstruire
+    manifeste: t.Optional[Path] = None  # data/.construction.json par défaut
+
+
+def noeuds(data: Path, annee: int) -> list[Noeud]:
+    """
+    Graphe des rapports de l'exercice
+    """
+
+    def noeud(
+        script: str,
+        entrees: list[Path],
+        sorties: list[Path],
+        options: dict[str, t.Any],
+        nom: t.Optional[str] = None,
+    ) -> Noeud:
+        return Noeud(
+            nom or Path(script).stem,
+            commande(SCRIPTS / script, options),
+            entrees,
+            sorties,
+        )
+
+    compte = data / "compte.csv"
+    immobilisations = data / "immobilisations.csv"
+    journal = data / "livre-journal.csv"
+    base = data / "macompta.sqlite"
+    banques = [data / "banque.csv"]
+    notes_de_frais = [data / "note-de-frais.csv"]
+
+    def rapport_base(script: str, output: Path) -> Noeud:
+        # Rapports lus dans la base plutôt que dans le livre journal
+        return noeud(
+            script,
+            [base, compte],
+            [output],
+            {
+                "--base": base,
+                "--compte": compte,
+                "--annee": annee,
+                "--output": output,
+            },
+        )
+
+    def tableau(script: str, output: Path) -> Noeud:
+        return noeud(
+            script,
+            [immobilisations, compte],
+            [output],
+            {
+                "--immobilisations": immobilisations,
+                "--compte": compte,
+                "--annee": annee,
+                "--output": output,
+            },
+        )
+
+    return [
+        noeud(
+            "livre-journal.py",
+            notes_de_frais + banques + [compte, immobilisations],
+            [
+                journal,
+                data / f"cloture-{annee}.json",
+                data / f"ouverture-{annee + 1}.csv",
+            ],
+            {
+                "--notes_de_frais": notes_de_frais,
+                "--banques": banques,
+                "--compte": compte,
+                "--immobilisations": immobilisations,
+                "--resultat": journal,
+                "--snapshot": data / f"cloture-{annee}.json",
+                "--ouverture": data / f"ouverture-{annee + 1}.csv",
+                "--annee": annee,
+            },
+            nom="journal",
+        ),
+        noeud(
+            "base.py",
+            [journal, compte, immobilisations],
+            [base],
+            {
+                "--base": base,
+                "--journals": journal,
+                "--comptes": compte,
+                "--immobilisations": immobilisations,
+            },
+        ),
+        rapport_base("grand-livre.py", data / f"grand-livre-{annee}.csv"),
+        rapport_base(
+            "balance-comptes.py", data / f"balance-comptes-{annee}.csv"
+        ),
+        rapport_base("bilan.py", data / f"bilan-{annee}.csv"),
+        rapport_base(
+            "compte-resultats.py", data / f"compte-resultats-{annee}.csv"
+        ),
+        tableau("immobilisations.py", data / f"immobilisations-{annee}.csv"),
+        tableau("amortissements.py", data / f"amortissements-{annee}.csv"),
+        noeud(
+            "tresorerie.py",
+            [journal],
+            [data / f"tresorerie-{annee}.csv"],
+            {
+                "--journals": journal,
+                "--du": f"01/01/{annee}",
+                "--au": f"31/12/{annee}",
+                "--output": data / f"tresorerie-{annee}.csv",
+            },
+        ),
+        noeud(
+            "export-fec.py",
+            [journal, compte],
+            [data / f"FEC{annee}1231.txt"],
+            {
+                "--annee": annee,
+                "--journals": journal,
+                "--compte": compte,
+                "--output": data / f"FEC{annee}1231.txt",
+            },
+            nom="fec",
+        ),
+    ]
+
+
+def selectionner(graphe: list[Noeud], noms: list[str]) -> list[Noeud]:
+    """
+    Noeuds demandés et ceux dont ils dépendent
+    """
+    if not noms:
+        return graphe
+    inconnus = set(noms) - {n.nom for n in graphe}
+    if inconnus:
+        raise ValueError(f"Rapports inconnus : {sorted(inconnus)}")
+    dependances = amont(graphe)
+    retenus = {i for i, n in enumerate(graphe) if n.nom in noms}
+    a_voir = list(retenus)
+    while a_voir:
+        for j in dependances[a_voir.pop()] - retenus:
+            retenus.add(j)
+            a_voir.append(j)
+    return [n for i, n in enumerate(graphe) if i in retenus]
+
+
+def main():
+    args = Arguments().parse_args()
+
+    graphe = selectionner(noeuds(args.data, args.annee), args.rapports)
+    manifeste = Manifeste(args.manifeste or args.data / ".construction.json")
+    statuts = construire(graphe, manifeste, args.paralleles, args.forcer)
+    for nom, statut in statuts.items():
+        logger.info(f"{nom} : {statut}")
+    if any(s in ("échec", "ignoré") for s in statuts.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Ce script génère le fichier des écritures comptables (FEC) de l'exercice à
+partir des journaux. Il prend en entrée :
+    - le fichier des comptes (intitulés des comptes)
+    - les journaux
+
+Les journaux sont lus et le FEC est écrit par blocs de lignes; les
+contrôles de structure du FEC sont faits sur chaque bloc écrit. Le nom
+attendu par l'administration est SIRENFECAAAAMMJJ.txt (date de clôture).
+"""
+import sys
+import typing as t
+import logging
+from pathlib import Path
+import tap
+from macompta import load_accounts
+from macompta.fec import ControleFEC, EcrivainFEC, Separateur
+from macompta.periodes import bornes
+from macompta.schema import blocs_journal
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SEPARATEURS: dict[str, Separateur] = {"tab": "\t", "pipe": "|"}
+
+
+class Arguments(tap.Tap):
+    compte: Path
+    journals: list[Path]
+    output: Path
+    annee: t.Optional[int] = None
+    du: t.Optional[str] = None  # JJ/MM/AAAA, 01/01 par défaut
+    au: t.Optional[str] = None  # JJ/MM/AAAA, 31/12 par défaut
+    separateur: t.Literal["tab", "pipe"] = "tab"
+    taille: int = 100_000  # Lignes par bloc
+
+
+def main():
+    args = Arguments().parse_args()
+
+    intitules = {
+        a["compte"]: a["intitulé"] for a in load_accounts([args.compte])
+    }
+    du, au = bornes(args.annee, args.du, args.au)
+    controle = ControleFEC(du, au)
+
+    logger.info(f"Création du fichier {args.output}")
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        ecrivain = EcrivainFEC(
+            f, intitules, SEPARATEURS[args.separateur], controle
+        )
+        for journal in args.journals:
+            for bloc in blocs_journal(journal, args.taille):
+                dates = bloc["date"].str[6:10] + bloc["date"].str[3:5]
+                dates += bloc["date"].str[0:2]
+                debut, fin = du.strftime("%Y%m%d"), au.strftime("%Y%m%d")
+                ecrivain.bloc(bloc[(dates >= debut) & (dates <= fin)])
+
+    erreurs = controle.terminer()
+    logger.info(f"Lignes écrites : {controle.lignes}")
+    for erreur in erreurs:
+        logger.error(erreur)
+    if controle.nb_erreurs:
+        logger.error(f"Contrôles du FEC : {controle.nb_erreurs} erreur(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,17 +10,19 @@ Le script fonctionne avec les étapes suivantes :
     3. Afficher les opérations par compte et par classe
 
 """
+import typing as t
 import logging
 from pathlib import Path
 import tap
 from macompta import (
     load_accounts,
     update_accounts,
-    filter_records_by_account,
     load_journals,
-    filter_accounts_by_class,
 )
-from macompta.utils import two_decimals
+from macompta.archive import records_archive
+from macompta.periodes import bornes
+from macompta.rapports import GrandLivre
+from macompta.stockage import Stockage
 
 # Log to stdout
 logging.basicConfig(level=logging.INFO)
@@ -29,16 +31,32 @@ logger = logging.getLogger(__name__)
 
 class Arguments(tap.Tap):
     compte: Path
-    journals: list[Path]
+    journals: list[Path] = []
     output: Path
-    annee: int
+    annee: t.Optional[int] = None
+    du: t.Optional[str] = None  # JJ/MM/AAAA, 01/01 par défaut
+    au: t.Optional[str] = None  # JJ/MM/AAAA, 31/12 par défaut
+    profondeurs: list[int] = []  # Sous-totaux par préfixe, ex: 2 pour 21x
+    base: t.Optional[Path] = None  # Base SQLite à la place des journaux
+    archive: t.Optional[Path] = None  # Archive Parquet (voir archive.py)
+    prefixes: list[str] = []  # Comptes retenus, ex: 4 ou 411
 
 
 def main():
     args = Arguments().parse_args()
 
-    # Load the records
-    records = load_journals(args.journals)
+    # Load the records (from the base, up to the end of the period)
+    du, au = bornes(args.annee, args.du, args.au)
+    if args.base is not None:
+        records = Stockage(args.base).selection(au=au).ecritures()
+    elif args.archive is not None:
+        # Seules les partitions des exercices de la période et des classes
+        # retenues sont lues; l'exercice commence par les reprises des
+        # soldes, d'où le solde progressif
+        debut = du.replace(month=1, day=1)
+        records = records_archive(args.archive, debut, au, args.prefixes)
+    else:
+        records = load_journals(args.journals)
     logger.info(f"Chargement des opérations : {len(records)}")
 
     accounts = load_accounts([args.compte])
@@ -47,63 +65,12 @@ def main():
     accounts = sorted(accounts, key=lambda x: x["compte"])
     logger.info(f"Chargement des comptes : {len(accounts)}")
 
-    # Export header
+    # Export the operations by accounts, class by class (a class is when the
+    # first digit is the same), with the running solde (including the
+    # records before the period) and the requested intermediate subtotals
+    grand_livre = GrandLivre(du, au, args.profondeurs, args.prefixes)
     with open(args.output, "w") as f:
-        f.write("Grand livre\n")
-        f.write(f"1.1.{args.annee} - 31.12.{args.annee}\n")
-        f.write("\n")
-        f.write("Compte\tLibellé\tDébit\tCrédit\tSolde\n")
-
-    # Export the operations filtered by accounts
-    # do it class by class (a class is when the first digit is the same)
-    with open(args.output, "a") as f:
-        for classe in range(1, 9):
-            # Filter the accounts
-            accounts_classe = filter_accounts_by_class(accounts, classe)
-            accounts_classe = sorted(
-                accounts_classe, key=lambda x: x["compte"]
-            )
-
-            # Export header
-            f.write(f"Classe {classe}\n")
-            f.write("\n")
-            logger.info(f"Classe {classe} : {len(accounts_classe)} comptes")
-            debit = 0.0
-            credit = 0.0
-
-            for account in accounts_classe:
-                records_classe = filter_records_by_account(
-                    records, account["compte"]
-                )
-
-                account_credit = sum([r["crédit"] for r in records_classe])
-                account_debit = sum([r["débit"] for r in records_classe])
-                solde = account_debit - account_credit
-
-                f.write(
-                    f"{account['compte']}\t{account['intitulé']}\t{two_decimals(account_debit)}\t{two_decimals(account_credit)}\t{solde}\n"
-                )
-
-                # Write the records for this account
-                for record in records_classe:
-                    f.write(
-                        f"\t{record['libellé']}\t{two_decimals(record['débit'])}\t{two_decimals(record['crédit'])}\t\n"
-                    )
-
-                debit += account_debit
-                credit += account_credit
-
-                # Write the empty line
-                f.write("\n")
-
-            # Write the total for this class
-            solde = debit - credit
-            f.write(
-                f"\t\t{two_decimals(debit)}\t{two_decimals(credit)}\t{two_decimals(solde)}\n"
-            )
-
-            # Write the empty line
-            f.write("\n")
+        f.write(grand_livre.rendre(accounts, records))
 
 
 if __name__ == "__main__":
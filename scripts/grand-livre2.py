@@ -1,54 +1,208 @@
+"""
+Ce script génère le grand livre au format Excel à partir d'un journal,
+natif ou exporté (colonnes "N de compte", "Débit", "Crédit"...).
+
+Le classeur est écrit en flux (feuilles en écriture seule): les lignes
+sont envoyées au fichier au fur et à mesure, et la mémoire ne dépend pas
+de la taille du grand livre. Deux présentations sont possibles :
+    - une feuille par compte (par défaut)
+    - une seule feuille, les écritures de chaque compte étant groupées
+      (plan Excel) sous la ligne de total du compte
+"""
+import typing as t
+import logging
 from pathlib import Path
 import pandas as pd
 import openpyxl
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
 import tap
+from macompta.schema import SCHEMAS, lire_journal
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMAT_MONTANT = "#,##0.00"
+GRAS = Font(bold=True)
+ENTETES = {v: k for k, v in SCHEMAS["export"].items()}
+
+
+def cellule(
+    ws: WriteOnlyWorksheet,
+    valeur: t.Any,
+    montant: bool = False,
+    gras: bool = False,
+) -> WriteOnlyCell:
+    """
+    Cellule pré-formatée pour une feuille en écriture seule
+    """
+    if pd.isna(valeur):
+        valeur = None
+    cell = WriteOnlyCell(ws, value=valeur)
+    if montant:
+        cell.number_format = FORMAT_MONTANT
+    if gras:
+        cell.font = GRAS
+    return cell
+
+
+def ligne(
+    ws: WriteOnlyWorksheet,
+    valeurs: t.Sequence[t.Any],
+    montants: t.Collection[int],
+    gras: bool = False,
+) -> list[WriteOnlyCell]:
+    """
+    Ligne de cellules, les colonnes de montants étant formatées
+    """
+    return [
+        cellule(ws, v, montant=i in montants, gras=gras)
+        for i, v in enumerate(valeurs)
+    ]
+
+
+def ligne_total(
+    ws: WriteOnlyWorksheet,
+    colonnes: list[str],
+    libelle: str,
+    montants: dict[str, float],
+) -> list[WriteOnlyCell]:
+    """
+    Ligne de total: le libellé et les montants sous leur colonne
+    """
+    valeurs: list[t.Any] = [None] * len(colonnes)
+    valeurs[colonnes.index("Libellé")] = libelle
+    for colonne, montant in montants.items():
+        valeurs[colonnes.index(colonne)] = montant
+    indices = {colonnes.index(c) for c in montants}
+    return ligne(ws, valeurs, indices, gras=True)
+
 
+class Feuille:
+    """
+    Feuille en écriture seule qui compte ses lignes, pour grouper les
+    lignes au fil de l'écriture
+    """
 
-def generate_grand_livre(journal_path: str, grand_livre_path: str):
-    # Load the journal data, but drop the first row
-    df = pd.read_csv(journal_path, skiprows=1)
-    # Convert all cells containing € amounts to numeric. e.g. parse €10,000.00 to 10000.00
-    df['Débit'] = pd.to_numeric(df['Débit'].str.replace('€', '').str.replace(',', ''))
-    df['Crédit'] = pd.to_numeric(df['Crédit'].str.replace('€', '').str.replace(',', ''))
+    def __init__(self, ws: WriteOnlyWorksheet, colonnes: list[str]):
+        self.ws = ws
+        self.lignes = 0
+        ws.freeze_panes = "A2"
+        self.ajouter(ligne(ws, colonnes, set(), gras=True))
+
+    def ajouter(
+        self, cells: list[WriteOnlyCell], niveau: t.Optional[int] = None
+    ) -> None:
+        """
+        Ajoute une ligne, groupée au niveau de plan donné. La dimension de
+        la ligne est lue à son écriture puis oubliée.
+        """
+        self.lignes += 1
+        if niveau is not None:
+            self.ws.row_dimensions[self.lignes].outlineLevel = niveau
+        self.ws.append(cells)
+        if niveau is not None:
+            del self.ws.row_dimensions[self.lignes]
+
+
+def ecrire_compte(
+    feuille: Feuille,
+    colonnes: list[str],
+    ecritures: pd.DataFrame,
+    niveau: t.Optional[int] = None,
+) -> tuple[float, float]:
+    """
+    Ecrit les écritures d'un compte puis ses lignes de total et de solde.
+    Si un niveau de plan est donné, les écritures sont groupées à ce
+    niveau.
+
+    Retourne les totaux débit et crédit du compte.
+    """
+    ws = feuille.ws
+    montants = {colonnes.index("Débit"), colonnes.index("Crédit")}
+    for valeurs in ecritures.itertuples(index=False, name=None):
+        feuille.ajouter(ligne(ws, valeurs, montants), niveau)
+
+    debit = float(ecritures["Débit"].sum())
+    credit = float(ecritures["Crédit"].sum())
+    feuille.ajouter(
+        ligne_total(
+            ws,
+            colonnes,
+            "Total du compte",
+            {"Débit": debit, "Crédit": credit},
+        )
+    )
+    feuille.ajouter(
+        ligne_total(
+            ws, colonnes, "Solde du compte", {"Crédit": debit - credit}
+        )
+    )
+    return debit, credit
+
+
+def generate_grand_livre(
+    journal_path: Path, grand_livre_path: Path, une_feuille: bool = False
+):
+    # Load the journal data (any known layout), with the export headers
+    df = lire_journal(journal_path).rename(columns=ENTETES)
 
     # Sort the dataframe by 'N de compte' for processing
-    df = df.sort_values('N de compte')
+    df = df.sort_values("N de compte", kind="stable")
+    colonnes = [str(c) for c in df.columns]
+    logger.info(f"Chargement des opérations : {len(df)}")
 
-    # Create a new Excel workbook
-    wb = openpyxl.Workbook()
+    # Streaming workbook: no default sheet, rows are flushed as written
+    wb = openpyxl.Workbook(write_only=True)
 
-    # Remove the default sheet created
-    wb.remove(wb.active)
+    if une_feuille:
+        ws = wb.create_sheet(title="Grand livre")
+        ws.sheet_format.outlineLevelRow = 1
+        ws.sheet_properties.outlinePr.summaryBelow = True
+        feuille = Feuille(ws, colonnes)
 
-    # For each account in the Grand Livre
-    for account, account_data in df.groupby('N de compte'):
-        # Create a new sheet for the account
-        ws = wb.create_sheet(title=str(account))
+    debit_total, credit_total = 0.0, 0.0
+    for account, account_data in df.groupby("N de compte", sort=False):
+        if not une_feuille:
+            # Create a new sheet for the account
+            feuille = Feuille(
+                wb.create_sheet(title=str(account)[:31]), colonnes
+            )
 
-        # Write the account data to the sheet
-        for row in dataframe_to_rows(account_data, index=False, header=True):
-            ws.append(row)
+        debit, credit = ecrire_compte(
+            feuille, colonnes, account_data, niveau=1 if une_feuille else None
+        )
+        debit_total += debit
+        credit_total += credit
 
-        # Calculate and write the account totals and balance
-        debit_total = account_data['Débit'].sum()
-        credit_total = account_data['Crédit'].sum()
-        balance = debit_total - credit_total
-        ws.append(['', 'Total du compte', '', '', '', '', debit_total, credit_total])
-        ws.append(['', 'Solde du compte', '', '', '', '', '', balance])
+    if une_feuille:
+        feuille.ajouter(
+            ligne_total(
+                feuille.ws,
+                colonnes,
+                "Total général",
+                {"Débit": debit_total, "Crédit": credit_total},
+            )
+        )
 
     # Save the workbook to a file
+    logger.info(f"Création du fichier {grand_livre_path}")
     wb.save(grand_livre_path)
 
+
 class Arguments(tap.Tap):
-    journal: Path # Path to the journal CSV file
-    grand_livre: Path # Path to the output Grand Livre Excel file
+    journal: Path  # Path to the journal CSV file
+    grand_livre: Path  # Path to the output Grand Livre Excel file
+    une_feuille: bool = False  # Une seule feuille, groupée par compte
 
 
 def main():
     args = Arguments().parse_args()
 
-    generate_grand_livre(args.journal, args.grand_livre)
+    generate_grand_livre(args.journal, args.grand_livre, args.une_feuille)
+
 
 if __name__ == "__main__":
     main()
@@ -17,17 +17,20 @@ Immobilisations incorporelles		€21,568.20	0	0	€21,568.20
 205001	Logiciel	€19,000.00	0	0	€19,000.00
 205002	Brevet	€2,568.20	0	0	€2,568.20
 """
+import typing as t
 import logging
 from pathlib import Path
 import tap
+import pandas as pd
 from macompta import (
     Immobilisation,
-    Record,
     load_accounts,
     load_immobilisations,
     is_immo_corporelle,
-    filter_records_by_account,
-    load_journals,
+)
+from macompta.amortissement import (
+    tableau_amortissements_cache,
+    annees_sortie,
 )
 from macompta.utils import two_decimals
 
@@ -39,9 +42,9 @@ logger = logging.getLogger(__name__)
 class Arguments(tap.Tap):
     compte: Path
     immobilisations: list[Path]
-    journals: list[Path]
     annee: int
     output: Path
+    cache: t.Optional[Path] = None  # Cache des plans d'amortissement
 
 
 def main(args: Arguments) -> None:
@@ -63,8 +66,9 @@ def main(args: Arguments) -> None:
     immobilisations = load_immobilisations(args.immobilisations)
     logger.info(f"Immobilisations chargées: {len(immobilisations)}")
 
-    # Load the records
-    records = load_journals(args.journals)
+    # Les sorties du bilan sont données par les plans d'amortissement
+    tableau = tableau_amortissements_cache(immobilisations, args.cache)
+    sorties = annees_sortie(immobilisations, tableau)
 
     # Create the output file
     logger.info(f"Création du fichier {args.output}")
@@ -82,7 +86,7 @@ def main(args: Arguments) -> None:
     with open(args.output, "a") as f:
         f.write("Immobilisations corporelles\t\t\t\t\n")
     immo_corporelles = [i for i in immobilisations if is_immo_corporelle(i)]
-    ecrire_immobilisations(args.output, immo_corporelles, records)
+    ecrire_immobilisations(args.output, immo_corporelles, args.annee, sorties)
 
     # Ecriture des immobilisations incorporelles
     with open(args.output, "a") as f:
@@ -90,42 +94,37 @@ def main(args: Arguments) -> None:
     immo_incorporelles = [
         i for i in immobilisations if not is_immo_corporelle(i)
     ]
-    ecrire_immobilisations(args.output, immo_incorporelles, records)
+    ecrire_immobilisations(
+        args.output, immo_incorporelles, args.annee, sorties
+    )
 
 
 def ecrire_immobilisations(
-    output: Path, immobilisations: list[Immobilisation], records: list[Record]
+    output: Path,
+    immobilisations: list[Immobilisation],
+    annee: int,
+    sorties: pd.Series,
 ) -> None:
     """
-    Ecrit les immobilisations corporelles dans le fichier de sortie
+    Ecrit les immobilisations dans le fichier de sortie: entrées l'année
+    d'acquisition, sorties l'année de cession ou de fin d'amortissement
     """
     with open(output, "a") as f:
         # Write the immobilisations
         for immo in immobilisations:
-            debut = immo["montant"]
-            aug = sum(
-                [
-                    op["débit"]
-                    for op in filter_records_by_account(
-                        records, immo["compte"]
-                    )
-                ]
-            )
-            dim = sum(
-                [
-                    op["crédit"]
-                    for op in filter_records_by_account(
-                        records, immo["compte"]
-                    )
-                ]
-            )
-            fin = debut + aug - dim
-
             compte = immo["compte"]
             intitule = immo["intitulé"]
+            acquisition = int(immo["date"][-4:])
+            sortie = sorties[compte]
+            present = acquisition < annee <= sortie
+
+            debut = immo["montant"] if present else 0.0
+            aug = immo["montant"] if acquisition == annee else 0.0
+            dim = immo["montant"] if sortie == annee else 0.0
+            fin = debut + aug - dim
 
             f.write(
-                f"{compte}\t{intitule}\t{debut}\t{two_decimals(aug)}\t{two_decimals(dim)}\t{two_decimals(fin)}\n"
+                f"{compte}\t{intitule}\t{two_decimals(debut)}\t{two_decimals(aug)}\t{two_decimals(dim)}\t{two_decimals(fin)}\n"
             )
 
 
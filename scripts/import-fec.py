@@ -0,0 +1,59 @@
+"""
+Ce script importe un fichier des écritures comptables (FEC), séparé par
+des tabulations ou des barres verticales, dans un livre-journal CSV
+(date, compte, libellé, débit, crédit).
+
+Le FEC est lu par blocs de lignes et contrôlé au passage (colonnes,
+champs obligatoires, dates, montants, équilibre des écritures). Les
+autres colonnes du FEC (JournalCode, EcritureNum, PieceRef...) sont
+gardées après celles du journal, et reprises par export-fec.py.
+"""
+import sys
+import typing as t
+import logging
+from pathlib import Path
+import tap
+from macompta.fec import ControleFEC, lire_fec
+from macompta.periodes import bornes
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Arguments(tap.Tap):
+    fec: Path
+    output: Path
+    annee: t.Optional[int] = None  # Contrôle des dates de l'exercice
+    du: t.Optional[str] = None  # JJ/MM/AAAA
+    au: t.Optional[str] = None  # JJ/MM/AAAA
+    taille: int = 100_000  # Lignes par bloc
+    encoding: str = "utf-8-sig"  # iso-8859-15 pour certains logiciels
+
+
+def main():
+    args = Arguments().parse_args()
+
+    if args.annee is not None or (args.du and args.au):
+        controle = ControleFEC(*bornes(args.annee, args.du, args.au))
+    else:
+        controle = ControleFEC()
+
+    logger.info(f"Création du fichier {args.output}")
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        entete = True
+        for bloc in lire_fec(args.fec, controle, args.taille, args.encoding):
+            bloc.to_csv(f, header=entete, index=False, lineterminator="\n")
+            entete = False
+
+    erreurs = controle.terminer()
+    logger.info(f"Lignes lues : {controle.lignes}")
+    for erreur in erreurs:
+        logger.error(erreur)
+    if controle.nb_erreurs:
+        logger.error(f"Contrôles du FEC : {controle.nb_erreurs} erreur(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,14 @@ Il prend en entrée :
     - le(s) fichier(s) CSV des ventes
     - le fichier des comptes
     - le(s) fichier(s) des immobilisations
+    - le(s) fichier(s) des subventions d'investissement
 
 Le script fonctionne avec les étapes suivantes :
     1. Charger les données des fichiers CSV
     2. Ecrire les opérations d'ouverture des comptes
     3. Affecter le résultat
     4. Ecrire les opérations de ventes, de banque et de notes de frais
-    5. Ecrire les opérations d'immobilisations
+    5. Ecrire les opérations d'immobilisations et l'étalement des subventions
     6. Ecrire les opérations de clôture des comptes
     7. Ecrire les opérations de résultat
     8. Ecrire les opérations de bilan
@@ -24,25 +25,35 @@ Les opérations sont écrites dans un fichier CSV avec les colonnes suivantes :
     - débit
     - crédit
 
-TODO: étalement subvention
-
 """
 from math import isclose
+import typing as t
 import logging
-import time
 from pathlib import Path
 import csv
+import pandas as pd
 import tap
 from macompta import (
     Record,
     Account,
+    Immobilisation,
     load_accounts,
     ouverture_comptes,
     update_accounts,
     load_operations,
     load_immobilisations,
-    build_amortissement,
+    load_subventions,
+)
+from macompta.amortissement import (
+    tableau_amortissements_cache,
+    annees_sortie,
+    dates_sortie,
+    repartir_periode,
 )
+from macompta.subvention import tableau_subventions, ecrire_quotes_parts
+from macompta.snapshot import creer_snapshot, save_snapshot
+from macompta.periodes import bornes, dates_records, filtrer_periode
+from macompta.cloture import cloturer
 from macompta.utils import two_decimals
 
 # Log to stdout
@@ -55,8 +66,14 @@ class Arguments(tap.Tap):
     banques: list[Path]
     compte: Path
     immobilisations: list[Path]
+    subventions: list[Path] = []  # Subventions d'investissement
     resultat: Path
     annee: int
+    du: t.Optional[str] = None  # Début de l'exercice, 01/01 par défaut
+    au: t.Optional[str] = None  # Fin de l'exercice, 31/12 par défaut
+    cache: t.Optional[Path] = None  # Cache des plans d'amortissement
+    snapshot: t.Optional[Path] = None  # Situation de clôture de l'exercice
+    ouverture: t.Optional[Path] = None  # Ouverture de l'exercice suivant
 
 
 def main():
@@ -65,50 +82,70 @@ def main():
     accounts = load_accounts([args.compte])
     logger.info(f"Chargement des comptes : {len(accounts)}")
 
-    records = ouverture_comptes(accounts, args.annee)
-    records += affecter_resultat(accounts, args.annee)
-    records += ecrire_notes_de_frais(args.notes_de_frais)
-    records += ecrire_banque(args.banques)
+    # Bornes de l'exercice: ouverture au début, clôture à la fin
+    du, au = bornes(args.annee, args.du, args.au)
+    debut, fin = du.strftime("%d/%m/%Y"), au.strftime("%d/%m/%Y")
+    logger.info(f"Exercice : {debut} - {fin}")
+
+    records = ouverture_comptes(accounts, args.annee, debut)
+    records += affecter_resultat(accounts, debut)
 
-    records += ecrire_immobilisations(args.immobilisations, args.annee)
+    operations = ecrire_notes_de_frais(args.notes_de_frais)
+    operations += ecrire_banque(args.banques)
+    exercice = filtrer_periode(operations, du, au)
+    if len(exercice) < len(operations):
+        logger.warning(
+            f"Opérations hors exercice ignorées : "
+            f"{len(operations) - len(exercice)}"
+        )
+    records += exercice
+
+    # Plans d'amortissement et d'étalement en une passe sur le registre,
+    # ramenés aux jours de l'exercice (clôture intermédiaire)
+    immos = load_immobilisations(args.immobilisations)
+    tableau = tableau_amortissements_cache(immos, args.cache)
+    records += ecrire_immobilisations(immos, tableau, du, au)
+
+    subventions = load_subventions(args.subventions)
+    plans = tableau_subventions(subventions, immos, tableau)
+    par_compte = {immo["compte"]: immo for immo in immos}
+    financees = [par_compte[s["immobilisation"]] for s in subventions]
+    quotes_parts = repartir_periode(financees, plans, du, au)
+    records += ecrire_quotes_parts(
+        subventions, quotes_parts.to_frame(args.annee), args.annee, fin
+    )
 
     updated_accounts = update_accounts(accounts, records)
-    records += ecrire_cloture_comptes(updated_accounts, args.annee)
+    if args.snapshot is not None:
+        logger.info(f"Situation de clôture: {args.snapshot}")
+        save_snapshot(
+            creer_snapshot(updated_accounts, args.annee), args.snapshot
+        )
+    # Clôture de l'exercice et réouverture au lendemain, en une passe
+    cloture = cloturer(updated_accounts, fin)
+    logger.info(f"Résultat de l'exercice : {cloture.resultat}")
+    records += cloture.ecritures
 
     # Export
-    with open(args.resultat, "w", newline="") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=records[0].keys())
-        writer.writeheader()
-        # Replace float by string with 2 decimals
-        writer.writerows(
-            {
-                k: two_decimals(v) if isinstance(v, float) else v
-                for k, v in record.items()
-            }
-            for record in records
-        )
+    ecrire_csv(args.resultat, records)
+    if args.ouverture is not None:
+        logger.info(f"Ecritures d'ouverture : {args.ouverture}")
+        ecrire_csv(args.ouverture, cloture.ouverture)
 
     # Vérification: le solde de tous les comptes (sauf 8) doit être nul
-    updated2 = update_accounts(updated_accounts, records)
+    updated2 = update_accounts(accounts, records)
     for account in updated2:
-        if (
-            int(account["compte"][0]) < 6
-            and account["compte"] not in {"120", "129"}
-            and account["solde"] != 0.0
+        if int(account["compte"][0]) < 8 and not isclose(
+            account["solde"], 0.0, abs_tol=0.005
         ):
             logger.warning(
                 f"Compte {account['compte']} non soldé : {account['solde']}"
             )
 
-    # Vérification: le solde du compte 8 doit être égal au résultat
-    compte8 = next((a for a in updated2 if a["compte"] == "8"), None)
-    resultat = [a for a in updated2 if a["compte"].startswith("12")][-1]
-    if compte8 is None:
-        logger.warning("Compte 8 non trouvé")
-    elif compte8["solde"] != resultat["solde"]:
-        logger.warning(
-            f"Solde du compte 8 ({compte8['solde']}) différent du résultat ({resultat['solde']})"
-        )
+    # Vérification: les comptes 8 (ouverture et clôture) se compensent
+    compte8 = sum(a["solde"] for a in updated2 if a["compte"][0] == "8")
+    if not isclose(compte8, 0.0, abs_tol=0.005):
+        logger.warning(f"Solde des comptes 8 non nul : {compte8}")
 
     # Vérification: les débits et crédits sont tous positifs:
     for record in records:
@@ -126,54 +163,84 @@ def main():
         )
 
 
-def ecrire_immobilisations(immo_files, year: int):
+def ecrire_immobilisations(
+    immos: list[Immobilisation],
+    tableau: pd.DataFrame,
+    du: pd.Timestamp,
+    au: pd.Timestamp,
+):
     """
-    Ecrire les opérations d'immobilisations
+    Ecrire les opérations d'immobilisations à partir de la matrice des plans
+    d'amortissement. Les dotations sont ramenées aux jours de l'exercice et
+    datées de sa fin. A la sortie, les amortissements cumulés jusqu'à
+    l'année de sortie comprise sont repris, et la valeur nette comptable
+    (cession) passe en 675.
     """
     records: list[Record] = []
-
-    immos = load_immobilisations(immo_files)
-
-    for immo in immos:
-        if "amortissement" not in immo:
-            immo["amortissement"] = build_amortissement(immo)
-
+    date = au.strftime("%d/%m/%Y")
+
+    dotations = repartir_periode(immos, tableau, du, au).to_numpy()
+    sorties = dates_sortie(immos, tableau)
+    sorties = ((sorties >= du) & (sorties <= au)).to_numpy()
+    annees = annees_sortie(immos, tableau).to_numpy()
+    cumuls = (
+        tableau.round(2).to_numpy()
+        * (tableau.columns.to_numpy()[None, :] <= annees[:, None])
+    ).sum(axis=1)
+
+    for immo, dotation, sortie, cumul in zip(
+        immos, dotations, sorties, cumuls
+    ):
         # Dotation aux amortissements (on insert un 8 en 2ème position)
         compte_amortissement = f"28{immo['compte'][2:]}"
-        records.append(
-            {
-                "compte": compte_amortissement,
-                "date": f"31/12/{year}",
-                "libellé": f"Dot. amort.: {immo['intitulé']}",
-                "débit": 0.0,
-                "crédit": immo["amortissement"][year],
-            }
-        )
-        records.append(
-            {
-                "compte": "681",
-                "date": f"31/12/{year}",
-                "libellé": f"Dot. amort.: {immo['intitulé']}",
-                "débit": immo["amortissement"][year],
-                "crédit": 0.0,
-            }
-        )
+        dotation = two_decimals(float(dotation))
+        if dotation > 0:
+            records.append(
+                {
+                    "compte": compte_amortissement,
+                    "date": date,
+                    "libellé": f"Dot. amort.: {immo['intitulé']}",
+                    "débit": 0.0,
+                    "crédit": dotation,
+                }
+            )
+            records.append(
+                {
+                    "compte": "681",
+                    "date": date,
+                    "libellé": f"Dot. amort.: {immo['intitulé']}",
+                    "débit": dotation,
+                    "crédit": 0.0,
+                }
+            )
 
-        # Si l'immobilisation est entièrement amortie, on la sort du bilan
-        year_debut = time.strptime(immo["date"], "%d/%m/%Y").tm_year
-        if year == year_debut + int(immo["durée"]):
+        # Si l'immobilisation est entièrement amortie ou cédée pendant
+        # l'exercice, on la sort du bilan à la fin de l'exercice
+        if sortie:
+            cumul = two_decimals(float(cumul))
+            vnc = two_decimals(immo["montant"] - cumul)
             records.append(
                 {
-                    "date": immo["date"],
+                    "date": date,
                     "compte": compte_amortissement,
                     "libellé": immo["intitulé"],
-                    "débit": immo["montant"],
+                    "débit": cumul,
                     "crédit": 0.0,
                 }
             )
+            if vnc > 0:
+                records.append(
+                    {
+                        "date": date,
+                        "compte": "675",
+                        "libellé": immo["intitulé"],
+                        "débit": vnc,
+                        "crédit": 0.0,
+                    }
+                )
             records.append(
                 {
-                    "date": immo["date"],
+                    "date": date,
                     "compte": immo["compte"],
                     "libellé": immo["intitulé"],
                     "débit": 0.0,
@@ -184,98 +251,29 @@ def ecrire_immobilisations(immo_files, year: int):
     return records
 
 
-def ecrire_cloture_comptes(accounts: list[Account], year: int):
+def ecrire_csv(path: Path, records: list[Record]) -> None:
     """
-    Ecrire les opérations de clôture des comptes
+    Ecrire les opérations dans un fichier CSV, dans l'ordre chronologique
+    (tri stable: les lignes d'une même écriture restent groupées, et l'ordre
+    des écritures d'un même jour est gardé) comme l'exige le FEC
     """
-    records: list[Record] = []
-    resultat = 0.0
-
-    accounts = sorted(accounts, key=lambda a: a["compte"])
-
-    for account in accounts:
-        # Skip if solde = 0
-        if account["solde"] == 0.0:
-            continue
-
-        if account["compte"].startswith("6"):
-            resultat -= abs(account["solde"])
-            records.append(
-                {
-                    "date": f"31/12/{year}",
-                    "compte": account["compte"],
-                    "libellé": f"Fermeture: {account['intitulé']}",
-                    "débit": 0.0,
-                    "crédit": abs(account["solde"]),
-                }
-            )
-
-        elif account["compte"].startswith("7"):
-            resultat += abs(account["solde"])
-            records.append(
-                {
-                    "date": f"31/12/{year}",
-                    "compte": account["compte"],
-                    "libellé": f"Fermeture: {account['intitulé']}",
-                    "débit": account["solde"],
-                    "crédit": 0.0,
-                }
-            )
-
-        elif account["compte"].startswith("8"):
-            continue
-
-        else:
-            if account["solde"] > 0:
-                debit = account["solde"]
-                credit = 0.0
-            else:
-                debit = 0.0
-                credit = abs(account["solde"])
-
-            records.append(
-                {
-                    "date": f"31/12/{year}",
-                    "compte": "891",
-                    "libellé": f"Fermeture: {account['intitulé']}",
-                    "débit": debit,
-                    "crédit": credit,
-                }
-            )
-            records.append(
-                {
-                    "date": f"31/12/{year}",
-                    "compte": account["compte"],
-                    "libellé": f"Fermeture: {account['intitulé']}",
-                    "débit": credit,
-                    "crédit": debit,
-                }
-            )
-
-    # Ajout du résultat
-    if resultat >= 0:
-        records.append(
-            {
-                "date": f"31/12/{year}",
-                "compte": "120",
-                "libellé": "Résultat de l'exercice",
-                "débit": resultat,
-                "crédit": 0.0,
-            }
+    ordre = dates_records(records).argsort(kind="stable")
+    records = [records[i] for i in ordre]
+    with open(path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(
+            csvfile,
+            fieldnames=["date", "compte", "libellé", "débit", "crédit"],
         )
-    else:
-        records.append(
+        writer.writeheader()
+        # Replace float by string with 2 decimals
+        writer.writerows(
             {
-                "date": f"31/12/{year}",
-                "compte": "129",
-                "libellé": "Résultat de l'exercice",
-                "débit": abs(resultat),
-                "crédit": 0.0,
+                k: two_decimals(v) if isinstance(v, float) else v
+                for k, v in record.items()
             }
+            for record in records
         )
 
-    return records
-
 
 def ecrire_notes_de_frais(notes_de_frais: list[Path]) -> list[Record]:
     """
@@ -389,9 +387,10 @@ def ecrire_banque(banques: list[Path]) -> list[Record]:
     return records
 
 
-def affecter_resultat(accounts, year: int) -> list[Record]:
+def affecter_resultat(accounts, date: str) -> list[Record]:
     """
     Affecter le résultat de l'exercice précédent à l'ouverture de l'exercice
+    (date JJ/MM/AAAA)
     """
 
     for account in accounts:
@@ -399,14 +398,14 @@ def affecter_resultat(accounts, year: int) -> list[Record]:
         if account["compte"] == "120":
             return [
                 {
-                    "date": f"01/01/{year}",
+                    "date": date,
                     "compte": "120",
                     "libellé": "Affection du résultat (bénéfice)",
                     "débit": 0.0,
                     "crédit": account["solde"],
                 },
                 {
-                    "date": f"01/01/{year}",
+                    "date": date,
                     "compte": "110",
                     "libellé": "Affection du résultat (bénéfice)",
                     "débit": account["solde"],
@@ -418,14 +417,14 @@ def affecter_resultat(accounts, year: int) -> list[Record]:
         elif account["compte"] == "129":
             return [
                 {
-                    "date": f"01/01/{year}",
+                    "date": date,
                     "compte": "129",
                     "libellé": "Affection du résultat (perte)",
                     "débit": account["solde"],
                     "crédit": 0.0,
                 },
                 {
-                    "date": f"01/01/{year}",
+                    "date": date,
                     "compte": "119",
                     "libellé": "Affection du résultat (perte)",
                     "débit": 0.0,
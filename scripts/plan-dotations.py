@@ -0,0 +1,102 @@
+"""
+Ce script permet de créer un fichier csv contenant le plan de dotations aux
+amortissements prévisionnel (681 / 28x) pour les années à venir.
+Exemple de fichier de sortie:
+
+Plan de dotations prévisionnel
+2023 - 2025
+
+Dotations aux amortissements	2023	2024	2025
+285001	Logiciel	3800.0	3800.0	622.95
+285501	Scanner laser	0.0	0.0	0.0
+288301	PC	463.75	301.44	279.91
+288302	Serveur	0.0	1127.05	1500.0
+681	Total	4263.75	5228.49	2402.86
+
+Valeurs nettes comptables	2023	2024	2025
+205001	Logiciel	4422.95	622.95	0.0
+215501	Scanner laser	0.0	0.0	0.0
+218301	PC	861.25	559.81	279.91
+218302	Serveur	0.0	4872.95	3372.95
+	Total	5284.2	6055.71	3652.86
+"""
+import typing as t
+import logging
+from pathlib import Path
+import tap
+import pandas as pd
+from macompta import load_immobilisations
+from macompta.amortissement import prevision_dotations, compte_amortissement
+from macompta.utils import two_decimals
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Arguments(tap.Tap):
+    immobilisations: list[Path]
+    acquisitions: list[Path] = []  # Acquisitions prévues
+    annee: int  # Première année du plan
+    horizon: int = 5  # Nombre d'années
+    output: Path
+    cache: t.Optional[Path] = None  # Cache des plans d'amortissement
+
+
+def main(args: Arguments) -> None:
+    """
+    Crée le fichier du plan de dotations prévisionnel
+    """
+    immobilisations = load_immobilisations(args.immobilisations)
+    logger.info(f"Immobilisations chargées: {len(immobilisations)}")
+    acquisitions = load_immobilisations(args.acquisitions)
+    logger.info(f"Acquisitions prévues: {len(acquisitions)}")
+
+    prevision = prevision_dotations(
+        immobilisations + acquisitions, args.annee, args.horizon, args.cache
+    )
+    intitules = {i["compte"]: i["intitulé"] for i in immobilisations}
+    intitules.update({i["compte"]: i["intitulé"] for i in acquisitions})
+
+    # Dotations par compte d'amortissement, valeurs nettes par compte
+    dotations = prevision["dotation"].groupby(level="compte_amortissement")
+    dotations = dotations.sum()
+    vnc = prevision["vnc"].groupby(level="compte").sum()
+
+    logger.info(f"Création du fichier {args.output}")
+    with open(args.output, "w") as f:
+        f.write("Plan de dotations prévisionnel\n")
+        f.write(f"{args.annee} - {args.annee + args.horizon - 1}\n")
+        f.write("\n")
+        ecrire_tableau(
+            f,
+            "Dotations aux amortissements",
+            dotations,
+            {compte_amortissement(c): i for c, i in intitules.items()},
+            "681",
+        )
+        f.write("\n")
+        ecrire_tableau(f, "Valeurs nettes comptables", vnc, intitules, "")
+
+
+def ecrire_tableau(
+    f: t.TextIO,
+    titre: str,
+    tableau: pd.DataFrame,
+    intitules: dict[str, str],
+    compte_total: str,
+) -> None:
+    """
+    Ecrit un tableau compte x année et sa ligne de total
+    """
+    annees = "\t".join(str(annee) for annee in tableau.columns)
+    f.write(f"{titre}\t{annees}\n")
+    for compte, valeurs in tableau.iterrows():
+        montants = "\t".join(str(two_decimals(v)) for v in valeurs)
+        f.write(f"{compte}\t{intitules.get(compte, '')}\t{montants}\n")
+    totaux = "\t".join(str(two_decimals(v)) for v in tableau.sum())
+    f.write(f"{compte_total}\tTotal\t{totaux}\n")
+
+
+if __name__ == "__main__":
+    main(Arguments().parse_args())
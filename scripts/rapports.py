@@ -0,0 +1,128 @@
+"""
+Ce script produit les rapports de fin d'exercice (grand livre, balance,
+bilan, compte de résultat, trésorerie, immobilisations et amortissements)
+en parallèle, chacun dans son processus.
+
+Le livre journal est lu une fois et placé dans une mémoire partagée (voir
+partage.py): les processus des rapports s'y attachent au lieu de relire et
+d'analyser le CSV. La durée totale tend vers celle du rapport le plus
+long. Le cache des plans d'amortissement n'est pas utilisé: les rapports
+des immobilisations et des amortissements l'écriraient en même temps.
+
+    rapports.py --annee 2022 --journals data/livre-journal.csv \\
+        --compte data/compte.csv --immobilisations data/immobilisations.csv
+"""
+import typing as t
+import concurrent.futures
+import logging
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+import tap
+from macompta import load_journals
+from macompta.construction import commande
+from macompta.partage import attacher, executer_script, partager
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCRIPTS = Path(__file__).parent
+
+RAPPORTS = [
+    "grand-livre",
+    "balance-comptes",
+    "bilan",
+    "compte-resultats",
+    "tresorerie",
+    "immobilisations",
+    "amortissements",
+]
+
+
+class Arguments(tap.Tap):
+    annee: int
+    journals: list[Path]
+    compte: Path
+    immobilisations: list[Path] = []
+    output: Path = Path("data")  # Dossier des rapports
+    rapports: list[str] = RAPPORTS
+    processus: t.Optional[int] = None  # Nombre de processus
+
+
+def lignes(args: Arguments) -> dict[str, list[str]]:
+    """
+    Ligne de commande (script et options) de chaque rapport
+    """
+    annee = args.annee
+
+    def sortie(nom: str) -> Path:
+        return args.output / f"{nom}-{annee}.csv"
+
+    journal = {
+        "--journals": args.journals,
+        "--compte": args.compte,
+        "--annee": annee,
+    }
+    immobilisations = {
+        "--immobilisations": args.immobilisations,
+        "--compte": args.compte,
+        "--annee": annee,
+    }
+    options: dict[str, dict[str, t.Any]] = {
+        "grand-livre": journal,
+        "balance-comptes": journal,
+        "bilan": journal,
+        "compte-resultats": journal,
+        "tresorerie": {
+            "--journals": args.journals,
+            "--du": f"01/01/{annee}",
+            "--au": f"31/12/{annee}",
+        },
+        "immobilisations": immobilisations,
+        "amortissements": immobilisations,
+    }
+    return {
+        nom: commande(
+            SCRIPTS / f"{nom}.py",
+            dict(options[nom], **{"--output": sortie(nom)}),
+        )[1:]
+        for nom in args.rapports
+    }
+
+
+def main():
+    args = Arguments().parse_args()
+    inconnus = set(args.rapports) - set(RAPPORTS)
+    if inconnus:
+        raise ValueError(f"Rapports inconnus : {sorted(inconnus)}")
+
+    debut = time.perf_counter()
+    records = load_journals(args.journals)
+    logger.info(f"Chargement des opérations : {len(records)}")
+
+    codes: dict[str, int] = {}
+    with partager(records, args.journals) as journal:
+        with concurrent.futures.ProcessPoolExecutor(
+            args.processus or len(args.rapports),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=attacher,
+            initargs=(journal.descripteur,),
+        ) as executeur:
+            futurs = {
+                executeur.submit(executer_script, ligne): nom
+                for nom, ligne in lignes(args).items()
+            }
+            for futur in concurrent.futures.as_completed(futurs):
+                nom = futurs[futur]
+                codes[nom] = futur.result()
+                duree = time.perf_counter() - debut
+                logger.info(f"{nom} : code {codes[nom]} ({duree:.1f} s)")
+
+    if any(codes.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
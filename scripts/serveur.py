@@ -0,0 +1,64 @@
+"""
+Ce script charge les journaux et les comptes une fois, puis sert les
+requêtes de balance, de grand livre, de solde et de bilan provisoire sur un
+port local (ou une socket Unix), sans relancer de processus:
+
+    serveur.py --journals data/livre-journal.csv --comptes data/compte.csv
+    curl 'http://127.0.0.1:8765/balance?prefixe=4&au=31/12/2022'
+    curl --data-binary @ajouts.csv http://127.0.0.1:8765/ecritures
+
+Les écritures envoyées sur /ecritures sont ajoutées en mémoire, et au
+journal donné par --ajouts.
+"""
+import typing as t
+import asyncio
+import logging
+from pathlib import Path
+import tap
+from macompta import load_accounts, load_journals
+from macompta.serveur import Registre, Serveur
+from macompta.stockage import Stockage
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Arguments(tap.Tap):
+    journals: list[Path] = []
+    comptes: list[Path] = []
+    base: t.Optional[Path] = None  # Base SQLite à la place des fichiers
+    ajouts: t.Optional[Path] = None  # Journal où écrire les ajouts
+    hote: str = "127.0.0.1"
+    port: int = 8765
+    socket: t.Optional[Path] = None  # Socket Unix à la place du port
+
+
+async def servir(args: Arguments) -> None:
+    if args.base is not None:
+        with Stockage(args.base) as base:
+            records, accounts = base.ecritures(), base.accounts()
+    else:
+        records = load_journals(args.journals)
+        accounts = load_accounts(args.comptes)
+    registre = Registre(records, accounts)
+    logger.info(f"Chargement des opérations : {len(records)}")
+
+    serveur = Serveur(registre, args.ajouts)
+    ecoute = await serveur.servir(args.hote, args.port, args.socket)
+    adresse = args.socket or f"http://{args.hote}:{args.port}"
+    logger.info(f"En écoute sur {adresse}")
+    async with ecoute:
+        await ecoute.serve_forever()
+
+
+def main():
+    args = Arguments().parse_args()
+    try:
+        asyncio.run(servir(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 """
-WARNING: this file is not finished!
 Ce script permet de créer un fichier csv contenant les subventions
 Exemple de fichier de sortie:
 
@@ -24,17 +23,20 @@ Etalement de la subvention,,,,,,
 
 [...]
 """
+import typing as t
 import logging
 from pathlib import Path
 import tap
+import pandas as pd
 from macompta import (
-    Immobilisation,
-    Record,
+    Subvention,
     load_accounts,
-    load_csv,
-    filter_records_by_account,
+    load_immobilisations,
+    load_subventions,
 )
-from macompta.utils import convert_date
+from macompta.amortissement import tableau_amortissements_cache
+from macompta.subvention import tableau_subventions
+from macompta.utils import two_decimals
 
 # Log to stdout
 logging.basicConfig(level=logging.INFO)
@@ -43,9 +45,11 @@ logger = logging.getLogger(__name__)
 
 class Arguments(tap.Tap):
     compte: Path
-    livre_journal: Path
+    immobilisations: list[Path]
+    subventions: list[Path]
     annee: int
     output: Path
+    cache: t.Optional[Path] = None  # Cache des plans d'amortissement
 
 
 def main(args: Arguments) -> None:
@@ -60,35 +64,28 @@ def main(args: Arguments) -> None:
     accounts = load_accounts([args.compte])
     logger.info(f"Comptes chargés: {len(accounts)}")
 
-    # Load the records
-    records: list[Record] = []
-    for row in load_csv(args.livre_journal):
-        records.append(
-            {
-                "date": convert_date(row["date"]),
-                "compte": str(row["compte"]),
-                "libellé": str(row["libellé"]),
-                "débit": float(row["débit"]),
-                "crédit": float(row["crédit"]),
-            }
-        )
+    # Load the immobilisations and the subventions
+    immobilisations = load_immobilisations(args.immobilisations)
+    logger.info(f"Immobilisations chargées: {len(immobilisations)}")
+    subventions = load_subventions(args.subventions)
+    logger.info(f"Subventions chargées: {len(subventions)}")
+
+    # Etalement calculé sur les plans d'amortissement
+    tableau = tableau_amortissements_cache(immobilisations, args.cache)
+    plans = tableau_subventions(subventions, immobilisations, tableau)
 
     # Create the output file
     logger.info(f"Création du fichier {args.output}")
 
-    # Détection des subventions
-    logger.info("Détection des subventions")
-    subventions = []
-    for record in records:
-        if record["compte"].startswith("13"):
-            subventions.append(record["compte"])
-
     # Ecriture du tableau des subventions
-    ecrire_amortissements(args.output, subventions, records, args.annee)
+    ecrire_subventions(args.output, subventions, plans, args.annee)
 
 
-def ecrire_amortissements(
-    output: Path, subventions: list[str], records: list[Record], annee: int
+def ecrire_subventions(
+    output: Path,
+    subventions: list[Subvention],
+    plans: pd.DataFrame,
+    annee: int,
 ) -> None:
     """
     Ecrit le tableau des subventions dans le fichier de sortie
@@ -98,36 +95,29 @@ def ecrire_amortissements(
         f.write(f"1.1.{annee} - 31.12.{annee}\n")
         f.write("\n")
         f.write(
-            "Postes de bilan\tValeur brute au début de l'exercice\tAugmentations\tDiminutions\tValeur brute à la fin de l'exercice\n"
+            "Postes de bilan\tMontant\tReprises au début de l'exercice\tQuote-part de l'exercice\tReprises à la fin de l'exercice\tSolde\n"
         )
 
+    # Reprises cumulées au début de l'exercice et quote-part de l'exercice
+    debuts = plans.loc[:, plans.columns < annee].sum(axis=1)
+    if annee in plans.columns:
+        quotes_parts = plans[annee]
+    else:
+        quotes_parts = debuts * 0.0
+
     with open(output, "a") as f:
-        # Write the immobilisations
+        # Write the subventions
         for sub in subventions:
-            debut = immo["montant"]
-            compte_amortissement = f"28{immo['compte'][2:]}"
-            aug = sum(
-                [
-                    op["débit"]
-                    for op in filter_records_by_account(
-                        records, compte_amortissement
-                    )
-                ]
+            compte = sub["compte"]
+            intitule = sub["intitulé"]
+            debut = debuts[compte]
+            quote_part = quotes_parts[compte]
+            fin = debut + quote_part
+            solde = sub["montant"] - fin
+
+            f.write(
+                f"{compte}\t{intitule}\t{two_decimals(sub['montant'])}\t{two_decimals(debut)}\t{two_decimals(quote_part)}\t{two_decimals(fin)}\t{two_decimals(solde)}\n"
             )
-            dim = sum(
-                [
-                    op["crédit"]
-                    for op in filter_records_by_account(
-                        records, compte_amortissement
-                    )
-                ]
-            )
-            fin = debut + aug - dim
-
-            compte = immo["compte"]
-            intitule = immo["intitulé"]
-
-            f.write(f"{compte}\t{intitule}\t{debut}\t{aug}\t{dim}\t{fin}\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+"""
+Ce script surveille les fichiers d'entrée (banques, notes de frais,
+comptes, immobilisations...) et regénère ce qui en dépend à chaque
+modification, selon le graphe entrées -> livre journal -> rapports:
+
+    - une modification de data/banque.csv refait le livre journal, puis le
+      grand livre, la balance et le bilan;
+    - une modification de data/immobilisations.csv refait aussi les
+      tableaux des immobilisations et des amortissements.
+
+Le grand livre et la balance sont tenus en mémoire: seules les sections des
+comptes dont les écritures ont changé sont rendues à nouveau.
+"""
+import typing as t
+import logging
+import subprocess
+from pathlib import Path
+import tap
+from macompta import Record, load_accounts, load_journals, update_accounts
+from macompta.construction import commande
+from macompta.periodes import bornes
+from macompta.rapports import Balance, GrandLivre
+from macompta.surveillance import Etape, comptes_modifies, surveiller
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCRIPTS = Path(__file__).parent
+
+
+class Arguments(tap.Tap):
+    notes_de_frais: list[Path]
+    banques: list[Path]
+    compte: Path
+    immobilisations: list[Path]
+    subventions: list[Path] = []
+    resultat: Path  # Livre journal
+    annee: int
+    cache: t.Optional[Path] = None  # Cache des plans d'amortissement
+    grand_livre: t.Optional[Path] = None
+    balance: t.Optional[Path] = None
+    bilan: t.Optional[Path] = None
+    compte_resultats: t.Optional[Path] = None
+    tableau_immobilisations: t.Optional[Path] = None
+    amortissements: t.Optional[Path] = None
+    intervalle: float = 1.0  # Secondes entre deux scrutations
+
+
+def action(
+    script: str, options: dict[str, t.Any]
+) -> t.Callable[[set[Path]], None]:
+    """
+    Action qui lance un script avec ses options
+    """
+    ligne = commande(SCRIPTS / script, options)
+
+    def lancer(modifies: set[Path]) -> None:
+        logger.info(f"{script} : {', '.join(str(m) for m in modifies)}")
+        subprocess.run(ligne, check=False)
+
+    return lancer
+
+
+class Rapport:
+    """
+    Rapport rendu compte par compte, tenu en mémoire entre deux
+    modifications du livre journal
+    """
+
+    def __init__(
+        self,
+        sections: t.Union[GrandLivre, Balance],
+        args: Arguments,
+        output: Path,
+        filtre: t.Callable[[Record], bool] = lambda r: True,
+    ):
+        self.sections: t.Union[GrandLivre, Balance] = sections
+        self.args = args
+        self.output = output
+        self.filtre = filtre
+        self.records: t.Optional[list[Record]] = None
+
+    def __call__(self, modifies: set[Path]) -> None:
+        records = [
+            r for r in load_journals([self.args.resultat]) if self.filtre(r)
+        ]
+        if self.records is None or self.args.compte in modifies:
+            self.sections.invalider()
+        else:
+            comptes = comptes_modifies(self.records, records)
+            logger.info(f"{self.output} : {len(comptes)} comptes modifiés")
+            self.sections.invalider(comptes)
+        self.records = records
+
+        accounts = update_accounts(load_accounts([self.args.compte]), records)
+        accounts = sorted(accounts, key=lambda x: x["compte"])
+        with open(self.output, "w") as f:
+            f.write(self.sections.rendre(accounts, records))
+
+
+def etapes(args: Arguments) -> list[Etape]:
+    a = args
+    journal = [a.resultat]
+    comptes = [a.compte]
+    immobilisations = a.immobilisations + comptes
+    if a.cache is not None:
+        immobilisations.append(a.cache)
+
+    resultat = [
+        Etape(
+            "journal",
+            a.notes_de_frais + a.banques + a.subventions + immobilisations,
+            journal,
+            action(
+                "livre-journal.py",
+                {
+                    "--notes_de_frais": a.notes_de_frais,
+                    "--banques": a.banques,
+                    "--compte": a.compte,
+                    "--immobilisations": a.immobilisations,
+                    "--subventions": a.subventions,
+                    "--resultat": a.resultat,
+                    "--cache": a.cache,
+                    "--annee": a.annee,
+                },
+            ),
+        )
+    ]
+    if a.grand_livre is not None:
+        du, au = bornes(a.annee)
+        grand_livre = Rapport(GrandLivre(du, au), a, a.grand_livre)
+        resultat.append(
+            Etape(
+                "grand-livre", journal + comptes, [a.grand_livre], grand_livre
+            )
+        )
+    if a.balance is not None:
+        # Sans les comptes de classe 8 (voir balance-comptes.py)
+        balance = Rapport(
+            Balance(a.annee), a, a.balance, lambda r: r["compte"][:1] != "8"
+        )
+        resultat.append(
+            Etape("balance", journal + comptes, [a.balance], balance)
+        )
+    if a.bilan is not None:
+        resultat.append(
+            Etape(
+                "bilan",
+                journal + comptes,
+                [a.bilan],
+                action(
+                    "bilan.py",
+                    {
+                        "--journals": a.resultat,
+                        "--comptes": a.compte,
+                        "--annee": a.annee,
+                        "--output": a.bilan,
+                    },
+                ),
+            )
+        )
+    if a.compte_resultats is not None:
+        resultat.append(
+            Etape(
+                "compte-resultats",
+                journal + comptes,
+                [a.compte_resultats],
+                action(
+                    "compte-resultats.py",
+                    {
+                        "--journals": a.resultat,
+                        "--comptes": a.compte,
+                        "--annee": a.annee,
+                        "--output": a.compte_resultats,
+                    },
+                ),
+            )
+        )
+    for nom, output in [
+        ("immobilisations", a.tableau_immobilisations),
+        ("amortissements", a.amortissements),
+    ]:
+        if output is not None:
+            resultat.append(
+                Etape(
+                    nom,
+                    immobilisations,
+                    [output],
+                    action(
+                        f"{nom}.py",
+                        {
+                            "--immobilisations": a.immobilisations,
+                            "--compte": a.compte,
+                            "--cache": a.cache,
+                            "--annee": a.annee,
+                            "--output": output,
+                        },
+                    ),
+                )
+            )
+    return resultat
+
+
+def main():
+    args = Arguments().parse_args()
+    logger.info("Surveillance des entrées (Ctrl-C pour arrêter)")
+    try:
+        surveiller(etapes(args), args.intervalle)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
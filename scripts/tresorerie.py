@@ -0,0 +1,70 @@
+"""
+Ce script génère la courbe de trésorerie: le solde des comptes financiers
+(classe 5 par défaut) à la fin de chaque jour, semaine ou mois.
+Exemple de fichier de sortie:
+
+Trésorerie
+1.1.2022 - 31.12.2022
+
+Date	5	512
+31/01/2022	5000.0	5000.0
+28/02/2022	6200.0	6200.0
+"""
+import logging
+from pathlib import Path
+import tap
+import pandas as pd
+from macompta import load_journals_frame
+from macompta.bilan import ecritures_avant_cloture
+from macompta.cumuls import Cumuls
+from macompta.twr import Frequency, to_period_alias
+from macompta.utils import two_decimals
+
+# Log to stdout
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Arguments(tap.Tap):
+    journals: list[Path]
+    comptes: list[str] = ["5"]  # Comptes ou préfixes de comptes
+    du: str  # JJ/MM/AAAA
+    au: str  # JJ/MM/AAAA
+    frequence: Frequency = "monthly"
+    output: Path
+
+
+def main(args: Arguments) -> None:
+    """
+    Crée le fichier de la courbe de trésorerie
+    """
+    records = load_journals_frame(args.journals)
+    logger.info(f"Chargement des opérations : {len(records)}")
+    # Sans les écritures de clôture, qui soldent les comptes au dernier jour
+    cumuls = Cumuls(ecritures_avant_cloture(records))
+
+    # Fin de chaque période, bornée par la date de fin
+    du = pd.to_datetime(args.du, format="%d/%m/%Y")
+    au = pd.to_datetime(args.au, format="%d/%m/%Y")
+    periodes = pd.period_range(du, au, freq=to_period_alias(args.frequence))
+    dates = periodes.to_timestamp(how="end").normalize()
+    dates = dates.where(dates <= au, au)
+
+    # Une recherche dichotomique par compte et par date
+    soldes = {c: cumuls.soldes(c, list(dates)) for c in args.comptes}
+
+    logger.info(f"Création du fichier {args.output}")
+    with open(args.output, "w") as f:
+        f.write("Trésorerie\n")
+        f.write(f"{args.du} - {args.au}\n")
+        f.write("\n")
+        f.write("Date\t" + "\t".join(args.comptes) + "\n")
+        for i, date in enumerate(dates):
+            montants = "\t".join(
+                str(two_decimals(soldes[c][i])) for c in args.comptes
+            )
+            f.write(f"{date.strftime('%d/%m/%Y')}\t{montants}\n")
+
+
+if __name__ == "__main__":
+    main(Arguments().parse_args())